@@ -0,0 +1,140 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from .Metrics import ADMISSION_REJECTIONS, IN_FLIGHT, QUEUE_DEPTH, STAGE_TIMEOUTS
+
+# Limity na proces roboczy: liczba pytań obsługiwanych naraz i liczba pytań czekających w kolejce
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '16'))
+MAX_QUEUED_REQUESTS = int(os.environ.get('MAX_QUEUED_REQUESTS', '64'))
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get('QUEUE_TIMEOUT_SECONDS', '10'))
+# Terminy etapów potoku /ask (0 wyłącza termin)
+DOMAIN_TIMEOUT_SECONDS = float(os.environ.get('DOMAIN_TIMEOUT_SECONDS', '15'))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.environ.get('RETRIEVAL_TIMEOUT_SECONDS', '20'))
+GENERATION_TIMEOUT_SECONDS = float(os.environ.get('GENERATION_TIMEOUT_SECONDS', '60'))
+
+
+class Overloaded(Exception):
+    """The request was not admitted: 429 when the queue is full, 503 when it waited too long for a slot."""
+
+    def __init__(self, reason, status_code):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.status_code = status_code
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage_name, seconds):
+        super().__init__(f"Stage '{stage_name}' did not finish within {seconds:g} s")
+        self.stage = stage_name
+        self.seconds = seconds
+
+
+async def with_deadline(stage_name, awaitable, seconds):
+    """Await with a deadline; when it passes, the awaitable is cancelled and StageTimeout is raised.
+
+    Work already handed to a thread (asyncio.to_thread) finishes in the background, but its result is dropped.
+    """
+    if not seconds:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        STAGE_TIMEOUTS.labels(stage_name).inc()
+        raise StageTimeout(stage_name, seconds) from None
+
+
+async def iterate_with_deadline(stage_name, iterator, seconds):
+    """Yield from an async iterator until the deadline for the whole iteration passes."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds if seconds else None
+    while True:
+        timeout = None if deadline is None else deadline - loop.time()
+        try:
+            if timeout is not None and timeout <= 0:
+                raise asyncio.TimeoutError
+            item = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.labels(stage_name).inc()
+            raise StageTimeout(stage_name, seconds) from None
+        yield item
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded waiting queue for the expensive endpoints.
+
+    Requests over max_concurrency wait for a slot up to queue_timeout seconds; when max_queue requests are
+    already waiting, new ones are rejected immediately so that latency stays bounded under overload.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_REQUESTS, max_queue=MAX_QUEUED_REQUESTS,
+                 queue_timeout=QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # Semafor tworzony jest w działającej pętli zdarzeń: kontroler powstaje przy imporcie aplikacji,
+        # zanim proces roboczy (np. UvicornWorker) uruchomi swoją pętlę, a w Pythonie 3.9 semafor wiąże się
+        # z pętlą już przy utworzeniu
+        self._semaphore = None
+        self._loop = None
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0}
+
+    def _reject(self, reason, status_code):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTIONS.labels(reason).inc()
+        return Overloaded(reason, status_code)
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue when all are busy; raises Overloaded when rejected."""
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.queued >= self.max_queue:
+                raise self._reject('queue_full', 429)
+            self.queued += 1
+            QUEUE_DEPTH.inc()
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject('queue_timeout', 503) from None
+            finally:
+                self.queued -= 1
+                QUEUE_DEPTH.dec()
+        else:
+            await semaphore.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+        IN_FLIGHT.inc()
+
+    def release(self):
+        self.in_flight -= 1
+        IN_FLIGHT.dec()
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+        }
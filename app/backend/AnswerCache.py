@@ -0,0 +1,184 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from .LRUCache import LRUCache
+from .helpers.minhash import MinHasher, MinHashLSH, char_shingles, estimate_similarity
+
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '2048'))
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', str(24 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0.85'))
+# Zapis odpowiedzi w MongoDB, dzięki czemu wszystkie procesy robocze korzystają z tej samej pamięci podręcznej
+ANSWER_CACHE_PERSIST = os.environ.get('ANSWER_CACHE_PERSIST', '0') == '1'
+
+NON_WORD_PATTERN = re.compile(r'[^\w]+', re.UNICODE)
+NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def normalize_question(question):
+    """Lowercase, strip Polish diacritics and punctuation, collapse whitespace."""
+    text = question.lower().replace('ł', 'l')
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return ' '.join(NON_WORD_PATTERN.sub(' ', text).split())
+
+
+def years_key(years):
+    return f"{min(years)}-{max(years)}" if years else "all"
+
+
+class AnswerCache:
+    """Answer cache keyed on normalized question, law domain and year range.
+
+    Exact matches are looked up by key; near-duplicates through MinHash/LSH over character shingles.
+    Entries expire after ttl seconds, the least recently used ones are evicted, and a whole domain is
+    dropped when its documents are re-ingested. With a Mongo collection, entries are shared between workers.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY,
+                 collection=None):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.similarity = similarity
+        self.collection = collection
+        self.hasher = MinHasher()
+        self._lock = threading.Lock()
+        self._lsh = {}
+        self._corpus_versions = {}
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def ensure_indexes(self):
+        """Create the TTL and lookup indexes of the persisted cache."""
+        if self.collection is not None:
+            self.collection.create_index('created_at', expireAfterSeconds=self.ttl)
+            self.collection.create_index([('domain', 1), ('years', 1), ('bands', 1)])
+
+    def _key(self, normalized, law_domain, years):
+        return f"{law_domain}|{years_key(years)}|{normalized}"
+
+    def get(self, question, law_domain, years=None):
+        """Return the cached entry ({'answer', 'sources'}) for the question, or None."""
+        normalized = normalize_question(question)
+        key = self._key(normalized, law_domain, years)
+
+        entry = self.entries.get(key)
+        if entry is None and self.collection is not None:
+            entry = self._find_persisted({'_id': key})
+            if entry is not None:
+                self.entries.put(key, entry)
+        if entry is not None:
+            self.exact_hits += 1
+            return entry
+
+        entry = self._get_near_duplicate(normalized, law_domain, years)
+        if entry is not None:
+            self.near_hits += 1
+            return entry
+
+        self.misses += 1
+        return None
+
+    def _get_near_duplicate(self, normalized, law_domain, years):
+        signature = self.hasher.signature(char_shingles(normalized))
+        numbers = NUMBER_PATTERN.findall(normalized)
+        bucket = (law_domain, years_key(years))
+
+        best_entry, best_similarity = None, self.similarity
+        with self._lock:
+            lsh = self._lsh.get(bucket)
+            candidates = [(key, lsh.signatures[key]) for key in lsh.query(signature)] if lsh else []
+        for key, candidate_signature in candidates:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            # Pytania różniące się numerem artykułu czy kwotą nie są duplikatami
+            if entry['numbers'] != numbers:
+                continue
+            similarity = estimate_similarity(signature, candidate_signature)
+            if similarity >= best_similarity:
+                best_entry, best_similarity = entry, similarity
+
+        if best_entry is None and self.collection is not None:
+            lsh = MinHashLSH()
+            for document in self.collection.find({'domain': law_domain, 'years': years_key(years),
+                                                  'bands': {'$in': lsh.band_keys(signature)}}):
+                if self._is_stale(document):
+                    continue
+                similarity = estimate_similarity(signature, tuple(document['signature']))
+                if document['numbers'] == numbers and similarity >= best_similarity:
+                    best_entry, best_similarity = self._entry_from_document(document), similarity
+        return best_entry
+
+    def put(self, question, law_domain, answer, sources=None, years=None):
+        normalized = normalize_question(question)
+        key = self._key(normalized, law_domain, years)
+        signature = self.hasher.signature(char_shingles(normalized))
+        entry = {'answer': answer, 'sources': list(sources or []), 'numbers': NUMBER_PATTERN.findall(normalized)}
+
+        self.entries.put(key, entry)
+        bucket = (law_domain, years_key(years))
+        with self._lock:
+            lsh = self._lsh.setdefault(bucket, MinHashLSH())
+            lsh.insert(key, signature)
+            if len(lsh) > 2 * self.entries.maxsize:
+                for stale_key in [stale for stale in lsh.signatures if stale not in self.entries]:
+                    lsh.remove(stale_key)
+
+        if self.collection is not None:
+            self.collection.replace_one({'_id': key}, {
+                'domain': law_domain,
+                'years': years_key(years),
+                'answer': answer,
+                'sources': entry['sources'],
+                'numbers': entry['numbers'],
+                'signature': list(signature),
+                'bands': lsh.band_keys(signature),
+                'corpus_version': self._corpus_versions.get(law_domain, 0),
+                'created_at': time.time(),
+            }, upsert=True)
+
+    def _find_persisted(self, query):
+        document = self.collection.find_one(query)
+        if document is None or self._is_stale(document):
+            return None
+        return self._entry_from_document(document)
+
+    def _is_stale(self, document):
+        if time.time() - document['created_at'] > self.ttl:
+            return True
+        return document.get('corpus_version', 0) != self._corpus_versions.get(document['domain'], 0)
+
+    @staticmethod
+    def _entry_from_document(document):
+        return {'answer': document['answer'], 'sources': document['sources'], 'numbers': document['numbers']}
+
+    def invalidate_domain(self, law_domain):
+        """Drop every cached answer for the domain."""
+        prefix = f"{law_domain}|"
+        for key in self.entries.keys():
+            if key.startswith(prefix):
+                self.entries.pop(key)
+        with self._lock:
+            for bucket in [bucket for bucket in self._lsh if bucket[0] == law_domain]:
+                del self._lsh[bucket]
+
+    def sync_corpus_versions(self, versions):
+        """Invalidate domains whose corpus version changed since the last sync."""
+        changed = [domain for domain, version in versions.items()
+                   if domain in self._corpus_versions and self._corpus_versions[domain] != version]
+        self._corpus_versions.update(versions)
+        for domain in changed:
+            self.invalidate_domain(domain)
+        return changed
+
+    def stats(self):
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            'size': len(self.entries),
+            'exact_hits': self.exact_hits,
+            'near_duplicate_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+        }
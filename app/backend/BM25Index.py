@@ -0,0 +1,183 @@
+import bisect
+import gzip
+import json
+import math
+import os
+import re
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+WORD_PATTERN = re.compile(r'\S+')
+
+# Prosty stemming przez obcięcie słowa - polska fleksja zmienia głównie końcówki
+STEM_LENGTH = 6
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 50
+
+
+def tokenize(text, stem_length=STEM_LENGTH):
+    """Split text into lowercase, prefix-stemmed tokens."""
+    return [token[:stem_length] for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+def chunk_spans(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Return (start, end) character spans of overlapping chunks of roughly chunk_size words."""
+    spans = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if not spans:
+        return []
+
+    step = max(chunk_size - overlap, 1)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_size]
+        chunks.append((window[0][0], window[-1][1]))
+        if start + chunk_size >= len(spans):
+            break
+    return chunks
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping chunks of roughly chunk_size words, keeping the original formatting."""
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
+
+
+def page_of(page_offsets, position):
+    """Return the 1-based number of the page containing the character at position."""
+    return max(bisect.bisect_right(page_offsets, position), 1)
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over document chunks, persisted as gzipped JSON."""
+
+    def __init__(self, k1=1.5, b=0.75, chunk_overlap=CHUNK_OVERLAP):
+        self.k1 = k1
+        self.b = b
+        self.chunk_overlap = chunk_overlap
+        self.chunks = {}
+        self.postings = {}
+        self.doc_chunks = {}
+        self.total_length = 0
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add_document(self, file_name, text, legal_field=None, page_offsets=None, **metadata):
+        """Chunk a document and add it to the index, replacing any previous version.
+
+        With page_offsets (start of every page in the text) each chunk records the pages it spans.
+        """
+        self.remove_document(file_name)
+
+        chunk_ids = []
+        for position, (start, end) in enumerate(chunk_spans(text, overlap=self.chunk_overlap)):
+            chunk = text[start:end]
+            tokens = tokenize(chunk)
+            if not tokens:
+                continue
+
+            chunk_id = self.next_id
+            self.next_id += 1
+            self.chunks[chunk_id] = dict(metadata, file_name=file_name, legal_field=legal_field,
+                                         position=position, text=chunk, length=len(tokens))
+            if page_offsets:
+                self.chunks[chunk_id]['pages'] = [page_of(page_offsets, start), page_of(page_offsets, end - 1)]
+            self.total_length += len(tokens)
+
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, frequency in frequencies.items():
+                self.postings.setdefault(token, {})[chunk_id] = frequency
+            chunk_ids.append(chunk_id)
+
+        self.doc_chunks[file_name] = chunk_ids
+        return len(chunk_ids)
+
+    def remove_document(self, file_name):
+        for chunk_id in self.doc_chunks.pop(file_name, []):
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= chunk['length']
+            for token in set(tokenize(chunk['text'])):
+                postings = self.postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def score(self, query):
+        """Return BM25 scores for every chunk that shares at least one term with the query."""
+        if not self.chunks:
+            return {}
+
+        total_chunks = len(self.chunks)
+        average_length = self.total_length / total_chunks
+        scores = {}
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length = self.chunks[chunk_id]['length']
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, top_k=5, legal_field=None, years=None):
+        """Return the top_k chunks for the query, optionally restricted to one legal field and a range of years."""
+        scores = self.filter_scores(self.score(query), legal_field, years)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [dict(self.chunks[chunk_id], chunk_id=chunk_id, score=value) for chunk_id, value in best]
+
+    def filter_scores(self, scores, legal_field=None, years=None):
+        """Keep the scores of chunks within the legal field and the range spanned by years."""
+        if legal_field is not None:
+            scores = {chunk_id: value for chunk_id, value in scores.items()
+                      if self.chunks[chunk_id]['legal_field'] == legal_field}
+        if years:
+            first, last = min(years), max(years)
+            scores = {chunk_id: value for chunk_id, value in scores.items()
+                      if self.chunks[chunk_id].get('year') is not None and first <= self.chunks[chunk_id]['year'] <= last}
+        return scores
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        data = {
+            'k1': self.k1,
+            'b': self.b,
+            'next_id': self.next_id,
+            'chunks': [dict(chunk, chunk_id=chunk_id) for chunk_id, chunk in self.chunks.items()],
+            'postings': {token: list(postings.items()) for token, postings in self.postings.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, postings=True):
+        """Load the index saved at path; without postings only the chunks are kept, for lookups by chunk id
+        when the postings are served from the memory-mapped arrays of the dense index."""
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            data = json.load(file)
+
+        index = cls(k1=data['k1'], b=data['b'])
+        index.next_id = data['next_id']
+        for chunk in data['chunks']:
+            chunk_id = chunk.pop('chunk_id')
+            index.chunks[chunk_id] = chunk
+            index.doc_chunks.setdefault(chunk['file_name'], []).append(chunk_id)
+            index.total_length += chunk['length']
+        if postings:
+            index.postings = {token: dict(postings) for token, postings in data['postings'].items()}
+        return index
+
+    @classmethod
+    def load_or_create(cls, path, postings=True):
+        if os.path.exists(path):
+            return cls.load(path, postings)
+        return cls()
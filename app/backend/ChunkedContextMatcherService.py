@@ -0,0 +1,73 @@
+import os
+from .BM25Index import BM25Index
+from .ContextMatcherService import ContextMatcherService
+from .DenseIndex import DenseIndex
+
+BM25_INDEX_PATH = os.environ.get(
+    'BM25_INDEX_PATH', os.path.join(os.path.dirname(__file__), 'indexes', 'bm25_index.json.gz'))
+DENSE_INDEX_PATH = os.environ.get(
+    'DENSE_INDEX_PATH', os.path.join(os.path.dirname(BM25_INDEX_PATH), 'dense_index'))
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '8'))
+# Liczba kandydatów z każdego z wyszukiwań (BM25 i wektorowego), spośród których wybierane jest top_k
+RETRIEVAL_CANDIDATES = int(os.environ.get('RETRIEVAL_CANDIDATES', '50'))
+# Waga podobieństwa wektorowego w wyniku łącznym (0 - tylko BM25, 1 - tylko wektory)
+HYBRID_DENSE_WEIGHT = float(os.environ.get('HYBRID_DENSE_WEIGHT', '0.3'))
+
+
+class ChunkedContextMatcherService(ContextMatcherService):
+    """Context matcher that returns the best chunks for a question instead of whole files.
+
+    Chunks are ranked by BM25, or, when a dense index was built next to it, by a weighted sum of the BM25 score
+    (scaled to the best candidate) and the cosine similarity of hashed chunk vectors. With the dense index both
+    scores come from its memory-mapped arrays, and the BM25 index is loaded without its postings, only for the
+    chunk texts.
+    """
+
+    def __init__(self, index_path=BM25_INDEX_PATH, top_k=RETRIEVAL_TOP_K, dense_index_path=DENSE_INDEX_PATH,
+                 candidates=RETRIEVAL_CANDIDATES, dense_weight=HYBRID_DENSE_WEIGHT):
+        self.index_path = index_path
+        self.dense_index_path = dense_index_path
+        self.top_k = top_k
+        self.candidates = candidates
+        self.dense_weight = dense_weight
+        self.reload()
+
+    def reload(self):
+        self.dense_index = DenseIndex.load_if_exists(self.dense_index_path)
+        self.index = BM25Index.load_or_create(self.index_path, postings=self.dense_index is None)
+
+    def create_matching_context(self, keywords, question=None, years=None):
+        """Return the top chunks for the question within the legal field given as keywords and the years range."""
+        if not question or not len(self.index):
+            return []
+        if self.dense_index is None:
+            return self.index.search(question, top_k=self.top_k, legal_field=keywords, years=years)
+        if not self.dense_weight:
+            # Macierz może pochodzić ze starszej wersji indeksu - fragmenty, których nie ma już w BM25, są pomijane
+            return [dict(self.index.chunks[chunk_id], chunk_id=chunk_id, score=value) for chunk_id, value in
+                    self.dense_index.bm25_search(question, self.top_k, keywords, years) if chunk_id in self.index.chunks]
+        return self.hybrid_search(question, legal_field=keywords, years=years)
+
+    def hybrid_search(self, question, legal_field=None, years=None):
+        all_bm25_scores = self.dense_index.bm25_scores(question)
+        bm25_scores = dict(self.dense_index.bm25_search(question, self.candidates, legal_field, years,
+                                                        scores=all_bm25_scores))
+        candidates = list(bm25_scores)
+        dense_scores = dict(self.dense_index.search(question, self.candidates, legal_field, years))
+        dense_scores.update(self.dense_index.similarity(
+            question, [chunk_id for chunk_id in candidates if chunk_id not in dense_scores]))
+        bm25_scores.update(self.dense_index.scores_of(
+            all_bm25_scores, [chunk_id for chunk_id in dense_scores if chunk_id not in bm25_scores]))
+
+        best_bm25 = max(bm25_scores.values(), default=0.0) or 1.0
+        scores = {}
+        # Macierz może pochodzić ze starszej wersji indeksu - fragmenty, których nie ma już w BM25, są pomijane
+        for chunk_id in (set(candidates) | dense_scores.keys()) & self.index.chunks.keys():
+            bm25 = bm25_scores.get(chunk_id, 0.0)
+            dense = max(dense_scores.get(chunk_id, 0.0), 0.0)
+            scores[chunk_id] = (1 - self.dense_weight) * bm25 / best_bm25 + self.dense_weight * dense
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.top_k]
+        return [dict(self.index.chunks[chunk_id], chunk_id=chunk_id, score=value,
+                     bm25_score=bm25_scores.get(chunk_id, 0.0), dense_score=dense_scores.get(chunk_id, 0.0))
+                for chunk_id, value in best if value > 0]
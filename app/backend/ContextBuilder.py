@@ -0,0 +1,107 @@
+import os
+from .BM25Index import BM25Index
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '32000'))
+CONTEXT_MAX_DOCUMENT_TOKENS = int(os.environ.get('CONTEXT_MAX_DOCUMENT_TOKENS', '8000'))
+# Przybliżenie liczby tokenów: dla polskich tekstów prawnych średnio ok. 4 znaki na token
+CHARS_PER_TOKEN = 4
+# Fragment przycinany jest tylko wtedy, gdy zostaje z niego co najmniej tyle tokenów
+MIN_TRUNCATED_TOKENS = 50
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut the text to about max_tokens tokens, at the last whitespace before the limit."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > 0 else max_chars]
+
+
+def format_pages(pages):
+    """Format a [first, last] page span for a source header, e.g. ', s. 3' or ', s. 3-5'."""
+    if not pages:
+        return ""
+    first, last = pages
+    return f", s. {first}" if first == last else f", s. {first}-{last}"
+
+
+class ContextBuilder:
+    """Assembles the documents block of the prompt from ranked chunks within a token budget.
+
+    Every source contributes at most max_document_tokens, the chunk that crosses a limit is truncated,
+    and sources that did not fit at all are reported as dropped.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, max_document_tokens=CONTEXT_MAX_DOCUMENT_TOKENS):
+        self.token_budget = token_budget
+        self.max_document_tokens = max_document_tokens
+        self.builds = 0
+        self.total_tokens = 0
+        self.dropped_sources = 0
+
+    def rank_documents(self, question, documents, page_offsets=None):
+        """Split whole documents ((file_name, text) pairs) into chunks ordered by BM25 relevance to the question.
+
+        Chunks without any query term keep their document order after the matching ones. page_offsets maps
+        file names to the page offsets of their texts, so that the chunks carry page numbers.
+        """
+        page_offsets = page_offsets or {}
+        index = BM25Index(chunk_overlap=0)
+        for file_name, text in documents:
+            if text:
+                index.add_document(file_name, text, page_offsets=page_offsets.get(file_name))
+        scores = index.score(question)
+        ranked = sorted(index.chunks.items(), key=lambda item: (-scores.get(item[0], 0.0), item[0]))
+        return [dict(chunk, score=scores.get(chunk_id, 0.0)) for chunk_id, chunk in ranked]
+
+    def build(self, chunks):
+        """Fill the budget with ranked chunks; returns {'context', 'sources', 'citations', 'dropped', 'tokens'}.
+
+        citations maps every used source to the sorted page numbers of its chunks, when they are known.
+        """
+        parts, used = [], 0
+        source_tokens, citations = {}, {}
+        for chunk in chunks:
+            file_name = chunk['file_name']
+            header = f"[{file_name}{format_pages(chunk.get('pages'))}]\n"
+            allowance = min(self.token_budget - used,
+                            self.max_document_tokens - source_tokens.get(file_name, 0)) - estimate_tokens(header)
+            if allowance <= 0:
+                continue
+
+            text = chunk['text']
+            if estimate_tokens(text) > allowance:
+                if allowance < MIN_TRUNCATED_TOKENS:
+                    continue
+                text = truncate_to_tokens(text, allowance)
+
+            tokens = estimate_tokens(header) + estimate_tokens(text)
+            parts.append(header + text)
+            used += tokens
+            source_tokens[file_name] = source_tokens.get(file_name, 0) + tokens
+            if chunk.get('pages'):
+                first, last = chunk['pages']
+                citations.setdefault(file_name, set()).update(range(first, last + 1))
+
+        candidates = list(dict.fromkeys(chunk['file_name'] for chunk in chunks))
+        dropped = [file_name for file_name in candidates if file_name not in source_tokens]
+
+        self.builds += 1
+        self.total_tokens += used
+        self.dropped_sources += len(dropped)
+        return {'context': "\n\n".join(parts), 'sources': list(source_tokens),
+                'citations': {file_name: sorted(pages) for file_name, pages in citations.items()},
+                'dropped': dropped, 'tokens': used}
+
+    def stats(self):
+        return {
+            'builds': self.builds,
+            'avg_tokens': self.total_tokens / self.builds if self.builds else 0.0,
+            'dropped_sources': self.dropped_sources,
+            'token_budget': self.token_budget,
+        }
@@ -0,0 +1,186 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'indexes', 'snapshots'))
+# Szerokość przedziału lat, dla którego budowana jest osobna migawka dziedziny
+SNAPSHOT_YEAR_BUCKET = int(os.environ.get('SNAPSHOT_YEAR_BUCKET', '10'))
+SNAPSHOT_COMPRESSION_LEVEL = int(os.environ.get('SNAPSHOT_COMPRESSION_LEVEL', '6'))
+
+SNAPSHOT_MAGIC = b'CTXSNAP1'
+# Na końcu pliku zapisywane jest położenie spisu dokumentów (JSON)
+FOOTER = struct.Struct('<Q')
+NON_WORD_PATTERN = re.compile(r'\W+', re.UNICODE)
+
+
+def year_bucket(year, bucket_size=SNAPSHOT_YEAR_BUCKET):
+    return year // bucket_size * bucket_size
+
+
+def snapshot_name(legal_field, bucket=None):
+    name = NON_WORD_PATTERN.sub('_', legal_field.lower()).strip('_')
+    return f"{name}.snap" if bucket is None else f"{name}.{bucket}.snap"
+
+
+class SnapshotWriter:
+    """Streams documents into a snapshot file; the file replaces the previous snapshot only on close().
+
+    Layout: magic, zlib-compressed texts one after another, the JSON table of contents and its offset.
+    """
+
+    def __init__(self, path, legal_field, bucket=None, level=SNAPSHOT_COMPRESSION_LEVEL):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.level = level
+        self.header = {'legal_field': legal_field, 'bucket': bucket, 'documents': []}
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(SNAPSHOT_MAGIC)
+
+    def add(self, file_name, text, year=None, page_offsets=None):
+        data = zlib.compress(text.encode('utf-8'), self.level)
+        self.header['documents'].append({'file_name': file_name, 'year': year, 'page_offsets': page_offsets,
+                                         'offset': self.file.tell(), 'length': len(data)})
+        self.file.write(data)
+
+    def close(self):
+        toc_offset = self.file.tell()
+        self.file.write(json.dumps(self.header, ensure_ascii=False).encode('utf-8'))
+        self.file.write(FOOTER.pack(toc_offset))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+class ContextSnapshot:
+    """Read-only, memory-mapped snapshot of the documents of one law domain (or one of its year buckets).
+
+    Pages of the mapping are shared between worker processes; a text is decompressed only when it is read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mtime_ns = os.fstat(file.fileno()).st_mtime_ns
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self.map.close()
+            raise ValueError(f"Not a context snapshot: {path}")
+        toc_offset, = FOOTER.unpack(self.map[-FOOTER.size:])
+        header = json.loads(self.map[toc_offset:-FOOTER.size].decode('utf-8'))
+        self.legal_field = header['legal_field']
+        self.bucket = header['bucket']
+        self.entries = header['documents']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, entry):
+        data = self.map[entry['offset']:entry['offset'] + entry['length']]
+        return zlib.decompress(data).decode('utf-8')
+
+    def documents(self, years=None):
+        """Return [(file_name, text, page_offsets)] of the documents within the range spanned by years."""
+        entries = self.entries
+        if years:
+            first, last = min(years), max(years)
+            entries = [entry for entry in entries if entry['year'] is not None and first <= entry['year'] <= last]
+        return [(entry['file_name'], self.read(entry), entry['page_offsets']) for entry in entries]
+
+    def close(self):
+        self.map.close()
+
+
+def write_domain_snapshots(directory, legal_field, documents, bucket_size=SNAPSHOT_YEAR_BUCKET):
+    """Write the snapshot of the whole domain and of every year bucket from an iterable of documents
+    ({'file_name', 'text', 'year', 'page_offsets'}); returns the number of documents written."""
+    writers = {None: SnapshotWriter(os.path.join(directory, snapshot_name(legal_field)), legal_field)}
+    count = 0
+    try:
+        for document in documents:
+            if document.get('text') is None:
+                continue
+            year = document.get('year')
+            targets = [None] if year is None else [None, year_bucket(year, bucket_size)]
+            for bucket in targets:
+                if bucket not in writers:
+                    writers[bucket] = SnapshotWriter(
+                        os.path.join(directory, snapshot_name(legal_field, bucket)), legal_field, bucket)
+                writers[bucket].add(document['file_name'], document['text'], year, document.get('page_offsets'))
+            count += 1
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    for writer in writers.values():
+        writer.close()
+    # Migawki przedziałów lat, w których nie ma już dokumentów, są usuwane
+    prefix = snapshot_name(legal_field)[:-len('.snap')] + '.'
+    for file_name in os.listdir(directory):
+        bucket = file_name[len(prefix):-len('.snap')]
+        if file_name.startswith(prefix) and file_name.endswith('.snap') and bucket.isdigit() \
+                and int(bucket) not in writers:
+            os.remove(os.path.join(directory, file_name))
+    return count
+
+
+class SnapshotStore:
+    """Serves domain documents from the snapshots in a directory, reopening files that were rebuilt."""
+
+    def __init__(self, directory=SNAPSHOT_DIR, bucket_size=SNAPSHOT_YEAR_BUCKET):
+        self.directory = directory
+        self.bucket_size = bucket_size
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self, name):
+        path = os.path.join(self.directory, name)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is None or snapshot.mtime_ns != mtime_ns:
+                # Stara mapa jest zamykana przez odśmiecanie, bo inny wątek może jeszcze z niej czytać
+                snapshot = self._snapshots[name] = ContextSnapshot(path)
+            return snapshot
+
+    def get_documents(self, legal_field, years=None):
+        """Return [(file_name, text, page_offsets)] for the domain and years, or None without a snapshot."""
+        if years and max(years) - min(years) < 2 * self.bucket_size:
+            buckets = range(year_bucket(min(years), self.bucket_size), max(years) + 1, self.bucket_size)
+            snapshots = [self._open(snapshot_name(legal_field, bucket)) for bucket in buckets]
+            # Brak migawki przedziału oznacza brak dokumentów z tych lat, o ile istnieje migawka całej dziedziny
+            if self._open(snapshot_name(legal_field)) is not None:
+                self.hits += 1
+                return [document for snapshot in snapshots if snapshot is not None
+                        for document in snapshot.documents(years)]
+        else:
+            snapshot = self._open(snapshot_name(legal_field))
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot.documents(years)
+        self.misses += 1
+        return None
+
+    def reload(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'open_snapshots': len(self._snapshots)}
@@ -0,0 +1,280 @@
+import json
+import math
+import os
+import zlib
+import numpy as np
+from .BM25Index import STEM_LENGTH, tokenize
+
+DENSE_DIMENSIONS = int(os.environ.get('DENSE_DIMENSIONS', '256'))
+# Fragmenty są kodowane partiami, a macierz jest zapisywana wprost do pliku, więc indeks nie musi mieścić się w pamięci
+DENSE_BATCH_SIZE = int(os.environ.get('DENSE_BATCH_SIZE', '4096'))
+NGRAM_SIZE = 3
+NO_YEAR = 0
+
+
+class OutdatedIndex(ValueError):
+    """The dense index on disk was written by an older version and has to be rebuilt."""
+
+
+class HashingEncoder:
+    """CPU-only text encoder: signed feature hashing of stemmed tokens and their character trigrams.
+
+    Trigrams make inflected forms of the same word land close to each other; vectors are L2-normalised,
+    so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dimensions=DENSE_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def features(self, text):
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+            padded = f"<{token}>"
+            for start in range(len(padded) - NGRAM_SIZE + 1):
+                ngram = '#' + padded[start:start + NGRAM_SIZE]
+                counts[ngram] = counts.get(ngram, 0) + 1
+        return counts
+
+    def encode(self, text, out=None):
+        vector = np.zeros(self.dimensions, dtype=np.float32) if out is None else out
+        for feature, count in self.features(text).items():
+            # crc32 zamiast hash(), bo ten jest losowany przy każdym uruchomieniu interpretera
+            value = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if value & 0x80000000 else -1.0
+            vector[value % self.dimensions] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def encode_batch(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            self.encode(text, out=matrix[row])
+        return matrix
+
+
+def dense_paths(path):
+    """Return the paths of the vectors, BM25 postings, row metadata and header files of the dense index at path."""
+    return {'vectors': f"{path}.vectors.npy", 'chunk_ids': f"{path}.ids.npy", 'fields': f"{path}.fields.npy",
+            'years': f"{path}.years.npy", 'terms': f"{path}.terms.npy", 'term_offsets': f"{path}.offsets.npy",
+            'posting_rows': f"{path}.rows.npy", 'posting_weights': f"{path}.weights.npy", 'header': f"{path}.json"}
+
+
+def write_bm25_postings(index, chunk_ids, paths):
+    """Write the postings of the BM25 index as term-major CSR arrays over the rows of chunk_ids.
+
+    The weight of a posting is the whole BM25 term score of the chunk (idf and length normalisation included),
+    so a query is scored by adding up the weight slices of its terms.
+    """
+    terms = sorted(index.postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(index.postings[term]) for term in terms], out=term_offsets[1:])
+    lengths = np.array([index.chunks[chunk_id]['length'] for chunk_id in chunk_ids], dtype=np.float64)
+    norms = index.k1 * (1 - index.b + index.b * lengths / lengths.mean()) if len(lengths) else lengths
+
+    shape = (int(term_offsets[-1]),)
+    rows = np.lib.format.open_memmap(paths['posting_rows'], mode='w+', dtype=np.int32, shape=shape)
+    weights = np.lib.format.open_memmap(paths['posting_weights'], mode='w+', dtype=np.float32, shape=shape)
+    for number, term in enumerate(terms):
+        postings = index.postings[term]
+        start, end = term_offsets[number], term_offsets[number + 1]
+        term_rows = np.searchsorted(chunk_ids, np.fromiter(postings, dtype=np.int64, count=len(postings)))
+        frequencies = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+        idf = math.log(1 + (len(chunk_ids) - len(postings) + 0.5) / (len(postings) + 0.5))
+        rows[start:end] = term_rows
+        weights[start:end] = idf * frequencies * (index.k1 + 1) / (frequencies + norms[term_rows])
+    rows.flush()
+    weights.flush()
+    del rows, weights
+
+    for name, array in (('terms', np.array(terms, dtype=f'<U{STEM_LENGTH}')), ('term_offsets', term_offsets)):
+        with open(paths[name], 'wb') as file:
+            np.save(file, array)
+
+
+def build_dense_index(index, path, encoder=None, batch_size=DENSE_BATCH_SIZE, reuse=True):
+    """Encode every chunk of the BM25 index into a float32 matrix saved as .npy next to the chunk ids,
+    legal field codes and years of its rows and the BM25 postings over the same rows; returns the number of rows.
+
+    With reuse, rows of chunks already present in the previous matrix at path are copied instead of encoded
+    again - chunk ids are never reused, so the text of a chunk id does not change.
+    """
+    encoder = encoder or HashingEncoder()
+    previous = DenseIndex.load_if_exists(path) if reuse else None
+    if previous is not None and previous.vectors.shape[1] != encoder.dimensions:
+        previous = None
+    paths = dense_paths(path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    chunk_ids = np.array(sorted(index.chunks), dtype=np.int64)
+    legal_fields = sorted({chunk['legal_field'] for chunk in index.chunks.values() if chunk['legal_field']})
+    codes = {legal_field: code for code, legal_field in enumerate(legal_fields, start=1)}
+    fields = np.array([codes.get(index.chunks[chunk_id]['legal_field'], 0) for chunk_id in chunk_ids],
+                      dtype=np.int32)
+    years = np.array([index.chunks[chunk_id].get('year') or NO_YEAR for chunk_id in chunk_ids], dtype=np.int32)
+
+    tmp_paths = {name: f"{file_path}.tmp" for name, file_path in paths.items()}
+    vectors = np.lib.format.open_memmap(tmp_paths['vectors'], mode='w+', dtype=np.float32,
+                                        shape=(len(chunk_ids), encoder.dimensions))
+    for start in range(0, len(chunk_ids), batch_size):
+        batch = chunk_ids[start:start + batch_size]
+        rows = previous.rows(batch) if previous is not None else np.full(len(batch), -1)
+        known = rows >= 0
+        if known.any():
+            vectors[start:start + len(batch)][known] = previous.vectors[rows[known]]
+        if not known.all():
+            vectors[start:start + len(batch)][~known] = encoder.encode_batch(
+                [index.chunks[chunk_id]['text'] for chunk_id in batch[~known]])
+    vectors.flush()
+    del vectors, previous
+
+    for name, array in (('chunk_ids', chunk_ids), ('fields', fields), ('years', years)):
+        with open(tmp_paths[name], 'wb') as file:
+            np.save(file, array)
+    write_bm25_postings(index, chunk_ids, tmp_paths)
+    with open(tmp_paths['header'], 'w', encoding='utf-8') as file:
+        json.dump({'dimensions': encoder.dimensions, 'legal_fields': legal_fields, 'bm25': True}, file,
+                  ensure_ascii=False)
+
+    # Nagłówek jest podmieniany jako ostatni - czytelnik sprawdza po nim, czy pliki macierzy do siebie pasują
+    for name in paths:
+        if name != 'header':
+            os.replace(tmp_paths[name], paths[name])
+    os.replace(tmp_paths['header'], paths['header'])
+    return len(chunk_ids)
+
+
+class DenseIndex:
+    """Memory-mapped matrix of chunk vectors, scored with one matrix-vector product per question, and the BM25
+    postings of the same rows, scored by adding up the weight slices of the question terms.
+
+    Rows are sorted by BM25 chunk id; the legal field code and year of every row are kept in separate arrays,
+    so filters are vectorised as well.
+    """
+
+    def __init__(self, vectors, chunk_ids, fields, years, legal_fields, terms, term_offsets, posting_rows,
+                 posting_weights, encoder=None):
+        self.vectors = vectors
+        self.chunk_ids = chunk_ids
+        self.fields = fields
+        self.years = years
+        self.codes = {legal_field: code for code, legal_field in enumerate(legal_fields, start=1)}
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.posting_rows = posting_rows
+        self.posting_weights = posting_weights
+        self.encoder = encoder or HashingEncoder(vectors.shape[1])
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def load(cls, path):
+        paths = dense_paths(path)
+        with open(paths['header'], encoding='utf-8') as file:
+            header = json.load(file)
+        if not header.get('bm25'):
+            raise OutdatedIndex(f"Dense index has no BM25 postings, rebuild it with build_dense_index: {path}")
+        vectors, posting_rows, posting_weights = (
+            np.load(paths[name], mmap_mode='r') for name in ('vectors', 'posting_rows', 'posting_weights'))
+        chunk_ids, fields, years, terms, term_offsets = (
+            np.load(paths[name]) for name in ('chunk_ids', 'fields', 'years', 'terms', 'term_offsets'))
+        if vectors.shape != (len(chunk_ids), header['dimensions']) or \
+                len(posting_rows) != len(posting_weights) or len(posting_rows) != term_offsets[-1]:
+            raise ValueError(f"Dense index files do not match: {path}")
+        return cls(vectors, chunk_ids, fields, years, header['legal_fields'], terms, term_offsets, posting_rows,
+                   posting_weights)
+
+    @classmethod
+    def load_if_exists(cls, path):
+        if not os.path.exists(dense_paths(path)['header']):
+            return None
+        try:
+            return cls.load(path)
+        except OutdatedIndex as e:
+            # Wyszukiwanie wraca wtedy do samego indeksu BM25, aż macierz zostanie zbudowana ponownie
+            print(e)
+            return None
+
+    def mask(self, legal_field=None, years=None):
+        """Return a boolean mask of the rows within the legal field and the range spanned by years, or None."""
+        mask = None
+        if legal_field is not None:
+            mask = self.fields == self.codes.get(legal_field, -1)
+        if years:
+            in_years = (self.years >= min(years)) & (self.years <= max(years))
+            mask = in_years if mask is None else mask & in_years
+        return mask
+
+    def search(self, query, top_k=5, legal_field=None, years=None):
+        """Return [(chunk_id, similarity)] of the top_k rows most similar to the query, best first."""
+        if not len(self):
+            return []
+        return self.top(self.vectors @ self.encoder.encode(query), top_k, self.mask(legal_field, years))
+
+    def bm25_scores(self, query):
+        """Return the BM25 score of every row for the query; only the postings of its terms are read."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        tokens = sorted(set(tokenize(query)))
+        if not tokens or not len(self.terms):
+            return scores
+        numbers = np.searchsorted(self.terms, tokens)
+        for token, number in zip(tokens, numbers):
+            if number < len(self.terms) and self.terms[number] == token:
+                start, end = self.term_offsets[number], self.term_offsets[number + 1]
+                # Wiersze w obrębie jednego terminu są unikalne, więc dodawanie przez indeksowanie jest poprawne
+                scores[self.posting_rows[start:end]] += self.posting_weights[start:end]
+        return scores
+
+    def bm25_search(self, query, top_k=5, legal_field=None, years=None, scores=None):
+        """Return [(chunk_id, score)] of the top_k rows with the highest BM25 score for the query, best first;
+        rows sharing no term with the query are skipped. scores are the bm25_scores of the query, if known."""
+        if not len(self):
+            return []
+        scores = self.bm25_scores(query) if scores is None else scores
+        mask = self.mask(legal_field, years)
+        return self.top(scores, top_k, scores > 0 if mask is None else mask & (scores > 0))
+
+    def top(self, scores, top_k, mask=None):
+        """Return [(chunk_id, score)] of the top_k rows by scores among the rows selected by mask, best first."""
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(mask.sum()))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        # argpartition wybiera top_k w czasie liniowym, sortowane jest tylko te top_k
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(self.chunk_ids[row]), float(scores[row])) for row in best]
+
+    def scores_of(self, scores, chunk_ids):
+        """Return {chunk_id: score} of the given chunks from per-row scores; chunks missing from the rows are skipped."""
+        chunk_ids = np.asarray(list(chunk_ids), dtype=np.int64)
+        rows = self.rows(chunk_ids)
+        found = rows >= 0
+        return dict(zip(chunk_ids[found].tolist(), scores[rows[found]].tolist()))
+
+    def rows(self, chunk_ids):
+        """Return the matrix row of every chunk id, -1 for chunks missing from the matrix."""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(chunk_ids), -1)
+        rows = np.searchsorted(self.chunk_ids, chunk_ids)
+        found = (rows < len(self.chunk_ids)) & (self.chunk_ids[np.minimum(rows, len(self.chunk_ids) - 1)] == chunk_ids)
+        return np.where(found, rows, -1)
+
+    def similarity(self, query, chunk_ids):
+        """Return {chunk_id: similarity} for the given chunks; chunks missing from the matrix are skipped."""
+        chunk_ids = np.asarray(list(chunk_ids), dtype=np.int64)
+        if not len(self) or not len(chunk_ids):
+            return {}
+        rows = self.rows(chunk_ids)
+        found = rows >= 0
+        rows, chunk_ids = rows[found], chunk_ids[found]
+        scores = self.vectors[rows] @ self.encoder.encode(query)
+        return dict(zip(chunk_ids.tolist(), scores.tolist()))
@@ -0,0 +1,136 @@
+import math
+import os
+import threading
+import time
+import zlib
+from .BM25Index import tokenize
+from .helpers.paths import LEGAL_FIELDS_PATH, load_legal_fields
+
+DOMAIN_CONFIDENCE_THRESHOLD = float(os.environ.get('DOMAIN_CONFIDENCE_THRESHOLD', '0.35'))
+DOMAIN_MIN_SIMILARITY = float(os.environ.get('DOMAIN_MIN_SIMILARITY', '0.05'))
+MAX_CHUNKS_PER_DOMAIN = int(os.environ.get('DOMAIN_MAX_CHUNKS_PER_DOMAIN', '500'))
+
+
+def hashed_features(text, n_features=2 ** 18):
+    """Map the text to hashed unigram and bigram counts."""
+    tokens = tokenize(text)
+    grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    features = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode('utf-8')) % n_features
+        features[bucket] = features.get(bucket, 0) + 1
+    return features
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if norm == 0:
+        return vector
+    return {key: value / norm for key, value in vector.items()}
+
+
+class DomainClassifier:
+    """Local TF-IDF centroid classifier that picks a law domain without calling the language model."""
+
+    def __init__(self, domains, confidence_threshold=DOMAIN_CONFIDENCE_THRESHOLD,
+                 min_similarity=DOMAIN_MIN_SIMILARITY, n_features=2 ** 18):
+        self.domains = list(domains)
+        self.confidence_threshold = confidence_threshold
+        self.min_similarity = min_similarity
+        self.n_features = n_features
+        self.idf = {}
+        self.centroids = {}
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.local_hits = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def fit(self, labelled_texts):
+        """Build one centroid per domain from (domain, text) pairs."""
+        samples = [(domain, hashed_features(text, self.n_features))
+                   for domain, text in labelled_texts if domain in self.domains]
+        samples = [(domain, features) for domain, features in samples if features]
+
+        document_frequency = {}
+        for _, features in samples:
+            for bucket in features:
+                document_frequency[bucket] = document_frequency.get(bucket, 0) + 1
+        self.idf = {bucket: math.log((1 + len(samples)) / (1 + frequency)) + 1
+                    for bucket, frequency in document_frequency.items()}
+
+        sums = {}
+        for domain, features in samples:
+            centroid = sums.setdefault(domain, {})
+            for bucket, value in self._weigh(features).items():
+                centroid[bucket] = centroid.get(bucket, 0.0) + value
+        self.centroids = {domain: _normalize(centroid) for domain, centroid in sums.items()}
+        return self
+
+    @classmethod
+    def from_sources(cls, domains, keywords_path=LEGAL_FIELDS_PATH, index=None,
+                     max_chunks_per_domain=MAX_CHUNKS_PER_DOMAIN, **kwargs):
+        """Train on the keyword lists and, when available, chunks of the ingested corpus."""
+        labelled_texts = []
+        if os.path.exists(keywords_path):
+            for domain, keywords in load_legal_fields(keywords_path).items():
+                labelled_texts.extend((domain, keyword) for keyword in keywords)
+
+        if index is not None:
+            per_domain = {}
+            for chunk in index.chunks.values():
+                domain = chunk.get('legal_field')
+                if per_domain.get(domain, 0) >= max_chunks_per_domain:
+                    continue
+                per_domain[domain] = per_domain.get(domain, 0) + 1
+                labelled_texts.append((domain, chunk['text']))
+
+        return cls(domains, **kwargs).fit(labelled_texts)
+
+    def _weigh(self, features):
+        return _normalize({bucket: (1 + math.log(count)) * self.idf[bucket]
+                           for bucket, count in features.items() if bucket in self.idf})
+
+    def predict(self, text):
+        """Return (best_domain, confidence) where confidence is the relative margin over the runner-up."""
+        vector = self._weigh(hashed_features(text, self.n_features))
+        if not vector or not self.centroids:
+            return None, 0.0
+
+        scores = sorted(
+            ((sum(value * centroid.get(bucket, 0.0) for bucket, value in vector.items()), domain)
+             for domain, centroid in self.centroids.items()),
+            reverse=True
+        )
+        best_score, best_domain = scores[0]
+        if best_score < self.min_similarity:
+            return None, 0.0
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        return best_domain, (best_score - runner_up) / best_score
+
+    def classify(self, text):
+        """Return the domain when the classifier is confident enough, otherwise None."""
+        start = time.perf_counter()
+        domain, confidence = self.predict(text)
+        if confidence < self.confidence_threshold:
+            domain = None
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.requests += 1
+            self.local_hits += domain is not None
+            self.total_latency += elapsed
+            self.max_latency = max(self.max_latency, elapsed)
+        return domain
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'local_hits': self.local_hits,
+                'llm_fallbacks': self.requests - self.local_hits,
+                'hit_rate': self.local_hits / self.requests if self.requests else 0.0,
+                'avg_latency_ms': 1000 * self.total_latency / self.requests if self.requests else 0.0,
+                'max_latency_ms': 1000 * self.max_latency,
+            }
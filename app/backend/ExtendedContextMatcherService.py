@@ -7,8 +7,8 @@ class ExtendedContextMatcherService(MongoDBHandler, ContextMatcherService):
     def __init__(self):
         super().__init__()
 
-    def create_matching_context(self, keywords):
-        return self.get_files_by_legal_field(keywords)
+    def create_matching_context(self, keywords, years=None):
+        return self.get_files_by_legal_field(keywords, years)
 
 
 # def main():
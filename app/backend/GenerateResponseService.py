@@ -1,16 +1,55 @@
-import vertexai
-from vertexai.generative_models import GenerativeModel
+import asyncio
+import os
+import re
 from .ExtendedContextMatcherService import ExtendedContextMatcherService
+from .ChunkedContextMatcherService import ChunkedContextMatcherService
+from .ContextBuilder import ContextBuilder, estimate_tokens, format_pages
+from .ContextSnapshot import SnapshotStore
+from .DomainClassifier import DomainClassifier
+from .LLMClient import PrefixCachingLLMClient, PrefixNotFound, create_llm_client
+from .AdmissionControl import (DOMAIN_TIMEOUT_SECONDS, GENERATION_TIMEOUT_SECONDS, RETRIEVAL_TIMEOUT_SECONDS,
+                               StageTimeout, iterate_with_deadline, with_deadline)
+from .AnswerCache import AnswerCache, ANSWER_CACHE_PERSIST, normalize_question, years_key
+from .PromptCache import PROMPT_CACHE_ENABLED, PROMPT_CACHE_TOKEN_BUDGET, PromptPrefixCache
+from .Metrics import CACHE_LOOKUPS, LLM_ERRORS, PROMPT_CHARACTERS, PROMPT_TOKENS, stage
+from .RequestBatching import MicroBatcher, RequestCoalescer
+
+
+LAW_DOMAINS_PATH = os.path.join(os.path.dirname(__file__), 'law_domains.txt')
+# Pytania czekające na dopasowanie dziedziny przez model są zbierane w jedno zapytanie
+DOMAIN_BATCH_WINDOW_MS = float(os.environ.get('DOMAIN_BATCH_WINDOW_MS', '10'))
+DOMAIN_BATCH_MAX_SIZE = int(os.environ.get('DOMAIN_BATCH_MAX_SIZE', '16'))
+
+BATCH_ANSWER_PATTERN = re.compile(r'^\s*(\d+)\s*[:.)-]\s*(.+)$')
 
 
 class LanguageModelService:
-    def __init__(self):
-        vertexai.init(project="gentle-cable-441612-q2", location="europe-central2")
-        self.model = GenerativeModel("gemini-1.5-flash-002")
+    def __init__(self, llm_client=None):
+        self.llm_client = llm_client or create_llm_client()
 
-        self.law_domains = self._read_law_domains("backend/law_domains.txt")
+        self.law_domains = self._read_law_domains(LAW_DOMAINS_PATH)
 
+        self.chunk_matcher = ChunkedContextMatcherService()
         self.context_matcher = ExtendedContextMatcherService()
+        self.context_builder = ContextBuilder()
+        self.snapshots = SnapshotStore()
+
+        self.domain_classifier = DomainClassifier.from_sources(self.law_domains, index=self.chunk_matcher.index)
+
+        self.answer_cache = AnswerCache(
+            collection=self.context_matcher.db['answer_cache'] if ANSWER_CACHE_PERSIST else None)
+
+        # Stała część promptu (wstęp i dokumenty dziedziny) może być przechowywana po stronie modelu
+        self.prompt_cache = None
+        if PROMPT_CACHE_ENABLED and isinstance(self.llm_client, PrefixCachingLLMClient):
+            self.prompt_cache = PromptPrefixCache(self.llm_client)
+        self.prefix_builder = ContextBuilder(token_budget=PROMPT_CACHE_TOKEN_BUDGET,
+                                             max_document_tokens=PROMPT_CACHE_TOKEN_BUDGET)
+        self.corpus_versions = {}
+
+        self.coalescer = RequestCoalescer()
+        self.domain_batcher = MicroBatcher(self._match_law_domains_batch, window=DOMAIN_BATCH_WINDOW_MS / 1000,
+                                           max_batch_size=DOMAIN_BATCH_MAX_SIZE)
 
     def _read_law_domains(self, filepath):
         """Read the list of law domains from a text file."""
@@ -23,9 +62,8 @@ class LanguageModelService:
         except Exception as e:
             raise Exception(f"Error reading law domains: {e}")
 
-    def _match_law_domain(self, question):
-        """Match the user's question to a law domain using the language model."""
-        prompt = (
+    def _law_domain_prompt(self, question):
+        return (
             f"Given the following list of law domains:\n"
             f"{', '.join(self.law_domains)}.\n\n"
             f"Determine which law domain best fits the question below.\n"
@@ -33,43 +71,306 @@ class LanguageModelService:
             f"Question: {question}"
         )
 
-        response = self.model.generate_content(prompt)
-        matched_domain = response.text.strip().lower()
-        # Validate the matched domain
-        if matched_domain in self.law_domains:
-            return matched_domain
-        else:
-            raise Exception(f"Model returned an invalid law domain: {matched_domain}")
+    def _parse_law_domain(self, response_text):
+        matched_domain = response_text.strip().lower()
+        # Validate the matched domain, tolerating quotes and punctuation added by the model
+        cleaned_domain = matched_domain.strip(' \t\n.,;:!"\'`*')
+        if cleaned_domain in self.law_domains:
+            return cleaned_domain
+
+        mentioned = [domain for domain in self.law_domains if domain in matched_domain]
+        if len(mentioned) == 1:
+            return mentioned[0]
+        raise Exception(f"Model returned an invalid law domain: {matched_domain}")
+
+    def _match_law_domain(self, question):
+        """Match the user's question to a law domain using the language model."""
+        return self._parse_law_domain(self.llm_client.generate(self._law_domain_prompt(question)))
+
+    async def _match_law_domain_async(self, question):
+        response_text = await self._generate('domain', self._law_domain_prompt(question))
+        return self._parse_law_domain(response_text)
 
-    def get_model_response(self, question):
-        """Main method to get the model's response to the user's question."""
+    def _law_domains_batch_prompt(self, questions):
+        numbered = "\n".join(f"{number}. {question}" for number, question in enumerate(questions, start=1))
+        return (
+            f"Given the following list of law domains:\n"
+            f"{', '.join(self.law_domains)}.\n\n"
+            f"Determine which law domain best fits each of the numbered questions below.\n"
+            f"Answer with one line per question in the form '<number>: <law domain name>'.\n\n"
+            f"Questions:\n{numbered}"
+        )
+
+    async def _match_law_domains_batch(self, questions):
+        """Match several questions with one model call; returns a domain or an exception per question."""
+        if len(questions) == 1:
+            try:
+                return [await self._match_law_domain_async(questions[0])]
+            except Exception as e:
+                return [e]
+
+        response_text = await self._generate('domain', self._law_domains_batch_prompt(questions))
+        answers = {}
+        for line in response_text.splitlines():
+            match = BATCH_ANSWER_PATTERN.match(line)
+            if match:
+                answers[int(match.group(1))] = match.group(2)
+
+        results = []
+        for number in range(1, len(questions) + 1):
+            try:
+                if number not in answers:
+                    raise Exception(f"Model did not return a law domain for question {number}")
+                results.append(self._parse_law_domain(answers[number]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _classify_law_domain(self, question):
+        """Match the question with the local classifier and ask the model only when it is not confident.
+
+        Questions that need the model are batched with other pending ones into a single call.
+        """
+        with stage('domain_classifier'):
+            law_domain = self.domain_classifier.classify(question)
+        if law_domain is not None:
+            return law_domain
+        return await self.domain_batcher.submit(question)
+
+    @staticmethod
+    def _record_prompt(call, prompt):
+        PROMPT_CHARACTERS.labels(call).inc(len(prompt))
+        PROMPT_TOKENS.labels(call).inc(estimate_tokens(prompt))
+
+    async def _generate(self, call, prompt, prefix_handle=None):
+        """Send the prompt to the model, timing the call and counting prompt size and errors under the call label.
+
+        With prefix_handle the prompt follows a prefix cached on the model side, and only the prompt is counted.
+        """
+        self._record_prompt(call, prompt)
         try:
+            with stage(f'llm_{call}'):
+                if prefix_handle is not None:
+                    return await self.llm_client.generate_with_prefix_async(prefix_handle, prompt)
+                return await self.llm_client.generate_async(prompt)
+        except Exception:
+            LLM_ERRORS.labels(call).inc()
+            raise
 
-            law_domain = self._match_law_domain(question)
-            print(f"Matched Law Domain: {law_domain}")
+    async def _get_cached_answer(self, question, law_domain, years):
+        with stage('answer_cache'):
+            cached = await asyncio.to_thread(self.answer_cache.get, question, law_domain, years)
+        CACHE_LOOKUPS.labels('answer', 'miss' if cached is None else 'hit').inc()
+        return cached
 
-            pdf_files = self.context_matcher.create_matching_context(law_domain)
-            if not pdf_files:
+    async def _build_context(self, law_domain, question, years=None):
+        """Build the documents block and the list of its source files, from the best matching chunks
+        or from whole files as a fallback (domain snapshots, then MongoDB); both are restricted to the selected
+        years and the token budget."""
+        with stage('retrieval'):
+            chunks = await asyncio.to_thread(self.chunk_matcher.create_matching_context, law_domain, question, years)
+        if not chunks:
+            documents = await self._load_domain_documents(law_domain, years)
+            if not documents:
                 raise Exception(f"No PDF files found for law domain: {law_domain}")
 
-            context = ""
+            page_offsets = {file_name: offsets for file_name, _, offsets in documents if offsets}
+            with stage('document_ranking'):
+                chunks = await asyncio.to_thread(self.context_builder.rank_documents, question,
+                                                 [(file_name, text) for file_name, text, _ in documents], page_offsets)
+
+        with stage('context_build'):
+            result = self.context_builder.build(chunks)
+        if result['dropped']:
+            print(f"Context budget exceeded, dropped {len(result['dropped'])} sources: {', '.join(result['dropped'])}")
+        return result['context'], result['sources']
 
-            for pdf_file in pdf_files:
-                text = self.context_matcher.get_text_from_binary_pdf(pdf_file)
-                if text:
-                    context += text
+    async def _load_domain_documents(self, law_domain, years=None):
+        """Return [(file_name, text, page_offsets)] of the domain, from its snapshot or from MongoDB."""
+        with stage('snapshot_lookup'):
+            documents = await asyncio.to_thread(self.snapshots.get_documents, law_domain, years)
+        if documents is None:
+            documents = await self._fetch_documents(law_domain, years)
+        return documents
 
-            final_prompt = (
-                f"You are a legal assistant specializing in {law_domain}.\n"
-                f"Based on the following documents, answer the user's question.\n\n"
-                f"Documents:\n{context}\n\n"
-                f"Question: {question}\n"
-                f"Answer:"
-            )
+    async def _fetch_documents(self, law_domain, years=None):
+        """Load [(file_name, text, page_offsets)] of the domain from MongoDB when there is no snapshot."""
+        with stage('document_lookup'):
+            pdf_files = await asyncio.to_thread(self.context_matcher.create_matching_context, law_domain, years)
+        if not pdf_files:
+            return []
 
-            response = self.model.generate_content(final_prompt)
-            answer = response.text.strip()
+        # Dokumenty są pobierane współbieżnie, a parsowanie PDF odbywa się w puli procesów
+        with stage('document_texts'):
+            documents = await asyncio.gather(
+                *(self.context_matcher.get_document_pages_async(pdf_file) for pdf_file in pdf_files))
+        return [(pdf_file, text, offsets) for pdf_file, (text, offsets) in zip(pdf_files, documents)]
+
+    def warmup(self):
+        """Create the Mongo indexes and load the corpus versions, so the first requests do not pay for them."""
+        self.context_matcher.ensure_indexes()
+        self.answer_cache.ensure_indexes()
+        self.refresh_corpus_versions()
+
+    def refresh_corpus_versions(self):
+        """Drop cached answers, texts and the chunk index of domains that were re-ingested."""
+        self.corpus_versions = self.context_matcher.get_corpus_versions()
+        changed = self.answer_cache.sync_corpus_versions(self.corpus_versions)
+        if changed:
+            print(f"Re-ingested law domains: {', '.join(changed)}")
+            self.context_matcher.invalidate_text_cache()
+            self.chunk_matcher.reload()
+        return changed
+
+    def get_stats(self):
+        """Return runtime metrics of the caches and the local domain classifier."""
+        return {
+            'domain_classifier': self.domain_classifier.stats(),
+            'text_cache': self.context_matcher.text_cache.stats(),
+            'answer_cache': self.answer_cache.stats(),
+            'context_builder': self.context_builder.stats(),
+            'snapshots': self.snapshots.stats(),
+            'coalescer': self.coalescer.stats(),
+            'domain_batcher': self.domain_batcher.stats(),
+            'prompt_cache': self.prompt_cache.stats() if self.prompt_cache is not None else None,
+        }
+
+    async def _prepare_prompt(self, question, law_domain, years=None):
+        """Build the context for the matched law domain; returns (sources, final_prompt)."""
+        context, sources = await self._build_context(law_domain, question, years)
+        return sources, self._prompt_prefix(law_domain, context) + self._question_prompt(question)
+
+    @staticmethod
+    def _prompt_prefix(law_domain, context):
+        return (
+            f"You are a legal assistant specializing in {law_domain}.\n"
+            f"Based on the following documents, answer the user's question.\n"
+            f"Cite the documents you rely on by their file name and page numbers given in the brackets.\n\n"
+            f"Documents:\n{context}\n\n"
+        )
+
+    @staticmethod
+    def _question_prompt(question):
+        return f"Question: {question}\nAnswer:"
+
+    async def _build_domain_prefix(self, law_domain, years):
+        """Build the question-independent prefix from all documents of the domain and years.
+
+        Returns (None, None) when they do not fit the prefix budget: a prefix cut to the budget would
+        drop documents regardless of the question, so such domains are answered from ranked chunks.
+        """
+        documents = await self._load_domain_documents(law_domain, years)
+        if not documents:
+            raise Exception(f"No PDF files found for law domain: {law_domain}")
+        # Same teksty, bez nagłówków fragmentów, są dolnym oszacowaniem - za duża dziedzina nie jest dzielona na fragmenty
+        if sum(estimate_tokens(text) for _, text, _ in documents) > self.prefix_builder.token_budget:
+            return None, None
+        page_offsets = {file_name: offsets for file_name, _, offsets in documents if offsets}
+        with stage('prefix_build'):
+            chunks = self.prefix_builder.rank_documents("", [(file_name, text) for file_name, text, _ in documents],
+                                                        page_offsets)
+            needed = sum(estimate_tokens(f"[{chunk['file_name']}{format_pages(chunk.get('pages'))}]\n")
+                         + estimate_tokens(chunk['text']) for chunk in chunks)
+            if needed > self.prefix_builder.token_budget:
+                return None, None
+            result = self.prefix_builder.build(chunks)
+        return self._prompt_prefix(law_domain, result['context']), result['sources']
+
+    async def _answer_with_cached_prefix(self, question, law_domain, years):
+        """Answer using the cached domain prefix, sending only the question; returns (answer, sources),
+        or None when the domain is too large for a prefix."""
+        for attempt in range(2):
+            entry = await self.prompt_cache.get(law_domain, years, self.corpus_versions.get(law_domain),
+                                                lambda: self._build_domain_prefix(law_domain, years))
+            if entry['handle'] is None and entry['prefix'] is None:
+                return None
+            prompt = self._question_prompt(question)
+            if entry['handle'] is None:
+                return await self._generate('answer', entry['prefix'] + prompt), entry['sources']
+            try:
+                return await self._generate('answer', prompt, prefix_handle=entry['handle']), entry['sources']
+            except PrefixNotFound:
+                # Prefiks wygasł lub został usunięty po stronie modelu - jest tworzony ponownie, raz
+                await self.prompt_cache.invalidate(law_domain)
+                if attempt:
+                    raise
+
+    async def get_model_response_async(self, question, years=None):
+        """Main method to get the model's response to the user's question without blocking the event loop.
+
+        years limits the documents to the range they span; None searches all years. Identical questions
+        asked at the same time share one pipeline run.
+        """
+        key = (normalize_question(question), years_key(years))
+        return await self.coalescer.run(key, self._answer_question, question, years)
+
+    async def _answer_question(self, question, years):
+        try:
+            law_domain = await with_deadline('domain', self._classify_law_domain(question), DOMAIN_TIMEOUT_SECONDS)
+            print(f"Matched Law Domain: {law_domain}")
+
+            cached = await self._get_cached_answer(question, law_domain, years)
+            if cached is not None:
+                return cached['answer']
+
+            cached_prefix_answer = None
+            if self.prompt_cache is not None:
+                # Budowa prefiksu przy pierwszym użyciu obejmuje też wyszukiwanie dokumentów
+                cached_prefix_answer = await with_deadline(
+                    'generation', self._answer_with_cached_prefix(question, law_domain, years),
+                    RETRIEVAL_TIMEOUT_SECONDS + GENERATION_TIMEOUT_SECONDS)
+            if cached_prefix_answer is not None:
+                response_text, sources = cached_prefix_answer
+            else:
+                sources, final_prompt = await with_deadline(
+                    'retrieval', self._prepare_prompt(question, law_domain, years), RETRIEVAL_TIMEOUT_SECONDS)
+                response_text = await with_deadline(
+                    'generation', self._generate('answer', final_prompt), GENERATION_TIMEOUT_SECONDS)
+            answer = response_text.strip()
+            await asyncio.to_thread(self.answer_cache.put, question, law_domain, answer, sources, years)
             return answer
 
+        except StageTimeout:
+            raise
         except Exception as e:
-            return f"An error occurred: {e}"
\ No newline at end of file
+            return f"An error occurred: {e}"
+
+    async def get_model_response_stream(self, question, years=None):
+        """Yield (event, data) pairs: 'meta' with the domain and sources, then 'token' pieces and 'done'."""
+        try:
+            law_domain = await with_deadline('domain', self._classify_law_domain(question), DOMAIN_TIMEOUT_SECONDS)
+
+            cached = await self._get_cached_answer(question, law_domain, years)
+            if cached is not None:
+                yield 'meta', {'domain': law_domain, 'sources': cached['sources']}
+                yield 'token', {'text': cached['answer']}
+                yield 'done', {}
+                return
+
+            sources, final_prompt = await with_deadline(
+                'retrieval', self._prepare_prompt(question, law_domain, years), RETRIEVAL_TIMEOUT_SECONDS)
+            yield 'meta', {'domain': law_domain, 'sources': sources}
+
+            pieces = []
+            self._record_prompt('answer', final_prompt)
+            try:
+                with stage('llm_answer_stream'):
+                    answer_stream = self.llm_client.generate_stream_async(final_prompt)
+                    async for text in iterate_with_deadline('generation', answer_stream, GENERATION_TIMEOUT_SECONDS):
+                        if text:
+                            pieces.append(text)
+                            yield 'token', {'text': text}
+            except Exception:
+                LLM_ERRORS.labels('answer').inc()
+                raise
+            yield 'done', {}
+
+            await asyncio.to_thread(self.answer_cache.put, question, law_domain, "".join(pieces).strip(), sources,
+                                    years)
+
+        except Exception as e:
+            yield 'error', {'detail': f"An error occurred: {e}"}
+
+    def get_model_response(self, question, years=None):
+        """Synchronous wrapper around get_model_response_async for scripts and tests."""
+        return asyncio.run(self.get_model_response_async(question, years))
@@ -0,0 +1,155 @@
+import asyncio
+import datetime
+import importlib
+import os
+import time
+from abc import ABC, abstractmethod
+
+# vertex, stub albo ścieżka własnej klasy w postaci "pakiet.moduł:Klasa"
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'vertex')
+VERTEX_PROJECT = os.environ.get('VERTEX_PROJECT', 'gentle-cable-441612-q2')
+VERTEX_LOCATION = os.environ.get('VERTEX_LOCATION', 'europe-central2')
+VERTEX_MODEL = os.environ.get('VERTEX_MODEL', 'gemini-1.5-flash-002')
+STUB_LLM_LATENCY = float(os.environ.get('STUB_LLM_LATENCY', '0'))
+
+
+class PrefixNotFound(Exception):
+    """The cached prompt prefix no longer exists on the model side (expired or evicted)."""
+
+
+class LLMClient(ABC):
+    """Minimal text-in/text-out interface over a language model."""
+
+    @abstractmethod
+    def generate(self, prompt):
+        pass
+
+    @abstractmethod
+    async def generate_async(self, prompt):
+        pass
+
+    async def generate_stream_async(self, prompt):
+        """Yield the answer in pieces as the model produces them; by default as a single piece."""
+        yield await self.generate_async(prompt)
+
+
+class PrefixCachingLLMClient(LLMClient):
+    """Language model that can keep a stable prompt prefix on its side and answer prompts following it."""
+
+    @abstractmethod
+    async def create_prefix_async(self, prefix, ttl):
+        """Store a stable prompt prefix for ttl seconds; returns a handle for generate_with_prefix_async."""
+
+    @abstractmethod
+    async def generate_with_prefix_async(self, handle, prompt):
+        """Answer the cached prefix followed by the prompt; raises PrefixNotFound for an unknown handle."""
+
+    @abstractmethod
+    async def delete_prefix_async(self, handle):
+        pass
+
+
+class VertexAILLMClient(PrefixCachingLLMClient):
+    def __init__(self, model, model_name=VERTEX_MODEL):
+        self.model = model
+        self.model_name = model_name
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    async def generate_async(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def generate_stream_async(self, prompt):
+        responses = await self.model.generate_content_async(prompt, stream=True)
+        async for response in responses:
+            yield response.text
+
+    async def create_prefix_async(self, prefix, ttl):
+        from vertexai.preview import caching
+
+        return await asyncio.to_thread(caching.CachedContent.create, model_name=self.model_name, contents=[prefix],
+                                       ttl=datetime.timedelta(seconds=ttl))
+
+    async def generate_with_prefix_async(self, handle, prompt):
+        from google.api_core.exceptions import NotFound
+        from vertexai.preview.generative_models import GenerativeModel
+
+        try:
+            response = await GenerativeModel.from_cached_content(cached_content=handle).generate_content_async(prompt)
+        except NotFound as e:
+            raise PrefixNotFound(str(e)) from e
+        return response.text
+
+    async def delete_prefix_async(self, handle):
+        await asyncio.to_thread(handle.delete)
+
+
+class StubLLMClient(PrefixCachingLLMClient):
+    """Language model stand-in with a fixed answer and a configurable latency, for tests and load tests.
+
+    Cached prefixes are kept in a local dictionary; prompts records only what was sent with each call.
+    """
+
+    def __init__(self, response="Odpowiedź testowa.", latency=0.0):
+        self.response = response
+        self.latency = latency
+        self.prompts = []
+        self.prefixes = {}
+        self.prefixes_created = 0
+
+    def _answer(self, prompt, prefix=""):
+        self.prompts.append(prompt)
+        return self.response(prefix + prompt) if callable(self.response) else self.response
+
+    def generate(self, prompt):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def generate_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def generate_stream_async(self, prompt):
+        words = self._answer(prompt).split(' ')
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else f" {word}"
+
+    async def create_prefix_async(self, prefix, ttl):
+        self.prefixes_created += 1
+        handle = f"prefix-{self.prefixes_created}"
+        self.prefixes[handle] = prefix
+        return handle
+
+    async def generate_with_prefix_async(self, handle, prompt):
+        if handle not in self.prefixes:
+            raise PrefixNotFound(f"Unknown cached prefix: {handle}")
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt, self.prefixes[handle])
+
+    async def delete_prefix_async(self, handle):
+        self.prefixes.pop(handle, None)
+
+
+def create_vertex_client():
+    # Import vertexai trwa kilka sekund, dlatego odbywa się dopiero przy tworzeniu klienta
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
+
+    vertexai.init(project=VERTEX_PROJECT, location=VERTEX_LOCATION)
+    return VertexAILLMClient(GenerativeModel(VERTEX_MODEL), VERTEX_MODEL)
+
+
+def create_llm_client(backend=None):
+    """Create the language model client selected by LLM_BACKEND."""
+    backend = backend or LLM_BACKEND
+    if backend == 'vertex':
+        return create_vertex_client()
+    if backend == 'stub':
+        return StubLLMClient(latency=STUB_LLM_LATENCY)
+    if ':' in backend:
+        module_name, class_name = backend.split(':', 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,132 @@
+import cProfile
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Żądania dłuższe niż próg są logowane z rozbiciem na etapy (0 wyłącza)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '5'))
+# Ułamek żądań uruchamianych pod profilerem; profil zapisywany jest tylko dla wolnych żądań
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+# cprofile albo pyinstrument (o ile jest zainstalowany)
+PROFILER = os.environ.get('PROFILER', 'cprofile')
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram('chatbot_request_seconds', "HTTP request latency.", ['path'], buckets=LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram('chatbot_stage_seconds', "Latency of the /ask pipeline stages.", ['stage'],
+                          buckets=LATENCY_BUCKETS)
+DOCUMENTS_LOADED = Counter('chatbot_documents_loaded_total', "Document texts loaded, by where they came from.",
+                           ['source'])
+BYTES_FETCHED = Counter('chatbot_pdf_bytes_fetched_total', "Bytes of PDF files fetched from MongoDB.")
+PROMPT_CHARACTERS = Counter('chatbot_prompt_characters_total', "Characters of the prompts sent to the model.",
+                            ['call'])
+PROMPT_TOKENS = Counter('chatbot_prompt_tokens_total', "Approximate tokens of the prompts sent to the model.",
+                        ['call'])
+CACHE_LOOKUPS = Counter('chatbot_cache_lookups_total', "Cache lookups by cache and result.", ['cache', 'result'])
+LLM_ERRORS = Counter('chatbot_llm_errors_total', "Failed language model calls.", ['call'])
+# W trybie wieloprocesowym wartości bieżących procesów roboczych są sumowane
+QUEUE_DEPTH = Gauge('chatbot_admission_queue_depth', "Requests waiting for a free slot.", multiprocess_mode='livesum')
+IN_FLIGHT = Gauge('chatbot_admission_in_flight', "Requests being processed.", multiprocess_mode='livesum')
+ADMISSION_REJECTIONS = Counter('chatbot_admission_rejections_total', "Requests rejected because of overload.",
+                               ['reason'])
+STAGE_TIMEOUTS = Counter('chatbot_stage_timeouts_total', "Pipeline stages cancelled after their deadline.", ['stage'])
+
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+_profiling_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into the stage histogram and the breakdown of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(name).observe(elapsed)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+
+def metrics_response_body():
+    # Przy kilku procesach roboczych (PROMETHEUS_MULTIPROC_DIR) sumowane są metryki zapisane przez wszystkie procesy
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class RequestTrace:
+    """Collects the stage breakdown of one request and, when sampled, profiles it.
+
+    cProfile and pyinstrument see the whole event loop thread, so a profile may include other requests
+    handled at the same time; only one request is profiled at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        self.profiler = None
+        self._token = None
+        self._start = None
+
+    def __enter__(self):
+        self._token = _request_stages.set(self.stages)
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE and _profiling_lock.acquire(False):
+            self.profiler = self._start_profiler()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = time.perf_counter() - self._start
+        _request_stages.reset(self._token)
+        REQUEST_LATENCY.labels(self.path).observe(elapsed)
+
+        slow = SLOW_REQUEST_SECONDS > 0 and elapsed >= SLOW_REQUEST_SECONDS
+        if slow:
+            breakdown = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items())
+            print(f"Slow request {self.path}: {elapsed * 1000:.0f}ms ({breakdown})")
+        if self.profiler is not None:
+            try:
+                self._stop_profiler(save=slow)
+            finally:
+                _profiling_lock.release()
+        return False
+
+    @staticmethod
+    def _start_profiler():
+        if PROFILER == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode='disabled')
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, save):
+        if PROFILER == 'pyinstrument':
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        if not save:
+            return
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.path.strip('/').replace('/', '_') or 'root'}"
+        if PROFILER == 'pyinstrument':
+            path = os.path.join(PROFILE_DIR, f"{name}.html")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(self.profiler.output_html())
+        else:
+            path = os.path.join(PROFILE_DIR, f"{name}.prof")
+            self.profiler.dump_stats(path)
+        print(f"Saved profile of slow request to {path}")
@@ -1,27 +1,220 @@
 import os
+import shutil
+import asyncio
+import hashlib
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 import fitz
-from pymongo import MongoClient
+import gridfs
+from pymongo import MongoClient, monitoring
+from .LRUCache import LRUCache
+from .Metrics import BYTES_FETCHED, CACHE_LOOKUPS, DOCUMENTS_LOADED, stage
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+TEXT_CACHE_SIZE = int(os.environ.get('TEXT_CACHE_SIZE', '256'))
+# Pliki PDF trzymane są w GridFS pod identyfikatorem równym skrótowi sha256 zawartości
+PDF_FILES_BUCKET = 'ustawy_files'
+# Domyślnie pobierane są tylko metadane dokumentów, bez pliku i tekstu
+METADATA_PROJECTION = {'file_data': 0, 'text': 0}
+# 0 oznacza parsowanie PDF w domyślnej puli wątków zamiast w osobnych procesach
+PDF_PARSE_WORKERS = int(os.environ.get('PDF_PARSE_WORKERS', str(os.cpu_count() or 1)))
+
+_parse_pool = None
+_mongo_client = None
+_mongo_client_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events of the shared client for the readiness check."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _add(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add('pool_clears')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add('open_connections')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add('open_connections', -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add('checkout_failures')
+
+    def connection_checked_out(self, event):
+        self._add('checked_out')
+        self._add('checkouts')
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'pool_clears': self.pool_clears,
+                'max_pool_size': MONGO_MAX_POOL_SIZE,
+            }
+
+
+pool_stats = PoolStatsListener()
+
+
+def get_mongo_client():
+    """Return the process-wide MongoClient; all handlers share its connection pool."""
+    global _mongo_client
+    with _mongo_client_lock:
+        if _mongo_client is None:
+            _mongo_client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[pool_stats],
+            )
+        return _mongo_client
+
+
+def close_mongo_client():
+    global _mongo_client
+    with _mongo_client_lock:
+        if _mongo_client is not None:
+            _mongo_client.close()
+            _mongo_client = None
+
+
+def check_mongo_ready():
+    """Ping the server through the shared client; returns the round trip time and pool stats."""
+    start = time.perf_counter()
+    get_mongo_client().admin.command('ping')
+    return {'ping_ms': (time.perf_counter() - start) * 1000, 'pool': pool_stats.stats()}
+
+
+def get_parse_pool():
+    """Return the process pool used for CPU-bound PDF parsing, creating it on first use."""
+    global _parse_pool
+    if _parse_pool is None and PDF_PARSE_WORKERS > 0:
+        _parse_pool = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS)
+    return _parse_pool
+
+
+def compute_content_hash(data):
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def year_filter(years):
+    """Return the Mongo condition restricting documents to the range spanned by years, or {} for all years."""
+    if not years:
+        return {}
+    return {'year': {'$gte': min(years), '$lte': max(years)}}
+
+
+def iter_page_texts(source):
+    """Yield the text of every page of a PDF given as bytes or as a path, holding one page at a time."""
+    opened = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    with opened as doc:
+        for page in doc:
+            yield page.get_text()
+
+
+def join_pages(page_texts):
+    """Join page texts into the document text; returns (text, page_offsets), where page_offsets[i]
+    is the character offset in the text at which page i + 1 starts."""
+    parts, page_offsets, position = [], [], 0
+    for page_text in page_texts:
+        page_offsets.append(position)
+        parts.append(page_text)
+        position += len(page_text)
+    return "".join(parts), page_offsets
+
+
+def extract_pages_from_bytes(pdf_data):
+    return join_pages(iter_page_texts(pdf_data))
+
+
+def extract_pages_from_source(source):
+    """Extract (text, page_offsets) from PDF bytes or from a path to a PDF file on disk."""
+    if isinstance(source, str):
+        return join_pages(iter_page_texts(source))
+    return extract_pages_from_bytes(source)
 
 
 class MongoDBHandler:
-    def __init__(self, db_name='chatbot_db', collection_name='ustawy'):
-        self.client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017'))
+    def __init__(self, db_name='chatbot_db', collection_name='ustawy', text_cache_size=TEXT_CACHE_SIZE):
+        self.client = get_mongo_client()
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
+        self.text_cache = LRUCache(maxsize=text_cache_size)
+        self._fs = None
+
+    @property
+    def fs(self):
+        if self._fs is None:
+            self._fs = gridfs.GridFS(self.db, collection=PDF_FILES_BUCKET)
+        return self._fs
 
-    def get_all_documents(self):
-        return list(self.collection.find())
+    def ensure_indexes(self):
+        self.collection.create_index('file_name')
+        self.collection.create_index('content_hash')
+        # Indeks złożony obsługuje też zapytania po samej dziedzinie prawa; zawężane są one do zakresu lat
+        self.collection.create_index([('legal_field', 1), ('year', 1)])
 
-    def get_document_by_file_name(self, file_name):
-        return self.collection.find_one({'file_name': file_name})
+    def get_all_documents(self, projection=METADATA_PROJECTION):
+        return list(self.collection.find({}, projection))
+
+    def get_document_by_file_name(self, file_name, projection=METADATA_PROJECTION):
+        return self.collection.find_one({'file_name': file_name}, projection)
 
     def save_pdf_from_database(self, file_name, output_dir):
-        document = self.collection.find_one({'file_name': file_name})
-        if document and 'file_data' in document:
-            binary_data = document['file_data']
+        document = self.collection.find_one({'file_name': file_name}, {'file_id': 1, 'file_data': 1})
+        if document and ('file_id' in document or 'file_data' in document):
             output_path = os.path.join(output_dir, file_name)
             with open(output_path, 'wb') as f:
-                f.write(binary_data)
+                if 'file_id' in document:
+                    # Plik z GridFS kopiowany jest porcjami, bez wczytywania całości do pamięci
+                    shutil.copyfileobj(self.fs.get(document['file_id']), f)
+                else:
+                    f.write(document['file_data'])
             print(f"File saved to {output_path}")
         else:
             print("Document not found or does not contain file data.")
@@ -33,22 +226,131 @@ class MongoDBHandler:
         else:
             print("Document not found.")
 
-    # Pobiera plik PDF jako dane binarne z bazy danych i zwraca jego zawartość tekstową.
+    # Zwraca zawartość tekstową dokumentu. Tekst jest brany kolejno z pamięci podręcznej LRU,
+    # z pola 'text' zapisanego przy imporcie, a dopiero w ostateczności parsowany z danych binarnych PDF
+    # i zapisywany w bazie, aby kolejne zapytania nie musiały go ponownie parsować.
     def get_text_from_binary_pdf(self, file_name):
-        document = self.collection.find_one({'file_name': file_name}, {'file_data': 1})
-        if not document or 'file_data' not in document:
-            print("Dokument nie został znaleziony lub nie zawiera danych pliku.")
-            return None
+        text, _ = self.get_document_pages(file_name)
+        return text
 
-        pdf_data = document['file_data']
-        text = ""
-        with fitz.open(stream=pdf_data, filetype="pdf") as doc:
-            for page in doc:
-                text += page.get_text()
+    def get_document_pages(self, file_name):
+        """Return (text, page_offsets) of the document; page_offsets is None for texts stored without pages."""
+        cached = self._get_cached_text(file_name)
+        if cached is not None:
+            return cached
 
-        return text
+        pages, pdf_source, content_hash = self._find_pages(file_name)
+        if pdf_source is not None:
+            with self._parsing(pdf_source):
+                pages = extract_pages_from_source(pdf_source)
+            self._store_text(file_name, content_hash, *pages)
+        return self._cache_pages(file_name, pages)
+
+    # Wersja asynchroniczna: zapytania do bazy wykonywane są w wątkach, a parsowanie PDF w puli procesów.
+    async def get_document_pages_async(self, file_name):
+        cached = self._get_cached_text(file_name)
+        if cached is not None:
+            return cached
+
+        pages, pdf_source, content_hash = await asyncio.to_thread(self._find_pages, file_name)
+        if pdf_source is not None:
+            with self._parsing(pdf_source):
+                source = pdf_source if isinstance(pdf_source, str) else bytes(pdf_source)
+                pages = await asyncio.get_running_loop().run_in_executor(
+                    get_parse_pool(), extract_pages_from_source, source)
+            await asyncio.to_thread(self._store_text, file_name, content_hash, *pages)
+        return self._cache_pages(file_name, pages)
+
+    def _get_cached_text(self, file_name):
+        cached = self.text_cache.get(file_name)
+        CACHE_LOOKUPS.labels('text', 'miss' if cached is None else 'hit').inc()
+        if cached is not None:
+            DOCUMENTS_LOADED.labels('text_cache').inc()
+        return cached
+
+    def _find_pages(self, file_name):
+        """Look up the stored text of the document; returns (pages, pdf_source, content_hash).
+
+        pages is (text, page_offsets) when the text was stored at ingest; otherwise it is (None, None) and
+        pdf_source is the PDF to parse, or None when the document is missing.
+        """
+        with stage('mongo_text'):
+            document = self._find_stored_text(file_name)
+        if document and document.get('text') is not None:
+            DOCUMENTS_LOADED.labels('stored_text').inc()
+            return (document['text'], document.get('page_offsets')), None, None
+
+        if document:
+            with stage('mongo_pdf'):
+                pdf_source, content_hash = self._find_pdf_source(file_name)
+            if pdf_source is not None:
+                return (None, None), pdf_source, content_hash
+        print("Dokument nie został znaleziony lub nie zawiera danych pliku.")
+        return (None, None), None, None
+
+    @contextmanager
+    def _parsing(self, pdf_source):
+        try:
+            with stage('pdf_parse'):
+                yield
+        finally:
+            self._release_pdf_source(pdf_source)
+
+    def _cache_pages(self, file_name, pages):
+        if pages[0] is not None:
+            self.text_cache.put(file_name, pages)
+        return pages
+
+    def _find_stored_text(self, file_name):
+        return self.collection.find_one({'file_name': file_name}, {'text': 1, 'page_offsets': 1, 'content_hash': 1})
+
+    def _find_pdf_source(self, file_name):
+        """Return (source, content_hash): a temporary file streamed from GridFS, or the legacy inline bytes."""
+        document = self.collection.find_one({'file_name': file_name}, {'file_id': 1, 'file_data': 1, 'content_hash': 1})
+        if not document:
+            return None, None
+
+        if 'file_id' in document:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
+                shutil.copyfileobj(self.fs.get(document['file_id']), tmp_file)
+                BYTES_FETCHED.inc(tmp_file.tell())
+            DOCUMENTS_LOADED.labels('pdf').inc()
+            return tmp_file.name, document.get('content_hash')
+
+        if 'file_data' in document:
+            pdf_data = document['file_data']
+            BYTES_FETCHED.inc(len(pdf_data))
+            DOCUMENTS_LOADED.labels('pdf').inc()
+            return pdf_data, document.get('content_hash') or compute_content_hash(pdf_data)
+
+        return None, None
+
+    @staticmethod
+    def _release_pdf_source(pdf_source):
+        if isinstance(pdf_source, str) and os.path.exists(pdf_source):
+            os.remove(pdf_source)
+
+    def _store_text(self, file_name, content_hash, text, page_offsets=None):
+        document = {'text': text, 'content_hash': content_hash}
+        if page_offsets is not None:
+            document['page_offsets'] = page_offsets
+        self.collection.update_one({'file_name': file_name}, {'$set': document})
+
+    def invalidate_text_cache(self, file_name=None):
+        if file_name is None:
+            self.text_cache.clear()
+        else:
+            self.text_cache.pop(file_name)
+
+    # Wersje korpusu dla dziedzin prawa, podbijane przez load_pdfs przy każdym ponownym imporcie
+    def get_corpus_versions(self):
+        return {doc['_id']: doc['version'] for doc in self.db['corpus_versions'].find()}
 
-    def get_files_by_legal_field(self, legal_field_value):
-        documents = self.collection.find({'legal_field': legal_field_value}, {'file_name': 1})
+    def get_files_by_legal_field(self, legal_field_value, years=None, include_superseded=False):
+        """File names of the law domain within the years; versions superseded by a later one are skipped."""
+        query = {'legal_field': legal_field_value, **year_filter(years)}
+        if not include_superseded:
+            query['superseded_by'] = None
+        documents = self.collection.find(query, {'file_name': 1})
         file_names = [doc['file_name'] for doc in documents]
         return file_names
@@ -0,0 +1,100 @@
+import os
+import time
+from .AnswerCache import years_key
+from .ContextBuilder import estimate_tokens
+from .RequestBatching import RequestCoalescer
+
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', '0') == '1'
+PROMPT_CACHE_TTL = int(os.environ.get('PROMPT_CACHE_TTL', '3600'))
+PROMPT_CACHE_IDLE_SECONDS = int(os.environ.get('PROMPT_CACHE_IDLE_SECONDS', '900'))
+# Vertex AI przyjmuje do pamięci podręcznej dopiero treść o długości co najmniej 32768 tokenów
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get('PROMPT_CACHE_MIN_TOKENS', '32768'))
+PROMPT_CACHE_TOKEN_BUDGET = int(os.environ.get('PROMPT_CACHE_TOKEN_BUDGET', '200000'))
+
+
+class PromptPrefixCache:
+    """Stable prompt prefixes (preamble and documents of a law domain) kept on the model side.
+
+    Entries are keyed on the law domain and year range and remember the corpus version they were built from;
+    a prefix is created on first use, rebuilt when the corpus version changes or its ttl runs out, and deleted
+    after idle_seconds without use. Prefixes shorter than min_tokens are kept locally and sent in full.
+    build_prefix may return (None, None) for a domain that does not fit one prefix; the entry then has
+    neither a handle nor a prefix and is kept until the corpus version changes, regardless of ttl and idle time,
+    so the documents of the domain are not loaded again to find out that they still do not fit.
+    """
+
+    def __init__(self, llm_client, ttl=PROMPT_CACHE_TTL, idle_seconds=PROMPT_CACHE_IDLE_SECONDS,
+                 min_tokens=PROMPT_CACHE_MIN_TOKENS):
+        self.llm_client = llm_client
+        self.ttl = ttl
+        self.idle_seconds = idle_seconds
+        self.min_tokens = min_tokens
+        self.entries = {}
+        self.coalescer = RequestCoalescer()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, law_domain, years, version, build_prefix):
+        """Return the entry {'handle', 'prefix', 'sources', ...} for the domain and years.
+
+        build_prefix is a coroutine function returning (prefix, sources); concurrent misses share one build.
+        """
+        await self.evict_idle()
+        key = (law_domain, years_key(years))
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry['version'] == version and (
+                not self._fits(entry) or now - entry['created'] < self.ttl):
+            entry['last_used'] = now
+            self.hits += 1
+            return entry
+        return await self.coalescer.run((key, version), self._create, key, version, build_prefix)
+
+    async def _create(self, key, version, build_prefix):
+        self.misses += 1
+        await self._delete(key)
+        prefix, sources = await build_prefix()
+        handle = None
+        if prefix is not None and estimate_tokens(prefix) >= self.min_tokens:
+            handle = await self.llm_client.create_prefix_async(prefix, self.ttl)
+        now = time.monotonic()
+        entry = self.entries[key] = {'version': version, 'handle': handle, 'sources': sources,
+                                     'prefix': None if handle is not None else prefix,
+                                     'created': now, 'last_used': now}
+        return entry
+
+    @staticmethod
+    def _fits(entry):
+        return entry['handle'] is not None or entry['prefix'] is not None
+
+    async def _delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None or entry['handle'] is None:
+            return
+        try:
+            await self.llm_client.delete_prefix_async(entry['handle'])
+        except Exception as e:
+            # Wpis po stronie modelu i tak wygaśnie po upływie ttl
+            print(f"Error deleting cached prompt prefix: {e}")
+
+    async def invalidate(self, law_domain):
+        for key in [key for key in self.entries if key[0] == law_domain]:
+            await self._delete(key)
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        idle = [key for key, entry in self.entries.items()
+                if self._fits(entry) and now - entry['last_used'] > self.idle_seconds]
+        for key in idle:
+            await self._delete(key)
+        self.evictions += len(idle)
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'remote': sum(entry['handle'] is not None for entry in self.entries.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import threading
+import time
+
+from .GenerateResponseService import LanguageModelService
+from .MongoDBHandler import close_mongo_client
+
+# Co ile sekund ponawiać rozgrzewanie, gdy zależności (np. MongoDB) są niedostępne
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', '10'))
+
+
+class ServiceContainer:
+    """Holds the backend services, builds them on first use and warms them up in the background.
+
+    The application starts serving immediately; requests that arrive before the warm-up wait for the services
+    to be built, and readiness is reported only once the warm-up succeeded.
+    """
+
+    def __init__(self, factory=LanguageModelService, retry_seconds=WARMUP_RETRY_SECONDS):
+        self.factory = factory
+        self.retry_seconds = retry_seconds
+        self._model = None
+        self._lock = threading.Lock()
+        self._warmup_task = None
+        self.ready = False
+        self.error = None
+        self.warmup_seconds = None
+
+    def get_model(self):
+        """Return the LanguageModelService, building it on the first call."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.factory()
+        return self._model
+
+    async def get_model_async(self):
+        if self._model is not None:
+            return self._model
+        return await asyncio.to_thread(self.get_model)
+
+    async def warmup(self):
+        start = time.perf_counter()
+        while True:
+            try:
+                model = await self.get_model_async()
+                await asyncio.to_thread(model.warmup)
+                break
+            except Exception as e:
+                self.error = str(e)
+                print(f"Service warm-up failed, retrying in {self.retry_seconds}s: {e}")
+                await asyncio.sleep(self.retry_seconds)
+
+        self.error = None
+        self.ready = True
+        self.warmup_seconds = time.perf_counter() - start
+        print(f"Services ready after {self.warmup_seconds:.2f}s")
+
+    def start(self):
+        self._warmup_task = asyncio.create_task(self.warmup())
+        return self._warmup_task
+
+    async def close(self):
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        close_mongo_client()
+
+    def status(self):
+        return {
+            'initialized': self._model is not None,
+            'warmed_up': self.ready,
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.error,
+        }
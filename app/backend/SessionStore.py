@@ -0,0 +1,61 @@
+import datetime
+import os
+import secrets
+from .LRUCache import LRUCache
+from .MongoDBHandler import get_mongo_client
+
+# memory - ustawienia w pamięci procesu (jeden proces roboczy), mongo - wspólne dla wszystkich procesów
+SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')
+SESSION_COOKIE = 'session_id'
+SESSION_TTL = int(os.environ.get('SESSION_TTL', str(30 * 24 * 3600)))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+
+
+def new_session_id():
+    return secrets.token_urlsafe(24)
+
+
+class SessionStore:
+    """Per-session settings (the selected range of years) keyed by the session cookie.
+
+    Without a collection the settings live in this process only; with a Mongo collection they are shared
+    by all workers and expire ttl seconds after the last change.
+    """
+
+    def __init__(self, collection=None, ttl=SESSION_TTL, maxsize=SESSION_CACHE_SIZE):
+        self.collection = collection
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def ensure_indexes(self):
+        if self.collection is not None:
+            self.collection.create_index('updated_at', expireAfterSeconds=self.ttl)
+
+    def get_years(self, session_id):
+        """Return the years stored for the session, or None for an unknown session."""
+        if not session_id:
+            return None
+        if self.collection is None:
+            return self.local.get(session_id)
+        document = self.collection.find_one({'_id': session_id}, {'years': 1})
+        return document.get('years') if document else None
+
+    def set_years(self, session_id, years):
+        if self.collection is None:
+            self.local.put(session_id, years)
+            return
+        self.collection.update_one(
+            {'_id': session_id},
+            {'$set': {'years': years, 'updated_at': datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True)
+
+
+def create_session_store(backend=None):
+    """Create the session store selected by SESSION_STORE."""
+    backend = backend or SESSION_STORE
+    if backend == 'memory':
+        return SessionStore()
+    if backend == 'mongo':
+        db = get_mongo_client()[os.environ.get('MONGO_DB_NAME', 'chatbot_db')]
+        return SessionStore(collection=db['sessions'])
+    raise ValueError(f"Unknown session store: {backend}")
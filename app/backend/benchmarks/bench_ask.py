@@ -0,0 +1,130 @@
+"""In-process load generator for POST /ask with a stub language model and mongomock.
+
+Generates (or reuses) a synthetic corpus, ingests it into the in-memory database, swaps the Vertex AI client for
+StubLLMClient with the given latency and sends concurrent requests through the ASGI app:
+
+    python -m app.backend.benchmarks.bench_ask --documents 100 --requests 500 --concurrency 32 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import contextlib
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+from ..AnswerCache import AnswerCache
+from ..DomainClassifier import DomainClassifier
+from ..GenerateResponseService import LAW_DOMAINS_PATH, LanguageModelService
+from ..LLMClient import StubLLMClient
+from ..helpers.load_pdfs import find_pdf_files, load_legal_fields
+from .bench_pipeline import sample_questions
+from .common import emit, percentiles
+from .in_memory import ingest_corpus, use_in_memory_mongo
+from .synthetic_corpus import generate_corpus
+
+def stub_response(law_domains):
+    """Answer the law domain prompts with a domain named in the question (first one otherwise) - one line
+    '<number>: <domain>' per question of a batched prompt - and anything else with a fixed answer."""
+    def pick(question):
+        return next((domain for domain in law_domains if domain in question), law_domains[0])
+
+    def respond(prompt):
+        if prompt.startswith("Given the following list of law domains"):
+            if "\nQuestions:\n" in prompt:
+                numbered = prompt.rsplit("\nQuestions:\n", 1)[-1]
+                return "\n".join(f"{number}: {pick(question)}" for number, question in
+                                 (line.split(". ", 1) for line in numbered.splitlines() if ". " in line))
+            return pick(prompt.rsplit("Question:", 1)[-1])
+        return "Odpowiedź wygenerowana przez model testowy."
+    return respond
+
+
+def read_law_domains():
+    with open(LAW_DOMAINS_PATH, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def load_app(index, llm_latency, answer_cache):
+    from .. import main
+
+    llm_client = StubLLMClient(response=stub_response(read_law_domains()), latency=llm_latency)
+    main.services.factory = lambda: LanguageModelService(llm_client=llm_client)
+    model = main.services.get_model()
+    model.chunk_matcher.index = index
+    model.domain_classifier = DomainClassifier.from_sources(model.law_domains, index=index)
+    if not answer_cache:
+        model.answer_cache = AnswerCache(maxsize=0)
+    return main.app, model
+
+
+async def run_load(app, questions, requests, concurrency, seed=5):
+    rng = random.Random(seed)
+    plan = [rng.choice(questions) for _ in range(requests)]
+    latencies, statuses, errors = [], {}, 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=None) as client:
+        async def worker():
+            nonlocal errors
+            while plan:
+                question = plan.pop()
+                start = time.perf_counter()
+                response = await client.post("/ask", json={"question": question})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code != 200 or response.json()['answer'].startswith("An error occurred"):
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'elapsed_s': elapsed,
+        'throughput_rps': requests / elapsed,
+        'errors': errors,
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+        'latency': percentiles(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus-dir', help="Istniejący katalog z PDF; domyślnie generowany jest korpus syntetyczny.")
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Opóźnienie modelu testowego w sekundach.")
+    parser.add_argument('--unique-questions', type=int, default=50)
+    parser.add_argument('--no-answer-cache', action='store_true')
+    parser.add_argument('--output', help="Plik JSON Lines, do którego dopisywany jest wynik.")
+    args = parser.parse_args(argv)
+
+    use_in_memory_mongo()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.corpus_dir:
+            pdf_files = find_pdf_files(args.corpus_dir)[:args.documents or None]
+        else:
+            pdf_files = [path for path, _ in generate_corpus(tmp_dir, documents=args.documents, pages=args.pages)]
+        ingest_start = time.perf_counter()
+        _, index, _ = ingest_corpus(pdf_files)
+        ingest_s = time.perf_counter() - ingest_start
+
+    app, model = load_app(index, args.llm_latency, not args.no_answer_cache)
+    questions = [question for _, question in sample_questions(load_legal_fields(), args.unique_questions)]
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run_load(app, questions, args.requests, args.concurrency))
+    results['ingest_s'] = ingest_s
+    results['service'] = model.get_stats()
+
+    emit('ask_load', vars(args), results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Benchmark of the Aho-Corasick keyword matcher against the original substring scan.
+
+Run from the repository root on the scraped Dziennik Ustaw PDFs:
+
+    python -m app.backend.benchmarks.bench_keyword_matcher --root-dir ./dziennik_ustaw --limit 200
+"""
+import argparse
+import json
+import sys
+import time
+
+from ..helpers.keyword_matcher import KeywordMatcher
+from ..helpers.load_pdfs import extract_text_from_pdf, find_pdf_files, load_legal_fields
+
+
+def naive_field_counts(text, legal_fields):
+    """The classify_legal_field scan before the automaton: text.lower() and a substring search per keyword."""
+    field_counts = {field: 0 for field in legal_fields}
+    for field, keywords in legal_fields.items():
+        for keyword in keywords:
+            if keyword.lower() in text.lower():
+                field_counts[field] += 1
+    return field_counts
+
+
+def run(texts, legal_fields, repeat=3):
+    build_start = time.perf_counter()
+    matcher = KeywordMatcher(legal_fields)
+    build_time = time.perf_counter() - build_start
+
+    timings = {'naive': float('inf'), 'aho_corasick': float('inf')}
+    mismatches = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        naive = [naive_field_counts(text, legal_fields) for text in texts]
+        timings['naive'] = min(timings['naive'], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        automaton = [matcher.count(text) for text in texts]
+        timings['aho_corasick'] = min(timings['aho_corasick'], time.perf_counter() - start)
+
+        mismatches = sum(first != second for first, second in zip(naive, automaton))
+
+    characters = sum(len(text) for text in texts)
+    return {
+        'documents': len(texts),
+        'characters': characters,
+        'automaton_build_ms': build_time * 1000,
+        'naive_s': timings['naive'],
+        'aho_corasick_s': timings['aho_corasick'],
+        'naive_mchars_per_s': characters / timings['naive'] / 1e6 if timings['naive'] else None,
+        'aho_corasick_mchars_per_s': characters / timings['aho_corasick'] / 1e6 if timings['aho_corasick'] else None,
+        'speedup': timings['naive'] / timings['aho_corasick'] if timings['aho_corasick'] else None,
+        'mismatches': mismatches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--root-dir', default='./dziennik_ustaw')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    pdf_files = sorted(find_pdf_files(args.root_dir))[:args.limit or None]
+    if not pdf_files:
+        print(f"Brak plików PDF w {args.root_dir} - uruchom najpierw helpers/scraper.py.", file=sys.stderr)
+        return 1
+
+    texts = [extract_text_from_pdf(pdf_path) for pdf_path in pdf_files]
+    print(json.dumps(run(texts, load_legal_fields(), repeat=args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
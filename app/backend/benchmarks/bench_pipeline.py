@@ -0,0 +1,113 @@
+"""Micro-benchmarks of the /ask pipeline stages on a synthetic corpus in mongomock.
+
+Covers keyword classification of ingested text, get_text_from_binary_pdf (parse from GridFS, stored text,
+LRU hit) and context assembly (BM25 chunks and the whole-file fallback):
+
+    python -m app.backend.benchmarks.bench_pipeline --documents 50 --pages 4 --output benchmarks.jsonl
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+
+from ..ContextBuilder import ContextBuilder
+from ..helpers.load_pdfs import classify_legal_field, get_keyword_matcher, load_legal_fields
+from .common import emit, measure
+from .in_memory import ingest_corpus, use_in_memory_mongo
+from .synthetic_corpus import generate_corpus
+
+
+def bench_classify(results, legal_fields, repeat):
+    matcher = get_keyword_matcher(legal_fields)
+    texts = [result['text'] for result in results]
+    rng = random.Random(1)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return measure(lambda: classify_legal_field(rng.choice(texts), matcher=matcher), repeat=repeat)
+
+
+def bench_get_text(handler, results, repeat):
+    file_names = [result['file_name'] for result in results]
+    rng = random.Random(2)
+
+    def parse_from_pdf():
+        file_name = rng.choice(file_names)
+        handler.collection.update_one({'file_name': file_name}, {'$unset': {'text': ''}})
+        handler.invalidate_text_cache(file_name)
+        handler.get_text_from_binary_pdf(file_name)
+
+    def stored_text():
+        file_name = rng.choice(file_names)
+        handler.invalidate_text_cache(file_name)
+        handler.get_text_from_binary_pdf(file_name)
+
+    def cache_hit():
+        handler.get_text_from_binary_pdf(file_names[0])
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return {
+            'parse_from_pdf': measure(parse_from_pdf, repeat=repeat),
+            'stored_text': measure(stored_text, repeat=repeat),
+            'cache_hit': measure(cache_hit, repeat=repeat),
+        }
+
+
+def bench_context(index, results, questions, repeat):
+    builder = ContextBuilder()
+    rng = random.Random(3)
+    by_field = {}
+    for result in results:
+        by_field.setdefault(result['legal_field'], []).append((result['file_name'], result['text']))
+
+    def from_chunks():
+        legal_field, question = rng.choice(questions)
+        builder.build(index.search(question, top_k=8, legal_field=legal_field))
+
+    def from_whole_files():
+        legal_field, question = rng.choice(questions)
+        builder.build(builder.rank_documents(question, by_field.get(legal_field, [])))
+
+    return {
+        'bm25_chunks': measure(from_chunks, repeat=repeat),
+        'whole_file_fallback': measure(from_whole_files, repeat=repeat),
+    }
+
+
+def sample_questions(legal_fields, count=50, seed=4):
+    rng = random.Random(seed)
+    fields = sorted(legal_fields)
+    questions = []
+    for _ in range(count):
+        legal_field = rng.choice(fields)
+        questions.append((legal_field, f"Jakie przepisy dotyczą {rng.choice(legal_fields[legal_field])}?"))
+    return questions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help="Plik JSON Lines, do którego dopisywany jest wynik.")
+    args = parser.parse_args(argv)
+
+    legal_fields = load_legal_fields()
+    use_in_memory_mongo()
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        generated = generate_corpus(corpus_dir, documents=args.documents, pages=args.pages)
+        handler, index, results = ingest_corpus([path for path, _ in generated])
+
+        questions = sample_questions(legal_fields)
+        report = {
+            'classify_legal_field': bench_classify(results, legal_fields, args.repeat),
+            'get_text_from_binary_pdf': bench_get_text(handler, results, args.repeat),
+            'context_assembly': bench_context(index, results, questions, args.repeat),
+        }
+
+    emit('pipeline', vars(args), report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Shared helpers of the benchmarks: timing, percentiles and JSON result records."""
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+
+def percentiles(samples):
+    """Summarize latency samples (seconds) in milliseconds: mean, min, max, p50, p95 and p99."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def rank(q):
+        # Percentyl metodą najbliższej rangi
+        return ordered[min(len(ordered), max(1, math.ceil(q * len(ordered)))) - 1] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'min_ms': ordered[0] * 1000,
+        'max_ms': ordered[-1] * 1000,
+        'p50_ms': rank(0.50),
+        'p95_ms': rank(0.95),
+        'p99_ms': rank(0.99),
+    }
+
+
+def measure(function, repeat=20, warmup=1):
+    """Call function repeat times (after warmup calls) and return the latency summary."""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def emit(benchmark, params, results, output=None):
+    """Print the result record as JSON and append it as one line to output, to compare runs across commits."""
+    record = {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': params,
+        'results': results,
+    }
+    print(json.dumps(record, indent=2, ensure_ascii=False))
+    if output:
+        with open(output, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
@@ -0,0 +1,37 @@
+"""In-process stand-ins used by the benchmarks: mongomock behind the shared Mongo client and an ingested corpus."""
+import contextlib
+import sys
+
+from .. import MongoDBHandler as mongo_handler_module
+from ..BM25Index import BM25Index
+from ..MongoDBHandler import MongoDBHandler
+from ..helpers.load_pdfs import _init_worker, build_upsert_requests, process_pdf, store_pdf_in_gridfs
+
+
+def use_in_memory_mongo():
+    """Make get_mongo_client() return a mongomock client, so every handler works on the in-memory database."""
+    import mongomock
+    import mongomock.gridfs
+
+    mongomock.gridfs.enable_gridfs_integration()
+    mongo_handler_module._mongo_client = mongomock.MongoClient()
+    return mongo_handler_module._mongo_client
+
+
+def ingest_corpus(pdf_paths):
+    """Load the PDFs the way load_pdfs does (GridFS, upserts, BM25 index); returns (handler, index, results)."""
+    _init_worker()
+    handler = MongoDBHandler()
+    handler.ensure_indexes()
+    index = BM25Index()
+    results = []
+    # classify_legal_field wypisuje liczniki słów kluczowych - na stdout trafia tylko wynik w JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        for pdf_path in pdf_paths:
+            result = process_pdf(pdf_path)
+            store_pdf_in_gridfs(handler.fs, result)
+            handler.collection.bulk_write(build_upsert_requests(result))
+            index.add_document(result['file_name'], result['text'], result['legal_field'],
+                               page_offsets=result['page_offsets'], year=result['year'])
+            results.append(result)
+    return handler, index, results
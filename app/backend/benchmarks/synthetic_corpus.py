@@ -0,0 +1,95 @@
+"""Generator of synthetic Dziennik Ustaw PDFs for benchmarks and load tests.
+
+Documents are written as {output_dir}/{year}/D{year}{journal:03}{position:04}01.pdf, the layout produced by the
+scraper, and contain Polish legal-style articles built around the keywords of one legal field:
+
+    python -m app.backend.benchmarks.synthetic_corpus --output-dir ./data/synthetic --documents 500 --pages 4
+"""
+import argparse
+import html
+import os
+import random
+
+import fitz
+
+from ..helpers.load_pdfs import load_legal_fields
+
+MONTHS = ["stycznia", "lutego", "marca", "kwietnia", "maja", "czerwca", "lipca", "sierpnia", "września",
+          "października", "listopada", "grudnia"]
+SENTENCES = [
+    "{Keyword} podlega ochronie na zasadach określonych w niniejszej ustawie.",
+    "W sprawach dotyczących {keyword} właściwy jest sąd rejonowy.",
+    "Przepisy dotyczące {keyword} stosuje się odpowiednio do {other}.",
+    "Minister właściwy określi, w drodze rozporządzenia, szczegółowe zasady dotyczące {keyword}.",
+    "Kto narusza przepisy o {keyword}, ponosi odpowiedzialność na zasadach ogólnych.",
+    "Organ wydaje decyzję w sprawie {keyword} w terminie 30 dni od dnia złożenia wniosku.",
+    "W przypadku gdy {keyword} dotyczy {other}, stosuje się przepisy szczególne.",
+]
+ARTICLES_PER_PAGE = 6
+SENTENCES_PER_ARTICLE = 3
+
+
+def generate_articles(rng, keywords, count, first_article=1):
+    articles = []
+    for number in range(first_article, first_article + count):
+        sentences = []
+        for _ in range(SENTENCES_PER_ARTICLE):
+            keyword, other = rng.choice(keywords), rng.choice(keywords)
+            sentence = rng.choice(SENTENCES).format(keyword=keyword, Keyword=keyword.capitalize(), other=other)
+            sentences.append(sentence)
+        articles.append(f"Art. {number}. " + " ".join(sentences))
+    return articles
+
+
+def generate_pdf(path, title, articles_by_page):
+    with fitz.open() as doc:
+        for page_number, articles in enumerate(articles_by_page):
+            page = doc.new_page()
+            heading = f"<h3>{html.escape(title)}</h3>" if page_number == 0 else ""
+            body = "".join(f"<p>{html.escape(article)}</p>" for article in articles)
+            # insert_htmlbox osadza tylko użyte znaki czcionki, dzięki czemu polskie litery nie powiększają plików
+            page.insert_htmlbox(fitz.Rect(50, 50, 545, 792), heading + body)
+        doc.save(path, garbage=3, deflate=True)
+
+
+def generate_corpus(output_dir, documents=100, pages=2, first_year=1990, last_year=2024, seed=1,
+                    legal_fields=None):
+    """Write the synthetic corpus and return [(path, legal_field)] of the generated files."""
+    rng = random.Random(seed)
+    legal_fields = legal_fields or load_legal_fields()
+    fields = sorted(legal_fields)
+
+    generated = []
+    for number in range(documents):
+        legal_field = fields[number % len(fields)]
+        keywords = legal_fields[legal_field]
+        year = rng.randint(first_year, last_year)
+        journal, position = rng.randint(1, 250), number + 1
+        title = (f"Ustawa z dnia {rng.randint(1, 28)} {rng.choice(MONTHS)} {year} r. "
+                 f"o {rng.choice(keywords)} ({legal_field})")
+        articles_by_page = [generate_articles(rng, keywords, ARTICLES_PER_PAGE, page * ARTICLES_PER_PAGE + 1)
+                            for page in range(pages)]
+
+        year_dir = os.path.join(output_dir, str(year))
+        os.makedirs(year_dir, exist_ok=True)
+        path = os.path.join(year_dir, f"D{year}{journal:03}{position:04}01.pdf")
+        generate_pdf(path, title, articles_by_page)
+        generated.append((path, legal_field))
+    return generated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output-dir', default='./data/synthetic')
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    generated = generate_corpus(args.output_dir, documents=args.documents, pages=args.pages, seed=args.seed)
+    size = sum(os.path.getsize(path) for path, _ in generated)
+    print(f"Wygenerowano {len(generated)} plików PDF ({size / 1e6:.1f} MB) w {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
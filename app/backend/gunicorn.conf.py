@@ -0,0 +1,40 @@
+"""Production server settings: gunicorn managing several uvicorn workers.
+
+Run from the repository root:  gunicorn -c app/backend/gunicorn.conf.py
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+wsgi_app = 'app.backend.main:app'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+timeout = int(os.environ.get('WORKER_TIMEOUT', '120'))
+keepalive = 5
+
+# Proces roboczy jest zastępowany nowym po max_requests żądaniach; rozrzut sprawia, że nie restartują się naraz.
+# Przy restarcie trwające odpowiedzi modelu mają graceful_timeout sekund na zakończenie.
+max_requests = int(os.environ.get('MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', '200'))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '60'))
+
+# Stan wspólny dla procesów roboczych: sesje i odpowiedzi w MongoDB, metryki w katalogu prometheus_client.
+# Zmienne ustawiane są w procesie głównym, zanim procesy robocze zaimportują aplikację.
+os.environ.setdefault('SESSION_STORE', 'mongo')
+os.environ.setdefault('ANSWER_CACHE_PERSIST', '1')
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'chatbot_metrics'))
+
+
+def on_starting(server):
+    # Metryki poprzedniego uruchomienia nie mogą być doliczane do bieżących
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,24 @@
+import time
+import argparse
+from ..BM25Index import BM25Index
+from ..ChunkedContextMatcherService import BM25_INDEX_PATH, DENSE_INDEX_PATH
+from ..DenseIndex import DENSE_DIMENSIONS, HashingEncoder, build_dense_index
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Buduje indeks wektorowy fragmentów na podstawie indeksu BM25.")
+    parser.add_argument('--bm25-index', default=BM25_INDEX_PATH)
+    parser.add_argument('--output', default=DENSE_INDEX_PATH)
+    parser.add_argument('--dimensions', type=int, default=DENSE_DIMENSIONS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    rows = build_dense_index(BM25Index.load(args.bm25_index), args.output, HashingEncoder(args.dimensions))
+    print(f"Zapisano indeks wektorowy ({rows} fragmentów) w {args.output} ({time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
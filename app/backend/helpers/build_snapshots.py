@@ -0,0 +1,41 @@
+import os
+import time
+import argparse
+from ..ContextSnapshot import SNAPSHOT_DIR, write_domain_snapshots
+from ..MongoDBHandler import MongoDBHandler
+
+SNAPSHOT_PROJECTION = {'_id': 0, 'file_name': 1, 'text': 1, 'year': 1, 'page_offsets': 1}
+
+
+def build_snapshots(collection, directory=SNAPSHOT_DIR, legal_fields=None):
+    """Rebuild the context snapshots of the given law domains (all domains when None) from the stored texts."""
+    if legal_fields is None:
+        legal_fields = collection.distinct('legal_field')
+
+    counts = {}
+    for legal_field in sorted(legal_fields):
+        start = time.perf_counter()
+        # Starsze wersje aktów, zastąpione przez tekst jednolity lub późniejszą kopię, nie trafiają do migawki
+        documents = collection.find({'legal_field': legal_field, 'superseded_by': None},
+                                    SNAPSHOT_PROJECTION).sort('file_name', 1)
+        counts[legal_field] = write_domain_snapshots(directory, legal_field, documents)
+        print(f"Migawka '{legal_field}': {counts[legal_field]} dokumentów ({time.perf_counter() - start:.1f} s)")
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Buduje migawki kontekstu dla dziedzin prawa.")
+    parser.add_argument('--output-dir', default=SNAPSHOT_DIR)
+    parser.add_argument('--legal-field', action='append', dest='legal_fields',
+                        help="Dziedzina do przebudowania (domyślnie wszystkie).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    handler = MongoDBHandler(db_name=os.environ.get('MONGO_DB_NAME', 'chatbot_db'))
+    build_snapshots(handler.collection, args.output_dir, args.legal_fields)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over the legal-field keywords, scanning a text in a single pass."""
+
+    def __init__(self, legal_fields, weights=None):
+        self.fields = list(legal_fields)
+        self.keywords = []
+        self.weights = []
+        self._build(legal_fields, weights or {})
+
+    def _build(self, legal_fields, weights):
+        goto = [{}]
+        outputs = [[]]
+
+        for field, keywords in legal_fields.items():
+            for keyword in keywords:
+                pattern = keyword.lower()
+                if not pattern:
+                    continue
+                keyword_id = len(self.keywords)
+                self.keywords.append((field, keyword, len(pattern)))
+                self.weights.append(weights.get(keyword, 1.0))
+
+                state = 0
+                for char in pattern:
+                    next_state = goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto[state][char] = next_state
+                        goto.append({})
+                        outputs.append([])
+                    state = next_state
+                outputs[state].append(keyword_id)
+
+        # Przejścia uzupełniane są od razu do pełnego automatu (BFS), więc skanowanie nie cofa się po
+        # krawędziach porażki - każdy znak tekstu to jedno wyszukanie w słowniku.
+        fail = [0] * len(goto)
+        delta = [dict(transitions) for transitions in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for char, next_state in goto[state].items():
+                fail[next_state] = delta[fail[state]].get(char, 0)
+                queue.append(next_state)
+            for char, next_state in delta[fail[state]].items():
+                delta[state].setdefault(char, next_state)
+
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+
+    def iter_matches(self, text):
+        """Yield (start, keyword_id) for every keyword occurrence, overlapping ones included."""
+        delta = self._delta
+        outputs = self._outputs
+        keywords = self.keywords
+        state = 0
+        for position, char in enumerate(text.lower()):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for keyword_id in outputs[state]:
+                    yield position - keywords[keyword_id][2] + 1, keyword_id
+
+    def count(self, text):
+        """Return the number of distinct keywords of every field found in the text."""
+        found = {keyword_id for _, keyword_id in self.iter_matches(text)}
+        counts = {field: 0 for field in self.fields}
+        for keyword_id in found:
+            counts[self.keywords[keyword_id][0]] += 1
+        return counts
+
+    def scores(self, text):
+        """Return per-field sums of keyword weights over all occurrences."""
+        scores = {field: 0.0 for field in self.fields}
+        for _, keyword_id in self.iter_matches(text):
+            scores[self.keywords[keyword_id][0]] += self.weights[keyword_id]
+        return scores
+
+    def positions(self, text):
+        """Return the start offsets of every keyword occurrence, grouped by keyword."""
+        positions = {}
+        for start, keyword_id in self.iter_matches(text):
+            positions.setdefault(self.keywords[keyword_id][1], []).append(start)
+        return positions
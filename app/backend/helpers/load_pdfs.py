@@ -1,8 +1,32 @@
 import os
+import re
 import json
-import fitz
-from pymongo import MongoClient
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import MongoClient, UpdateOne, DeleteMany
 import bson
+from ..BM25Index import BM25Index, tokenize
+from ..ChunkedContextMatcherService import BM25_INDEX_PATH, DENSE_INDEX_PATH
+from ..DenseIndex import build_dense_index
+from ..MongoDBHandler import MongoDBHandler, iter_page_texts, join_pages
+from .build_snapshots import build_snapshots
+from .keyword_matcher import KeywordMatcher
+from .minhash import MinHasher, MinHashLSH, estimate_similarity, word_shingles
+from .paths import CHANGES_FILE, LEGAL_FIELDS_PATH, load_legal_fields
+
+INGEST_MANIFEST_PATH = os.environ.get(
+    'INGEST_MANIFEST_PATH', os.path.join(os.path.dirname(BM25_INDEX_PATH), 'ingest_manifest.json'))
+# Dziedziny, których dokumenty zostały już zapisane, ale indeksy, migawki i wersje korpusu nie są jeszcze odświeżone
+PENDING_DOMAINS_PATH = os.path.join(os.path.dirname(INGEST_MANIFEST_PATH), 'ingest_pending_domains.json')
+# Nazwy plików ze scrapera: D{rok}{wydanie:03}{pozycja:04}{numer pliku:02}.pdf
+FILE_NAME_PATTERN = re.compile(r'^D(\d{4})(\d{3})(\d{4})(\d{2})\.pdf$', re.IGNORECASE)
+YEAR_PATTERN = re.compile(r'^D?(\d{4})')
+# Teksty jednolite i ponownie zapisane kopie tej samej ustawy są niemal identyczne; starsze wersje są pomijane
+DUPLICATE_SIMILARITY = float(os.environ.get('DUPLICATE_SIMILARITY', '0.8'))
+DUPLICATE_SHINGLE_SIZE = 5
+DUPLICATE_PROJECTION = {'file_name': 1, 'minhash': 1, 'year': 1, 'journal': 1, 'position': 1, 'superseded_by': 1}
 
 def find_pdf_files(root_dir):
     pdf_files = []
@@ -13,10 +37,7 @@ def find_pdf_files(root_dir):
     return pdf_files
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text += page.get_text()
+    text, _ = join_pages(iter_page_texts(pdf_path))
     return text
 
 def save_to_mongodb(collection, pdf_path, keywords):
@@ -26,33 +47,52 @@ def save_to_mongodb(collection, pdf_path, keywords):
     }
     collection.insert_one(document)
 
-def save_to_mongodb_binary(collection, pdf_path, legal_field):
+def save_to_mongodb_binary(collection, pdf_path, legal_field, text=None):
     with open(pdf_path, 'rb') as f:
         binary_data = bson.Binary(f.read())
     document = {
         'file_name': os.path.basename(pdf_path),
         'file_data': binary_data,
-        'legal_field': legal_field
+        'content_hash': hashlib.sha256(binary_data).hexdigest(),
+        'legal_field': legal_field,
+        **parse_file_name(pdf_path)
     }
+    # Tekst wyciągnięty przy imporcie, dzięki czemu backend nie musi ponownie parsować PDF
+    if text is not None:
+        document['text'] = text
     collection.insert_one(document)
 
-def load_legal_fields(filepath='./helpers/legal_fields/key_words_legal_fields.json'):
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Plik {filepath} nie istnieje.")
+def parse_file_name(pdf_path):
+    """Return the publication year, journal and position encoded in the file name (None when unknown)."""
+    file_name = os.path.basename(pdf_path)
+    match = FILE_NAME_PATTERN.match(file_name)
+    if match:
+        year, journal, position, _ = match.groups()
+        return {'year': int(year), 'journal': int(journal), 'position': int(position)}
+
+    # Starsze nazwy plików zawierają tylko rok, a pliki w katalogu dziennik_ustaw/{rok} mają go w ścieżce
+    match = YEAR_PATTERN.match(file_name) or YEAR_PATTERN.match(os.path.basename(os.path.dirname(pdf_path)))
+    return {'year': int(match.group(1)) if match else None, 'journal': None, 'position': None}
+
+_matcher_cache = {}
 
-    with open(filepath, 'r', encoding='utf-8') as file:
-        legal_fields = json.load(file)
-    return legal_fields
 
-def classify_legal_field(text, filepath='./helpers/legal_fields/key_words_legal_fields.json'):
-    legal_fields = load_legal_fields(filepath)
+def get_keyword_matcher(legal_fields):
+    """Return a compiled keyword automaton, building it only once per distinct keyword set."""
+    key = json.dumps(legal_fields, sort_keys=True)
+    matcher = _matcher_cache.get(key)
+    if matcher is None:
+        matcher = _matcher_cache[key] = KeywordMatcher(legal_fields)
+    return matcher
 
-    field_counts = {field: 0 for field in legal_fields}
+def classify_legal_field(text, filepath=LEGAL_FIELDS_PATH, legal_fields=None, matcher=None):
+    if matcher is None:
+        if legal_fields is None:
+            legal_fields = load_legal_fields(filepath)
+        matcher = get_keyword_matcher(legal_fields)
 
-    for field, keywords in legal_fields.items():
-        for keyword in keywords:
-            if keyword.lower() in text.lower():
-                field_counts[field] += 1
+    # Jedno przejście automatu Aho-Corasick zamiast osobnego wyszukiwania każdego słowa kluczowego
+    field_counts = matcher.count(text)
 
     max_field = max(field_counts, key=field_counts.get)
     if field_counts[max_field] == 0:
@@ -61,27 +101,358 @@ def classify_legal_field(text, filepath='./helpers/legal_fields/key_words_legal_
     print(field_counts)
     return max_field
 
-def main():
-    root_dir = './dziennik_ustaw'
-    pdf_files = find_pdf_files(root_dir)
-    print(f"Znaleziono {len(pdf_files)} plików PDF.")
+# Automat słów kluczowych budowany raz na proces roboczy, a nie dla każdego pliku
+_worker_matcher = None
+# Stałe ziarno: sygnatury liczone w różnych procesach i przy różnych importach są porównywalne
+_minhasher = MinHasher()
+
+
+def _init_worker(filepath=LEGAL_FIELDS_PATH):
+    global _worker_matcher
+    _worker_matcher = KeywordMatcher(load_legal_fields(filepath))
+
+
+def document_signature(text, hasher=_minhasher):
+    """MinHash signature of the word 5-grams of the text, used to find other versions of the same act."""
+    return list(hasher.signature(word_shingles(tokenize(text), DUPLICATE_SHINGLE_SIZE)))
+
+
+def publication_key(document):
+    """Sort key placing later publications (year, journal, position) last."""
+    return (document.get('year') or 0, document.get('journal') or 0, document.get('position') or 0,
+            document['file_name'])
+
+
+def group_near_duplicates(documents, similarity=DUPLICATE_SIMILARITY):
+    """Group documents ({'file_name', 'minhash', ...}) with near-identical texts; each group is latest first."""
+    lsh = MinHashLSH()
+    parent = {}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    by_name = {}
+    for document in documents:
+        name, signature = document['file_name'], tuple(document['minhash'])
+        by_name[name] = document
+        parent[name] = name
+        for candidate in lsh.query(signature):
+            if estimate_similarity(signature, lsh.signatures[candidate]) >= similarity:
+                parent[find(candidate)] = find(name)
+        lsh.insert(name, signature)
+
+    groups = {}
+    for name, document in by_name.items():
+        groups.setdefault(find(name), []).append(document)
+    return [sorted(group, key=publication_key, reverse=True) for group in groups.values()]
+
+
+def mark_near_duplicates(collection, legal_fields, similarity=DUPLICATE_SIMILARITY):
+    """Mark documents that have a later near-duplicate in their law domain as superseded by the latest version.
+
+    Returns (superseded, restored): file names that became superseded and those that no longer are.
+    """
+    superseded, restored = set(), set()
+    requests = []
+    for legal_field in legal_fields:
+        documents = collection.find({'legal_field': legal_field, 'minhash': {'$exists': True}}, DUPLICATE_PROJECTION)
+        for group in group_near_duplicates(documents, similarity):
+            latest = group[0]['file_name']
+            for document in group:
+                superseded_by = None if document['file_name'] == latest else latest
+                if document.get('superseded_by') == superseded_by:
+                    continue
+                requests.append(UpdateOne({'_id': document['_id']}, {'$set': {'superseded_by': superseded_by}}))
+                (superseded if superseded_by else restored).add(document['file_name'])
+
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+    return superseded, restored
+
+
+def update_index_for_duplicates(index, collection, legal_fields, restored):
+    """Keep superseded versions out of the BM25 index and bring back the ones that are current again.
+
+    Every superseded document of the law domains is removed, not only the newly superseded ones: a file
+    loaded again (e.g. with --force) is added to the index before its duplicates are checked.
+    """
+    superseded = collection.find({'legal_field': {'$in': sorted(legal_fields)}, 'superseded_by': {'$ne': None}},
+                                 {'file_name': 1})
+    for document in superseded:
+        index.remove_document(document['file_name'])
+    if restored:
+        projection = {'file_name': 1, 'text': 1, 'legal_field': 1, 'year': 1, 'page_offsets': 1}
+        for document in collection.find({'file_name': {'$in': sorted(restored)}}, projection):
+            index.add_document(document['file_name'], document.get('text') or "", document['legal_field'],
+                               page_offsets=document.get('page_offsets'), year=document.get('year'))
+
+
+def process_pdf(pdf_path):
+    """Extract and classify one PDF; runs inside the worker processes.
+
+    The file is hashed in blocks and parsed from disk one page at a time, so its bytes are never held in memory.
+    """
+    text, page_offsets = join_pages(iter_page_texts(pdf_path))
+    stat = os.stat(pdf_path)
+    return {
+        'path': pdf_path,
+        'file_name': os.path.basename(pdf_path),
+        'content_hash': file_hash(pdf_path),
+        'legal_field': classify_legal_field(text, matcher=_worker_matcher),
+        'text': text,
+        'page_offsets': page_offsets,
+        'minhash': document_signature(text),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        **parse_file_name(pdf_path),
+    }
+
+
+def store_pdf_in_gridfs(fs, result):
+    """Stream the PDF into GridFS under its content hash; identical files are stored only once."""
+    if fs.exists(result['content_hash']):
+        return False
+    with open(result['path'], 'rb') as f:
+        fs.put(f, _id=result['content_hash'], filename=result['file_name'], content_type='application/pdf')
+    return True
+
+
+def build_upsert_requests(result):
+    """Upsert keyed by content hash and drop older versions stored under the same file name.
+
+    The document only references the PDF stored in GridFS; inline file_data left by older imports is removed.
+    """
+    document = {
+        'file_name': result['file_name'],
+        'file_id': result['content_hash'],
+        'file_size': result['size'],
+        'content_hash': result['content_hash'],
+        'legal_field': result['legal_field'],
+        'year': result['year'],
+        'journal': result['journal'],
+        'position': result['position'],
+        'text': result['text'],
+        'page_offsets': result['page_offsets'],
+        'minhash': result['minhash'],
+    }
+    return [
+        UpdateOne({'content_hash': result['content_hash']},
+                  {'$set': document, '$unset': {'file_data': ''}}, upsert=True),
+        DeleteMany({'file_name': result['file_name'], 'content_hash': {'$ne': result['content_hash']}}),
+    ]
+
 
-    # Connect to MongoDB using environment variables
-    mongo_uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
-    mongo_db_name = os.environ.get('MONGO_DB_NAME', 'chatbot_db')
-    client = MongoClient(mongo_uri)
+def load_manifest(path=INGEST_MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
 
-    db = client[mongo_db_name]
-    collection = db['ustawy']
 
+def save_manifest(manifest, path=INGEST_MANIFEST_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, path)
+
+
+def load_pending_domains(path=PENDING_DOMAINS_PATH):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as file:
+        return set(json.load(file))
+
+
+def save_pending_domains(legal_fields, path=PENDING_DOMAINS_PATH):
+    """Record the law domains still to be finished by finish_ingest; an empty set removes the record."""
+    if not legal_fields:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    save_manifest(sorted(legal_fields), path)
+
+
+def file_hash(pdf_path):
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def filter_pending_files(pdf_files, manifest):
+    """Return files that are not in the manifest or changed on disk since they were loaded.
+
+    A file whose modification time changed but whose content hash did not (e.g. downloaded again) is not
+    loaded again; only its manifest entry is updated.
+    """
+    pending = []
     for pdf_path in pdf_files:
-        print(f"Przetwarzanie pliku: {pdf_path}")
-        text = extract_text_from_pdf(pdf_path)
+        entry = manifest.get(pdf_path)
+        stat = os.stat(pdf_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            continue
+        if entry and entry['size'] == stat.st_size and entry.get('content_hash') == file_hash(pdf_path):
+            entry['mtime'] = stat.st_mtime
+            continue
+        pending.append(pdf_path)
+    return pending
+
+
+def claim_scraper_changes(changes_path, root_dir):
+    """Take over the list of files downloaded by the scraper; returns (pdf paths, path of the claimed list).
+
+    The list is renamed before loading, so the scraper can keep appending to a new one. A list claimed by
+    an interrupted run is loaded again, which is safe because documents are upserted by content hash.
+    """
+    claimed_path = f"{changes_path}.ingesting"
+    if os.path.exists(changes_path):
+        if os.path.exists(claimed_path):
+            with open(changes_path, 'r', encoding='utf-8') as new, open(claimed_path, 'a', encoding='utf-8') as old:
+                old.write(new.read())
+            os.remove(changes_path)
+        else:
+            os.replace(changes_path, claimed_path)
+    if not os.path.exists(claimed_path):
+        return [], None
+
+    root = os.path.abspath(root_dir)
+    pdf_files = []
+    with open(claimed_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            path = json.loads(line)['path']
+            # Ścieżki w tej samej postaci co z find_pdf_files, aby pasowały do kluczy manifestu
+            relative = os.path.relpath(path, root)
+            pdf_path = path if relative.startswith(os.pardir) else os.path.join(root_dir, relative)
+            if pdf_path not in pdf_files and os.path.exists(pdf_path):
+                pdf_files.append(pdf_path)
+    return pdf_files, claimed_path
+
+
+def remove_orphaned_files(fs, collection, content_hashes):
+    """Delete GridFS files of replaced PDF versions that no document references anymore."""
+    for content_hash in content_hashes:
+        if fs.exists(content_hash) and collection.count_documents({'file_id': content_hash}, limit=1) == 0:
+            fs.delete(content_hash)
+
+
+def bump_corpus_versions(db, legal_fields):
+    """Mark the law domains as re-ingested so running servers drop their cached answers, texts and indexes."""
+    for legal_field in legal_fields:
+        db['corpus_versions'].update_one({'_id': legal_field}, {'$inc': {'version': 1}}, upsert=True)
+    db['answer_cache'].delete_many({'domain': {'$in': list(legal_fields)}})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Wczytuje pliki PDF Dziennika Ustaw do MongoDB.")
+    parser.add_argument('--root-dir', default=os.environ.get('DZIENNIK_USTAW_DIR', './dziennik_ustaw'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--checkpoint-every', type=int, default=512,
+                        help="Co ile plików zapisywać manifest i indeks BM25.")
+    parser.add_argument('--force', action='store_true', help="Ignoruje manifest i wczytuje wszystkie pliki.")
+    parser.add_argument('--changes', default=None,
+                        help=f"Lista plików pobranych przez scraper (domyślnie {CHANGES_FILE} w --root-dir).")
+    parser.add_argument('--full-scan', action='store_true',
+                        help="Przegląda cały katalog zamiast listy plików pobranych przez scraper.")
+    return parser.parse_args(argv)
+
+
+def finish_ingest(handler, index, legal_fields):
+    """Refresh everything derived from the documents of the law domains: duplicate marks, the BM25 and dense
+    indexes, the context snapshots and the corpus versions that make running servers drop their caches."""
+    superseded, restored = mark_near_duplicates(handler.collection, legal_fields)
+    update_index_for_duplicates(index, handler.collection, legal_fields, restored)
+    print(f"Oznaczono {len(superseded)} nowych starszych wersji aktów, przywrócono {len(restored)}.")
+
+    index.save(BM25_INDEX_PATH)
+    # Macierz wektorów jest budowana raz na końcu, bo wiersze muszą odpowiadać fragmentom zapisanego indeksu BM25
+    build_dense_index(index, DENSE_INDEX_PATH)
+    build_snapshots(handler.collection, legal_fields=legal_fields)
+    bump_corpus_versions(handler.db, legal_fields)
+    print(f"Zapisano indeks BM25 ({len(index)} fragmentów) w {BM25_INDEX_PATH}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    changes_path = args.changes or os.path.join(args.root_dir, CHANGES_FILE)
+    claimed_path = None
+    if args.full_scan or args.force or not (os.path.exists(changes_path) or os.path.exists(f"{changes_path}.ingesting")):
+        pdf_files = find_pdf_files(args.root_dir)
+        print(f"Znaleziono {len(pdf_files)} plików PDF.")
+    else:
+        pdf_files, claimed_path = claim_scraper_changes(changes_path, args.root_dir)
+        print(f"Scraper pobrał {len(pdf_files)} nowych lub zmienionych plików PDF.")
+
+    manifest = {} if args.force else load_manifest(INGEST_MANIFEST_PATH)
+    pending = filter_pending_files(pdf_files, manifest)
+    print(f"Do wczytania: {len(pending)} plików (pominięto {len(pdf_files) - len(pending)} już wczytanych).")
+    # Dziedziny z przerwanego wcześniej importu są kończone nawet wtedy, gdy nie ma nic nowego do wczytania
+    affected_fields = load_pending_domains(PENDING_DOMAINS_PATH)
+    if not pending and not affected_fields:
+        save_manifest(manifest, INGEST_MANIFEST_PATH)
+        if claimed_path is not None:
+            os.remove(claimed_path)
+        return
+
+    # Connect to MongoDB using environment variables (MONGO_URI and the pool settings of MongoDBHandler)
+    handler = MongoDBHandler(db_name=os.environ.get('MONGO_DB_NAME', 'chatbot_db'))
+    collection = handler.collection
+    fs = handler.fs
+    handler.ensure_indexes()
+
+    # Indeks fragmentów (BM25) używany przy wyszukiwaniu kontekstu dla pytań
+    index = BM25Index.load_or_create(BM25_INDEX_PATH)
+
+    def checkpoint():
+        # Dziedziny są zapisywane przed manifestem: plik pominięty po wznowieniu ma już swoją dziedzinę w rejestrze
+        save_pending_domains(affected_fields, PENDING_DOMAINS_PATH)
+        index.save(BM25_INDEX_PATH)
+        save_manifest(manifest, INGEST_MANIFEST_PATH)
+
+    start = time.perf_counter()
+    requests, loaded, since_checkpoint = [], [], 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        for done, result in enumerate(executor.map(process_pdf, pending, chunksize=4), start=1):
+            store_pdf_in_gridfs(fs, result)
+            requests.extend(build_upsert_requests(result))
+            loaded.append(result)
+            index.add_document(result['file_name'], result['text'], result['legal_field'],
+                               page_offsets=result['page_offsets'], year=result['year'])
+            affected_fields.add(result['legal_field'])
+
+            if len(loaded) >= args.batch_size or done == len(pending):
+                collection.bulk_write(requests, ordered=False)
+                replaced = {manifest[item['path']]['content_hash'] for item in loaded if item['path'] in manifest}
+                remove_orphaned_files(fs, collection, replaced - {item['content_hash'] for item in loaded})
+                for item in loaded:
+                    manifest[item['path']] = {'size': item['size'], 'mtime': item['mtime'],
+                                              'content_hash': item['content_hash']}
+                since_checkpoint += len(loaded)
+                requests, loaded = [], []
+
+                elapsed = time.perf_counter() - start
+                print(f"Wczytano {done}/{len(pending)} plików ({done / elapsed:.1f} plików/s)")
 
-        # keywords = extract_keywords(corrected_text)
-        legal_field = classify_legal_field(text)
+            if since_checkpoint >= args.checkpoint_every:
+                checkpoint()
+                since_checkpoint = 0
 
-        save_to_mongodb_binary(collection, pdf_path, legal_field)
+    checkpoint()
+    finish_ingest(handler, index, affected_fields)
+    # Rejestr dziedzin i lista scrapera są usuwane dopiero po odświeżeniu wszystkiego, więc przerwany import
+    # zostanie dokończony przy następnym uruchomieniu
+    save_pending_domains(set(), PENDING_DOMAINS_PATH)
+    if claimed_path is not None:
+        os.remove(claimed_path)
 
 if __name__ == "__main__":
     main()
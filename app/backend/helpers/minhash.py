@@ -0,0 +1,80 @@
+import random
+import zlib
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def char_shingles(text, size=4):
+    """Return the set of character n-grams of the text (the whole text when it is shorter)."""
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def word_shingles(words, size=5):
+    """Return the set of word n-grams, joined with spaces."""
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures over string shingles using universal hashing of their crc32 values."""
+
+    def __init__(self, num_perm=64, seed=1):
+        generator = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [(generator.randrange(1, MERSENNE_PRIME), generator.randrange(0, MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+
+    def signature(self, shingles):
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        if not hashes:
+            return (MAX_HASH,) * self.num_perm
+        return tuple(min(((a * value + b) % MERSENNE_PRIME) & MAX_HASH for value in hashes)
+                     for a, b in self.permutations)
+
+
+def estimate_similarity(first, second):
+    """Estimate the Jaccard similarity of two sets from their MinHash signatures."""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+class MinHashLSH:
+    """Banded locality-sensitive hashing index returning candidate keys with similar signatures."""
+
+    def __init__(self, bands=16, rows=4):
+        self.bands = bands
+        self.rows = rows
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def band_keys(self, signature):
+        return [hash(signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def insert(self, key, signature):
+        self.remove(key)
+        self.signatures[key] = signature
+        for buckets, band_key in zip(self.buckets, self.band_keys(signature)):
+            buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for buckets, band_key in zip(self.buckets, self.band_keys(signature)):
+            keys = buckets.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del buckets[band_key]
+
+    def query(self, signature):
+        candidates = set()
+        for buckets, band_key in zip(self.buckets, self.band_keys(signature)):
+            candidates.update(buckets.get(band_key, ()))
+        return candidates
+
+    def __len__(self):
+        return len(self.signatures)
@@ -0,0 +1,18 @@
+import os
+import json
+
+# Pliki wspólne dla serwera API, scrapera i narzędzi importu; moduł nie importuje niczego ciężkiego,
+# bo ładuje go każdy worker serwera
+
+# Lista pobranych plików, z której load_pdfs wczytuje tylko nowe i zmienione dokumenty
+CHANGES_FILE = '.changes.jsonl'
+LEGAL_FIELDS_PATH = os.path.join(os.path.dirname(__file__), 'legal_fields', 'key_words_legal_fields.json')
+
+
+def load_legal_fields(filepath=LEGAL_FIELDS_PATH):
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Plik {filepath} nie istnieje.")
+
+    with open(filepath, 'r', encoding='utf-8') as file:
+        legal_fields = json.load(file)
+    return legal_fields
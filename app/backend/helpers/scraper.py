@@ -1,13 +1,32 @@
 import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-import time
+try:
+    from .paths import CHANGES_FILE
+except ImportError:
+    # Uruchomienie jako skrypt (python scraper.py) z katalogu helpers
+    from paths import CHANGES_FILE
 
 BASE_URL = "https://dziennikustaw.gov.pl/DU/rok"
 BASE_URL_DIRECT = "https://dziennikustaw.gov.pl"
 AVAILABLE_YEARS = [str(year) for year in range(1918, 2025) if year not in {1943, 1942, 1941, 1940}]
 DOWNLOAD_DIR_BASE = "../../../dziennik_ustaw"
 
+SCRAPER_WORKERS = int(os.environ.get('SCRAPER_WORKERS', '8'))
+SCRAPER_PER_HOST_CONCURRENCY = int(os.environ.get('SCRAPER_PER_HOST_CONCURRENCY', '4'))
+SCRAPER_RATE_LIMIT = float(os.environ.get('SCRAPER_RATE_LIMIT', '2'))
+SCRAPER_RETRIES = int(os.environ.get('SCRAPER_RETRIES', '5'))
+SCRAPER_BACKOFF = float(os.environ.get('SCRAPER_BACKOFF', '0.5'))
+REQUEST_TIMEOUT = 30
+
 
 def prompt_user_for_years():
     print("Available years: 1918 - 2024 except for 1940 - 1943.")
@@ -33,140 +52,271 @@ def prompt_user_for_limit():
         return 0
 
 
-def download_pdf(pdf_url, save_path, downloaded_count, limit):
-    if downloaded_count >= limit > 0:
-        return downloaded_count
-
-    print(f"Attempting to download {pdf_url} ...")
-    response = requests.get(pdf_url, stream=True)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=1024):
-                file.write(chunk)
+def create_session(pool_size=SCRAPER_WORKERS, retries=SCRAPER_RETRIES, backoff=SCRAPER_BACKOFF):
+    """Return a session with a shared connection pool and retries with exponential backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class RateLimiter:
+    """Per-host limit of concurrent requests and of requests per second."""
+
+    def __init__(self, rate=SCRAPER_RATE_LIMIT, concurrency=SCRAPER_PER_HOST_CONCURRENCY):
+        self.rate = rate
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.concurrency)
+            return self._semaphores[host]
+
+    def _wait_for_slot(self, host):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def acquire(self, url):
+        host = urlparse(url).netloc
+        semaphore = self._semaphore(host)
+        semaphore.acquire()
+        self._wait_for_slot(host)
+        return semaphore
+
+
+class CrawlState:
+    """On-disk record of downloaded PDFs with their ETag, Last-Modified and size."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+
+    def get(self, url):
+        with self._lock:
+            return self.entries.get(url)
+
+    def update(self, url, **entry):
+        with self._lock:
+            self.entries[url] = entry
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.entries, file, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+class ChangeLog:
+    """Append-only list (JSON lines) of the PDFs downloaded since the loader last consumed it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, url, path, size):
+        line = json.dumps({'url': url, 'path': os.path.abspath(path), 'size': size, 'downloaded_at': time.time()})
+        directory = os.path.dirname(self.path)
+        with self._lock:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+
+
+class Crawler:
+    def __init__(self, base_url_direct=BASE_URL_DIRECT, download_dir=DOWNLOAD_DIR_BASE, workers=SCRAPER_WORKERS,
+                 rate_limit=SCRAPER_RATE_LIMIT, per_host_concurrency=SCRAPER_PER_HOST_CONCURRENCY,
+                 retries=SCRAPER_RETRIES, backoff=SCRAPER_BACKOFF, state_path=None, changes_path=None):
+        self.base_url_direct = base_url_direct
+        self.base_url = f"{base_url_direct}/DU/rok"
+        self.download_dir = download_dir
+        self.session = create_session(pool_size=workers, retries=retries, backoff=backoff)
+        self.limiter = RateLimiter(rate=rate_limit, concurrency=per_host_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.state = CrawlState(state_path or os.path.join(download_dir, '.crawl_state.json'))
+        self.changes = ChangeLog(changes_path or os.path.join(download_dir, CHANGES_FILE))
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+        self.state.save()
+
+    @contextmanager
+    def request(self, url, **kwargs):
+        """Hold the host's slot until the response (also a streamed one) has been read and closed."""
+        semaphore = self.limiter.acquire(url)
+        try:
+            with self.session.get(url, timeout=REQUEST_TIMEOUT, **kwargs) as response:
+                yield response
+        finally:
+            semaphore.release()
+
+    def get(self, url, **kwargs):
+        with self.request(url, **kwargs) as response:
+            return response
+
+    def get_soup(self, url, description):
+        try:
+            response = self.get(url)
+        except requests.RequestException as e:
+            print(f"Failed to retrieve {description} {url} ({e})")
+            return None
+        if response.status_code != 200:
+            print(f"Failed to retrieve {description} {url} (status code: {response.status_code})")
+            return None
+        return BeautifulSoup(response.text, 'html.parser')
+
+    def download_pdf(self, pdf_url, save_path):
+        """Download a PDF unless the stored copy is still current; returns 'downloaded', 'skipped' or 'failed'."""
+        entry = self.state.get(pdf_url)
+        have_copy = entry is not None and os.path.exists(save_path) and os.path.getsize(save_path) == entry['size']
+
+        headers = {}
+        if have_copy and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if have_copy and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            with self.request(pdf_url, stream=True, headers=headers) as response:
+                if response.status_code == 304:
+                    return 'skipped'
+                if response.status_code != 200:
+                    print(f"Failed to download {pdf_url} (status code: {response.status_code})")
+                    return 'failed'
+
+                content_length = response.headers.get('Content-Length')
+                if have_copy and not headers and content_length is not None and int(content_length) == entry['size']:
+                    return 'skipped'
+
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                tmp_path = f"{save_path}.part"
+                with open(tmp_path, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        file.write(chunk)
+                os.replace(tmp_path, save_path)
+        except requests.RequestException as e:
+            print(f"Failed to download {pdf_url} ({e})")
+            return 'failed'
+
+        size = os.path.getsize(save_path)
+        self.state.update(pdf_url, path=save_path, size=size,
+                          etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+        self.changes.add(pdf_url, save_path, size)
         print(f"Successfully downloaded: {save_path}")
-        return downloaded_count + 1
-    else:
-        print(f"Failed to download {pdf_url} (status code: {response.status_code})")
-        return downloaded_count
-
-
-def scrape_position(position_url, year, journal, position, downloaded_count, limit):
-    if downloaded_count >= limit > 0:
-        return downloaded_count
-
-    print(f"Scraping position {position} from journal {journal} in year {year}...")
-    response = requests.get(position_url)
-
-    if response.status_code != 200:
-        print(f"Failed to retrieve position page {position_url} (status code: {response.status_code})")
-        return downloaded_count
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-    file_links = soup.select('a[href$=".pdf"]')
-    valid_file_links = [link for link in file_links if f"/DU/{year}/" in link['href']]
-
-    if not valid_file_links:
-        print(f"No valid PDF links found for position {position}.")
-        return downloaded_count
-
-    download_dir = os.path.join(DOWNLOAD_DIR_BASE, year)
-    os.makedirs(download_dir, exist_ok=True)
-
-    for i, link in enumerate(valid_file_links, start=1):
-        if downloaded_count >= limit > 0:
-            break
-
-        pdf_url = link['href']
-        if not pdf_url.startswith("http"):
-            pdf_url = f"{BASE_URL_DIRECT}{pdf_url}"
-
-        pdf_filename = f"D{year}{journal}{position}{i:02}.pdf"
-        save_path = os.path.join(download_dir, pdf_filename)
-
-        downloaded_count = download_pdf(pdf_url, save_path, downloaded_count, limit)
-
-    return downloaded_count
-
-
-def scrape_wydanie(year, journal, downloaded_count, limit):
-    if downloaded_count >= limit > 0:
-        return downloaded_count
+        return 'downloaded'
+
+    def scrape_position(self, position_url, year, journal, position):
+        """Return the (pdf_url, save_path) pairs attached to one position."""
+        soup = self.get_soup(position_url, f"position page {position}")
+        if soup is None:
+            return []
+
+        file_links = soup.select('a[href$=".pdf"]')
+        valid_file_links = [link for link in file_links if f"/DU/{year}/" in link['href']]
+        if not valid_file_links:
+            print(f"No valid PDF links found for position {position}.")
+            return []
+
+        targets = []
+        for i, link in enumerate(valid_file_links, start=1):
+            pdf_url = link['href']
+            if not pdf_url.startswith("http"):
+                pdf_url = f"{self.base_url_direct}{pdf_url}"
+            # Numery wydania i pozycji są uzupełniane zerami, aby load_pdfs mógł je odczytać z nazwy pliku
+            pdf_filename = f"D{year}{int(journal):03}{int(position):04}{i:02}.pdf"
+            targets.append((pdf_url, os.path.join(self.download_dir, year, pdf_filename)))
+        return targets
+
+    def scrape_wydanie(self, year, journal):
+        print(f"Scraping wydanie {journal} for year {year}...")
+        soup = self.get_soup(f"{self.base_url}/{year}/wydanie/{journal}", f"wydanie page {journal}")
+        if soup is None:
+            return []
+
+        position_links = soup.select('#c_table tbody tr td.numberAlign a')
+        if not position_links:
+            print(f"No positions found in wydanie {journal}.")
+            return []
+
+        # Strony pozycji są pobierane równolegle, w granicach limitu żądań na serwer
+        futures = []
+        for pos_link in position_links:
+            pos_path = pos_link['href']
+            position = pos_path.split("/")[-1]
+            futures.append(self.executor.submit(
+                self.scrape_position, f"{self.base_url_direct}{pos_path}", year, journal, position))
+        return [target for future in futures for target in future.result()]
+
+    def find_year_targets(self, year, limit=0):
+        """Return up to limit (0 = all) PDFs to fetch for the year."""
+        url = f"{self.base_url}/{year}"
+        print(f"\nScraping year {year} from {url} ...")
+        soup = self.get_soup(url, f"the page for {year}")
+        if soup is None:
+            return []
+
+        pdf_links = soup.select('#c_table tbody tr a[href$=".pdf"]')
+        if pdf_links:
+            print(f"Found direct PDFs for year {year}.")
+            targets = []
+            for link in pdf_links:
+                pdf_path = link['href']
+                if f"/DU/{year}/" not in pdf_path:
+                    continue
+                pdf_name = pdf_path.split("/")[-1]
+                targets.append((f"{self.base_url_direct}{pdf_path}", os.path.join(self.download_dir, year, pdf_name)))
+            return targets[:limit] if limit > 0 else targets
 
-    print(f"Scraping wydanie {journal} for year {year}...")
-    url = f"{BASE_URL}/{year}/wydanie/{journal}"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        print(f"Failed to retrieve wydanie page {journal} (status code: {response.status_code})")
-        return downloaded_count
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-    position_links = soup.select('#c_table tbody tr td.numberAlign a')
-    if not position_links:
-        print(f"No positions found in wydanie {journal}.")
-        return downloaded_count
-
-    for pos_link in position_links:
-        if downloaded_count >= limit > 0:
-            break
-
-        pos_path = pos_link['href']
-        position = pos_path.split("/")[-1]
-        position_url = f"{BASE_URL_DIRECT}{pos_path}"
-
-        downloaded_count = scrape_position(position_url, year, journal, position, downloaded_count, limit)
-
-    return downloaded_count
-
-
-def scrape_year(year, limit):
-    downloaded_count = 0
-    url = f"{BASE_URL}/{year}"
-    print(f"\nScraping year {year} from {url} ...")
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        print(f"Failed to retrieve the page for {year} (status code: {response.status_code})")
-        return downloaded_count
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-    pdf_links = soup.select('#c_table tbody tr a[href$=".pdf"]')
-
-    if pdf_links:
-        print(f"Found direct PDFs for year {year}. Downloading...")
-        download_dir = os.path.join(DOWNLOAD_DIR_BASE, year)
-        os.makedirs(download_dir, exist_ok=True)
-
-        for link in pdf_links:
-            if downloaded_count >= limit > 0:
-                break
-
-            pdf_path = link['href']
-            if f"/DU/{year}/" not in pdf_path:
-                continue
-
-            pdf_url = f"{BASE_URL_DIRECT}{pdf_path}"
-            pdf_name = pdf_path.split("/")[-1]
-            save_path = os.path.join(download_dir, pdf_name)
-
-            downloaded_count = download_pdf(pdf_url, save_path, downloaded_count, limit)
-            time.sleep(1)
-    else:
         print(f"No direct PDFs found for year {year}. Switching to 'wydanie' list...")
         journal_links = soup.select('#c_table tbody tr td.numberAlign a')
-
         if not journal_links:
             print(f"No journals (wydanie) found for year {year}.")
-            return downloaded_count
+            return []
 
+        targets = []
         for journal_link in journal_links:
-            if downloaded_count >= limit > 0:
+            if len(targets) >= limit > 0:
                 break
+            targets.extend(self.scrape_wydanie(year, journal_link.text.strip()))
+        return targets[:limit] if limit > 0 else targets
 
-            journal = journal_link.text.strip()
-            downloaded_count = scrape_wydanie(year, journal, downloaded_count, limit)
+    def scrape_year(self, year, limit=0):
+        """Download the year's PDFs concurrently and return how many files were downloaded."""
+        targets = self.find_year_targets(year, limit)
+        results = list(self.executor.map(lambda target: self.download_pdf(*target), targets))
+        self.state.save()
 
-    return downloaded_count
+        skipped = results.count('skipped')
+        if skipped:
+            print(f"Skipped {skipped} unchanged PDFs for year {year}.")
+        return results.count('downloaded')
 
 
 if __name__ == "__main__":
@@ -176,8 +326,12 @@ if __name__ == "__main__":
     else:
         document_limit = prompt_user_for_limit()
 
-        total_downloaded = 0
-        for year in years_to_download:
-            if total_downloaded >= document_limit > 0:
-                break
-            total_downloaded += scrape_year(year, document_limit - total_downloaded)
+        crawler = Crawler()
+        try:
+            total_downloaded = 0
+            for year in years_to_download:
+                if total_downloaded >= document_limit > 0:
+                    break
+                total_downloaded += crawler.scrape_year(year, document_limit - total_downloaded)
+        finally:
+            crawler.close()
@@ -0,0 +1,36 @@
+import unittest
+from app.backend.helpers.keyword_matcher import KeywordMatcher
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = KeywordMatcher({
+            "prawo cywilne": ["umowa", "umowa sprzedaży", "Spadek"],
+            "prawo karne": ["kara", "karana"],
+        }, weights={"umowa sprzedaży": 2.0})
+
+    def test_count_distinct_keywords(self):
+        counts = self.matcher.count("Umowa sprzedaży, umowa najmu i SPADEK.")
+        self.assertEqual(counts, {"prawo cywilne": 3, "prawo karne": 0})
+
+    def test_overlapping_matches(self):
+        counts = self.matcher.count("osoba karana")
+        self.assertEqual(counts["prawo karne"], 2)
+
+    def test_positions(self):
+        positions = self.matcher.positions("umowa sprzedaży, potem umowa")
+        self.assertEqual(positions, {"umowa": [0, 23], "umowa sprzedaży": [0]})
+
+    def test_weighted_scores(self):
+        scores = self.matcher.scores("umowa sprzedaży, kara, kara")
+        self.assertEqual(scores, {"prawo cywilne": 3.0, "prawo karne": 2.0})
+
+    def test_matches_naive_substring_search(self):
+        legal_fields = {"a": ["ab", "bc", "abcd"], "b": ["c", "dab", "xyz"]}
+        text = "xxabcdabcc"
+        expected = {field: sum(keyword in text for keyword in keywords) for field, keywords in legal_fields.items()}
+        self.assertEqual(KeywordMatcher(legal_fields).count(text), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
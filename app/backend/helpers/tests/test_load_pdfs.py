@@ -6,9 +6,35 @@ from app.backend.helpers.load_pdfs import (
     save_to_mongodb,
     save_to_mongodb_binary,
     load_legal_fields,
-    classify_legal_field
+    classify_legal_field,
+    process_pdf,
+    parse_file_name,
+    build_upsert_requests,
+    store_pdf_in_gridfs,
+    remove_orphaned_files,
+    load_manifest,
+    save_manifest,
+    filter_pending_files,
+    claim_scraper_changes,
+    document_signature,
+    group_near_duplicates,
+    mark_near_duplicates,
+    update_index_for_duplicates,
+    load_pending_domains,
+    save_pending_domains,
+    main
 )
+from app.backend import MongoDBHandler as mongo_handler_module
+from app.backend.BM25Index import BM25Index
+from app.backend.benchmarks.in_memory import use_in_memory_mongo
+from app.backend.helpers.keyword_matcher import KeywordMatcher
+import hashlib
+import json
+import os
+import tempfile
 import bson
+import fitz
+import mongomock
 
 
 class TestLoadPdfs(unittest.TestCase):
@@ -63,6 +89,16 @@ class TestLoadPdfs(unittest.TestCase):
         self.assertEqual(inserted_document['file_name'], 'file.pdf')
         self.assertIsInstance(inserted_document['file_data'], bson.Binary)
         self.assertEqual(inserted_document['legal_field'], 'Some Legal Field')
+        self.assertIn('content_hash', inserted_document)
+        self.assertNotIn('text', inserted_document)
+
+    @patch('builtins.open', new_callable=mock_open, read_data=b'%PDF-1.4...')
+    def test_save_to_mongodb_binary_with_text(self, mock_file):
+        mock_collection = MagicMock()
+        save_to_mongodb_binary(mock_collection, '/fake/file.pdf', 'Some Legal Field', 'Extracted text')
+
+        args, kwargs = mock_collection.insert_one.call_args
+        self.assertEqual(args[0]['text'], 'Extracted text')
 
     @patch('os.path.exists')
     @patch('builtins.open', new_callable=mock_open, read_data='{"Field1": ["keyword1", "keyword2"]}')
@@ -107,5 +143,256 @@ class TestLoadPdfs(unittest.TestCase):
             mocked_print.assert_not_called()
 
 
+    def test_classify_legal_field_with_preloaded_fields(self):
+        with patch('app.backend.helpers.load_pdfs.load_legal_fields') as mock_load_legal_fields, \
+                patch('builtins.print'):
+            result = classify_legal_field("Nowy podatek", legal_fields={"Finance": ["podatek"]})
+            mock_load_legal_fields.assert_not_called()
+        self.assertEqual(result, "Finance")
+
+
+class TestParallelIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pdf_path = os.path.join(self.tmp_dir.name, 'D2000000000101.pdf')
+        with fitz.open() as doc:
+            page = doc.new_page()
+            page.insert_text((72, 72), "Testament i spadek")
+            doc.save(self.pdf_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_process_pdf(self):
+        with patch('app.backend.helpers.load_pdfs._worker_matcher', KeywordMatcher({"prawo cywilne": ["testament"]})), \
+                patch('builtins.print'), patch('fitz.open', wraps=fitz.open) as mock_fitz_open:
+            result = process_pdf(self.pdf_path)
+
+        # PDF jest otwierany z dysku, a nie z bajtów wczytanych do pamięci
+        mock_fitz_open.assert_called_once_with(self.pdf_path)
+        self.assertEqual(result['file_name'], 'D2000000000101.pdf')
+        self.assertEqual(result['legal_field'], 'prawo cywilne')
+        self.assertIn("Testament i spadek", result['text'])
+        with open(self.pdf_path, 'rb') as f:
+            self.assertEqual(result['content_hash'], hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual((result['year'], result['journal'], result['position']), (2000, 0, 1))
+        self.assertEqual(result['page_offsets'], [0])
+        self.assertEqual(len(result['minhash']), 64)
+
+    def test_parse_file_name(self):
+        self.assertEqual(parse_file_name('/data/2000/D2000122131001.pdf'),
+                         {'year': 2000, 'journal': 122, 'position': 1310})
+        self.assertEqual(parse_file_name('/data/1918/D19180001.pdf'),
+                         {'year': 1918, 'journal': None, 'position': None})
+        self.assertEqual(parse_file_name('/data/1990/ustawa.pdf')['year'], 1990)
+        self.assertIsNone(parse_file_name('/data/inne/ustawa.pdf')['year'])
+
+    def test_build_upsert_requests_keyed_by_content_hash(self):
+        result = {'path': self.pdf_path, 'file_name': 'D2000000000101.pdf', 'content_hash': 'abc',
+                  'legal_field': 'prawo cywilne', 'text': 'Testament', 'page_offsets': [0], 'minhash': [1, 2], 'size': 10,
+                  'year': 2000, 'journal': 0, 'position': 1}
+        upsert, cleanup = build_upsert_requests(result)
+        self.assertEqual(upsert._doc['$set']['year'], 2000)
+
+        self.assertEqual(upsert._filter, {'content_hash': 'abc'})
+        self.assertTrue(upsert._upsert)
+        self.assertEqual(upsert._doc['$set']['file_id'], 'abc')
+        self.assertNotIn('file_data', upsert._doc['$set'])
+        self.assertEqual(upsert._doc['$unset'], {'file_data': ''})
+        self.assertEqual(cleanup._filter, {'file_name': 'D2000000000101.pdf', 'content_hash': {'$ne': 'abc'}})
+
+    def test_store_pdf_in_gridfs_is_content_addressed(self):
+        fs = MagicMock()
+        fs.exists.return_value = False
+        result = {'path': self.pdf_path, 'file_name': 'D2000000000101.pdf', 'content_hash': 'abc'}
+
+        self.assertTrue(store_pdf_in_gridfs(fs, result))
+        args, kwargs = fs.put.call_args
+        self.assertEqual(kwargs['_id'], 'abc')
+        self.assertEqual(kwargs['filename'], 'D2000000000101.pdf')
+
+        fs.exists.return_value = True
+        self.assertFalse(store_pdf_in_gridfs(fs, result))
+        fs.put.assert_called_once()
+
+    def test_remove_orphaned_files_keeps_referenced(self):
+        fs = MagicMock()
+        fs.exists.return_value = True
+        collection = MagicMock()
+        collection.count_documents.side_effect = lambda query, limit: 1 if query['file_id'] == 'shared' else 0
+
+        remove_orphaned_files(fs, collection, ['old', 'shared'])
+        fs.delete.assert_called_once_with('old')
+
+    def test_manifest_skips_loaded_files(self):
+        manifest_path = os.path.join(self.tmp_dir.name, 'manifest.json')
+        self.assertEqual(load_manifest(manifest_path), {})
+        self.assertEqual(filter_pending_files([self.pdf_path], {}), [self.pdf_path])
+
+        stat = os.stat(self.pdf_path)
+        save_manifest({self.pdf_path: {'size': stat.st_size, 'mtime': stat.st_mtime}}, manifest_path)
+        manifest = load_manifest(manifest_path)
+        self.assertEqual(filter_pending_files([self.pdf_path], manifest), [])
+
+        os.utime(self.pdf_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(filter_pending_files([self.pdf_path], manifest), [self.pdf_path])
+
+    def test_manifest_skips_files_with_unchanged_content(self):
+        stat = os.stat(self.pdf_path)
+        with open(self.pdf_path, 'rb') as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        manifest = {self.pdf_path: {'size': stat.st_size, 'mtime': stat.st_mtime - 10, 'content_hash': content_hash}}
+
+        self.assertEqual(filter_pending_files([self.pdf_path], manifest), [])
+        self.assertEqual(manifest[self.pdf_path]['mtime'], stat.st_mtime)
+
+        manifest[self.pdf_path].update(mtime=0, content_hash='old')
+        self.assertEqual(filter_pending_files([self.pdf_path], manifest), [self.pdf_path])
+
+    def test_claim_scraper_changes(self):
+        changes_path = os.path.join(self.tmp_dir.name, '.changes.jsonl')
+        missing_path = os.path.join(self.tmp_dir.name, 'D2000000000201.pdf')
+        with open(changes_path, 'w', encoding='utf-8') as file:
+            for path in [self.pdf_path, missing_path, self.pdf_path]:
+                file.write(json.dumps({'path': os.path.abspath(path), 'size': 1}) + '\n')
+
+        pdf_files, claimed_path = claim_scraper_changes(changes_path, self.tmp_dir.name)
+        self.assertEqual(pdf_files, [os.path.join(self.tmp_dir.name, 'D2000000000101.pdf')])
+        self.assertEqual(claimed_path, f"{changes_path}.ingesting")
+        self.assertFalse(os.path.exists(changes_path))
+
+        # Lista przejęta przez przerwany import jest łączona z nowymi pobraniami
+        with open(changes_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'path': os.path.abspath(missing_path), 'size': 1}) + '\n')
+        with open(missing_path, 'wb') as file:
+            file.write(b'%PDF')
+        pdf_files, _ = claim_scraper_changes(changes_path, self.tmp_dir.name)
+        self.assertEqual(sorted(pdf_files), sorted([self.pdf_path, missing_path]))
+
+        os.remove(claimed_path)
+        self.assertEqual(claim_scraper_changes(changes_path, self.tmp_dir.name), ([], None))
+
+
 if __name__ == '__main__':
     unittest.main()
+
+
+ACT_TEXT = " ".join(f"Art. {number}. Przepis numer {number} dotyczy spadku i testamentu." for number in range(1, 60))
+
+
+class TestNearDuplicates(unittest.TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.ustawy
+        documents = [
+            ('D2001000000101.pdf', 2001, ACT_TEXT),
+            ('D2015000000101.pdf', 2015, ACT_TEXT + " Art. 60. Przepis dodany nowelizacją."),
+            ('D2010000000101.pdf', 2010, "Kto dokonuje kradzieży, podlega karze pozbawienia wolności."),
+        ]
+        self.collection.insert_many([
+            {'file_name': file_name, 'year': year, 'journal': 0, 'position': 1, 'legal_field': 'prawo cywilne',
+             'text': text, 'minhash': document_signature(text)} for file_name, year, text in documents])
+
+    def test_group_near_duplicates_puts_latest_first(self):
+        groups = group_near_duplicates(self.collection.find())
+        self.assertEqual(sorted([document['file_name'] for document in group] for group in groups),
+                         [['D2010000000101.pdf'], ['D2015000000101.pdf', 'D2001000000101.pdf']])
+
+    def test_mark_near_duplicates_supersedes_older_versions(self):
+        superseded, restored = mark_near_duplicates(self.collection, ['prawo cywilne'])
+
+        self.assertEqual((superseded, restored), ({'D2001000000101.pdf'}, set()))
+        self.assertEqual(self.collection.find_one({'file_name': 'D2001000000101.pdf'})['superseded_by'],
+                         'D2015000000101.pdf')
+        self.assertEqual(self.collection.count_documents({'superseded_by': None}), 2)
+        self.assertEqual(mark_near_duplicates(self.collection, ['prawo cywilne']), (set(), set()))
+
+        self.collection.delete_one({'file_name': 'D2015000000101.pdf'})
+        self.assertEqual(mark_near_duplicates(self.collection, ['prawo cywilne']), (set(), {'D2001000000101.pdf'}))
+
+    def test_update_index_for_duplicates(self):
+        index = BM25Index()
+        index.add_document('D2001000000101.pdf', ACT_TEXT, 'prawo cywilne')
+        mark_near_duplicates(self.collection, ['prawo cywilne'])
+
+        update_index_for_duplicates(index, self.collection, ['prawo cywilne'], set())
+        self.assertEqual(index.search("testament"), [])
+
+        self.collection.update_one({'file_name': 'D2001000000101.pdf'}, {'$set': {'superseded_by': None}})
+        update_index_for_duplicates(index, self.collection, ['prawo cywilne'], {'D2001000000101.pdf'})
+        self.assertEqual(index.search("testament")[0]['file_name'], 'D2001000000101.pdf')
+
+    def test_reingested_superseded_file_stays_out_of_the_index(self):
+        index = BM25Index()
+        superseded, restored = mark_near_duplicates(self.collection, ['prawo cywilne'])
+        update_index_for_duplicates(index, self.collection, ['prawo cywilne'], restored)
+
+        # Ponowny import (np. --force) dodaje plik do indeksu, a jego oznaczenie w bazie się nie zmienia
+        index.add_document('D2001000000101.pdf', ACT_TEXT, 'prawo cywilne')
+        superseded, restored = mark_near_duplicates(self.collection, ['prawo cywilne'])
+        self.assertEqual((superseded, restored), (set(), set()))
+
+        update_index_for_duplicates(index, self.collection, ['prawo cywilne'], restored)
+        self.assertNotIn('D2001000000101.pdf', index.doc_chunks)
+
+
+class TestIncrementalIngest(unittest.TestCase):
+    def setUp(self):
+        self.previous_client = mongo_handler_module._mongo_client
+        self.client = use_in_memory_mongo()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root_dir = os.path.join(self.tmp_dir.name, 'dziennik_ustaw')
+        os.makedirs(self.root_dir)
+        self.pdf_path = os.path.join(self.root_dir, 'D2000000000101.pdf')
+        with fitz.open() as doc:
+            doc.new_page().insert_text((72, 72), "Testament i spadek")
+            doc.save(self.pdf_path)
+
+        indexes = os.path.join(self.tmp_dir.name, 'indexes')
+        self.pending_path = os.path.join(indexes, 'pending.json')
+        self.patches = [
+            patch('app.backend.helpers.load_pdfs.INGEST_MANIFEST_PATH', os.path.join(indexes, 'manifest.json')),
+            patch('app.backend.helpers.load_pdfs.PENDING_DOMAINS_PATH', self.pending_path),
+            patch('app.backend.helpers.load_pdfs.BM25_INDEX_PATH', os.path.join(indexes, 'bm25.json.gz')),
+            patch('app.backend.helpers.load_pdfs.DENSE_INDEX_PATH', os.path.join(indexes, 'dense')),
+        ]
+        for active in self.patches:
+            active.start()
+
+    def tearDown(self):
+        for active in self.patches:
+            active.stop()
+        mongo_handler_module._mongo_client = self.previous_client
+        self.tmp_dir.cleanup()
+
+    def test_pending_domains_round_trip(self):
+        self.assertEqual(load_pending_domains(self.pending_path), set())
+        save_pending_domains({'prawo cywilne', 'prawo karne'}, self.pending_path)
+        self.assertEqual(load_pending_domains(self.pending_path), {'prawo cywilne', 'prawo karne'})
+        save_pending_domains(set(), self.pending_path)
+        self.assertFalse(os.path.exists(self.pending_path))
+
+    def test_interrupted_refresh_is_finished_by_the_next_run(self):
+        with open(os.path.join(self.root_dir, '.changes.jsonl'), 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'path': os.path.abspath(self.pdf_path)}) + '\n')
+        argv = ['--root-dir', self.root_dir, '--workers', '1']
+
+        with patch('app.backend.helpers.load_pdfs.build_snapshots', side_effect=RuntimeError("dysk pełny")):
+            with self.assertRaises(RuntimeError):
+                main(argv)
+        db = self.client['chatbot_db']
+        legal_field = db['ustawy'].find_one()['legal_field']
+        self.assertEqual(load_pending_domains(self.pending_path), {legal_field})
+        self.assertEqual(db['corpus_versions'].count_documents({}), 0)
+
+        # Plik jest już w manifeście, ale odświeżenie jego dziedziny zostaje dokończone
+        with patch('app.backend.helpers.load_pdfs.build_snapshots') as mock_build_snapshots:
+            main(argv)
+        self.assertEqual(mock_build_snapshots.call_args.kwargs['legal_fields'], {legal_field})
+        self.assertEqual(db['corpus_versions'].find_one({'_id': legal_field})['version'], 1)
+        self.assertFalse(os.path.exists(self.pending_path))
+        self.assertFalse(os.path.exists(os.path.join(self.root_dir, '.changes.jsonl.ingesting')))
+
+        with patch('app.backend.helpers.load_pdfs.build_snapshots') as mock_build_snapshots:
+            main(argv)
+        mock_build_snapshots.assert_not_called()
+        self.assertEqual(db['corpus_versions'].find_one({'_id': legal_field})['version'], 1)
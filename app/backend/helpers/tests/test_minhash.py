@@ -0,0 +1,37 @@
+import unittest
+from app.backend.helpers.minhash import MinHasher, MinHashLSH, char_shingles, estimate_similarity, word_shingles
+
+
+class TestMinHash(unittest.TestCase):
+    def setUp(self):
+        self.hasher = MinHasher(num_perm=128)
+
+    def test_shingles(self):
+        self.assertEqual(char_shingles("abcde", size=4), {"abcd", "bcde"})
+        self.assertEqual(char_shingles("ab", size=4), {"ab"})
+        self.assertEqual(word_shingles(["a", "b", "c"], size=2), {"a b", "b c"})
+
+    def test_similarity_estimate(self):
+        first = {f"s{i}" for i in range(100)}
+        second = {f"s{i}" for i in range(20, 120)}
+        estimate = estimate_similarity(self.hasher.signature(first), self.hasher.signature(second))
+        self.assertAlmostEqual(estimate, 80 / 120, delta=0.12)
+        self.assertEqual(estimate_similarity(self.hasher.signature(first), self.hasher.signature(first)), 1.0)
+
+    def test_lsh_query_and_remove(self):
+        lsh = MinHashLSH(bands=32, rows=4)
+        similar = self.hasher.signature(char_shingles("ustawa o podatku dochodowym od osób fizycznych"))
+        lsh.insert('a', similar)
+        lsh.insert('b', self.hasher.signature(char_shingles("kodeks postępowania karnego")))
+
+        query = self.hasher.signature(char_shingles("ustawa o podatku dochodowym od osób prawnych"))
+        self.assertIn('a', lsh.query(query))
+        self.assertNotIn('b', lsh.query(query))
+
+        lsh.remove('a')
+        self.assertNotIn('a', lsh.query(query))
+        self.assertEqual(len(lsh), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
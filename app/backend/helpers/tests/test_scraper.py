@@ -0,0 +1,212 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.backend.helpers.scraper import Crawler, CrawlState, RateLimiter
+
+PDF_BYTES = b'%PDF-1.4 fixture'
+
+FIXTURES = {
+    '/DU/rok/1990': """
+        <table id="c_table"><tbody>
+            <tr><td class="numberAlign"><a href="/DU/rok/1990/wydanie/1">1</a></td></tr>
+        </tbody></table>""",
+    '/DU/rok/1990/wydanie/1': """
+        <table id="c_table"><tbody>
+            <tr><td class="numberAlign"><a href="/DU/1990/1/1">1</a></td></tr>
+            <tr><td class="numberAlign"><a href="/DU/1990/1/2">2</a></td></tr>
+        </tbody></table>""",
+    '/DU/1990/1/1': '<a href="/DU/1990/1/1/D1990001000101.pdf">pdf</a><a href="/other.pdf">inny</a>',
+    '/DU/1990/1/2': '<a href="/DU/1990/1/2/D1990001000201.pdf">pdf</a>',
+    '/DU/rok/2020': """
+        <table id="c_table"><tbody>
+            <tr><td><a href="/DU/2020/1/D2020000000101.pdf">pdf</a></td></tr>
+            <tr><td><a href="/DU/2020/2/D2020000000201.pdf">pdf</a></td></tr>
+        </tbody></table>""",
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests_log = []
+    body_delay = 0
+    lock = threading.Lock()
+    active_bodies = 0
+    max_active_bodies = 0
+
+    def do_GET(self):
+        StubHandler.requests_log.append((self.path, self.headers.get('If-None-Match')))
+        if self.path.endswith('.pdf'):
+            etag = f'"{self.path}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(PDF_BYTES)))
+            self.end_headers()
+            self.wfile.flush()
+            with StubHandler.lock:
+                StubHandler.active_bodies += 1
+                StubHandler.max_active_bodies = max(StubHandler.max_active_bodies, StubHandler.active_bodies)
+            time.sleep(StubHandler.body_delay)
+            self.wfile.write(PDF_BYTES)
+            with StubHandler.lock:
+                StubHandler.active_bodies -= 1
+            return
+
+        body = FIXTURES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCrawler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.requests_log = []
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_crawler(self):
+        return Crawler(base_url_direct=self.base_url, download_dir=self.tmp_dir.name, workers=4,
+                       rate_limit=0, retries=0)
+
+    def test_scrape_year_through_wydanie_pages(self):
+        crawler = self.make_crawler()
+        try:
+            downloaded = crawler.scrape_year('1990')
+        finally:
+            crawler.close()
+
+        self.assertEqual(downloaded, 2)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir.name, '1990'))),
+                         ['D1990001000101.pdf', 'D1990001000201.pdf'])
+
+    def test_scrape_year_with_direct_pdfs_and_limit(self):
+        crawler = self.make_crawler()
+        try:
+            downloaded = crawler.scrape_year('2020', limit=1)
+        finally:
+            crawler.close()
+
+        self.assertEqual(downloaded, 1)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name, '2020')), ['D2020000000101.pdf'])
+
+    def test_rerun_skips_unchanged_pdfs_with_etag(self):
+        crawler = self.make_crawler()
+        try:
+            crawler.scrape_year('2020')
+        finally:
+            crawler.close()
+
+        StubHandler.requests_log = []
+        crawler = self.make_crawler()
+        try:
+            downloaded = crawler.scrape_year('2020')
+        finally:
+            crawler.close()
+
+        self.assertEqual(downloaded, 0)
+        pdf_requests = [entry for entry in StubHandler.requests_log if entry[0].endswith('.pdf')]
+        self.assertEqual(len(pdf_requests), 2)
+        self.assertTrue(all(etag is not None for _, etag in pdf_requests))
+
+    def test_missing_file_is_downloaded_again(self):
+        crawler = self.make_crawler()
+        try:
+            crawler.scrape_year('2020')
+            os.remove(os.path.join(self.tmp_dir.name, '2020', 'D2020000000101.pdf'))
+            downloaded = crawler.scrape_year('2020')
+        finally:
+            crawler.close()
+
+        self.assertEqual(downloaded, 1)
+
+    def test_streamed_downloads_respect_per_host_concurrency(self):
+        StubHandler.body_delay = 0.1
+        StubHandler.max_active_bodies = 0
+        crawler = Crawler(base_url_direct=self.base_url, download_dir=self.tmp_dir.name, workers=4,
+                          rate_limit=0, per_host_concurrency=1, retries=0)
+        try:
+            downloaded = crawler.scrape_year('2020')
+        finally:
+            crawler.close()
+            StubHandler.body_delay = 0
+
+        self.assertEqual(downloaded, 2)
+        self.assertEqual(StubHandler.max_active_bodies, 1)
+
+    def test_downloads_are_listed_for_the_loader(self):
+        crawler = self.make_crawler()
+        try:
+            crawler.scrape_year('2020')
+            crawler.scrape_year('2020')
+        finally:
+            crawler.close()
+
+        with open(os.path.join(self.tmp_dir.name, '.changes.jsonl'), encoding='utf-8') as file:
+            changes = [json.loads(line) for line in file]
+        self.assertEqual(sorted(os.path.basename(change['path']) for change in changes),
+                         ['D2020000000101.pdf', 'D2020000000201.pdf'])
+        self.assertTrue(all(os.path.isabs(change['path']) and change['size'] == len(PDF_BYTES)
+                            for change in changes))
+
+    def test_crawl_state_persists(self):
+        crawler = self.make_crawler()
+        try:
+            crawler.scrape_year('2020')
+        finally:
+            crawler.close()
+
+        state = CrawlState(os.path.join(self.tmp_dir.name, '.crawl_state.json'))
+        entry = state.get(f"{self.base_url}/DU/2020/1/D2020000000101.pdf")
+        self.assertEqual(entry['size'], len(PDF_BYTES))
+        self.assertEqual(entry['etag'], '"/DU/2020/1/D2020000000101.pdf"')
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_are_spaced_per_host(self):
+        limiter = RateLimiter(rate=20, concurrency=2)
+
+        begin = time.monotonic()
+        for _ in range(5):
+            limiter.acquire('http://example.org/a').release()
+        elapsed = time.monotonic() - begin
+
+        self.assertGreaterEqual(elapsed, 4 / 20 - 0.01)
+
+        begin = time.monotonic()
+        limiter.acquire('http://other.org/a').release()
+        self.assertLess(time.monotonic() - begin, 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
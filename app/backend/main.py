@@ -1,35 +1,94 @@
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, StrictInt
 from typing import List, Optional
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 from .GenerateResponseService import LanguageModelService
+from .MongoDBHandler import check_mongo_ready
+from .Metrics import RequestTrace, metrics_response_body
+from .ServiceContainer import ServiceContainer
+from .AdmissionControl import AdmissionController, Overloaded, StageTimeout
+from .SessionStore import SESSION_COOKIE, SESSION_TTL, create_session_store, new_session_id
 
 # Load environment variables
 load_dotenv()
 
+# Configuration
+QUESTION_CHARACTER_LIMIT = int(os.getenv("CHARACTER_LIMIT", "500"))
+CORPUS_VERSION_POLL_SECONDS = int(os.getenv("CORPUS_VERSION_POLL_SECONDS", "60"))
+# Przy żądaniach z ciasteczkami przeglądarka nie akceptuje "*" - adresy frontendu muszą być podane wprost
+CORS_ORIGINS = [origin.strip() for origin in
+                os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",") if origin.strip()]
+# Lax wystarcza, gdy frontend i API są w tej samej witrynie; dla innej witryny: none (wymaga HTTPS)
+SESSION_COOKIE_SAMESITE = os.getenv("SESSION_COOKIE_SAMESITE", "lax").lower()
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "0") == "1" or SESSION_COOKIE_SAMESITE == "none"
+
+# The Language Model Service is built lazily and warmed up in the background after startup
+services = ServiceContainer(LanguageModelService)
+# Pytania ponad limit czekają w ograniczonej kolejce; przy przeciążeniu serwer od razu odpowiada 429/503
+admission = AdmissionController()
+OVERLOADED_DETAIL = "Serwer jest przeciążony, spróbuj ponownie później."
+
+# Zakres lat wybrany przez /set_years jest przechowywany osobno dla każdej sesji (ciasteczko session_id)
+sessions = create_session_store()
+
+# Define global variables
+# Bez wybranego zakresu lat wyszukiwanie obejmuje wszystkie dokumenty, także te bez ustalonego roku
+default_years: Optional[List[int]] = None
+restricted_years = {1940, 1941, 1942, 1943}
+
+
+async def watch_corpus_versions():
+    """Periodically drop caches of law domains that were re-ingested by load_pdfs."""
+    while True:
+        await asyncio.sleep(CORPUS_VERSION_POLL_SECONDS)
+        if not services.ready:
+            continue
+        try:
+            model = await services.get_model_async()
+            await asyncio.to_thread(model.refresh_corpus_versions)
+        except Exception as e:
+            print(f"Error refreshing corpus versions: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(sessions.ensure_indexes)
+    except Exception as e:
+        print(f"Error creating session indexes: {e}")
+    services.start()
+    corpus_watcher = asyncio.create_task(watch_corpus_versions())
+    yield
+    corpus_watcher.cancel()
+    await services.close()
+
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS Middleware Configuration
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Adjust this in production
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Configuration
-QUESTION_CHARACTER_LIMIT = int(os.getenv("CHARACTER_LIMIT", "500"))
-
-# Initialize the Language Model Service
-model = LanguageModelService()
 
-# Define global variables
-selected_years: Optional[List[int]] = [1918, 2024]
-restricted_years = {1940, 1941, 1942, 1943}
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Record request latency per endpoint, log slow requests with their stage breakdown and sample profiles."""
+    # Nieznane ścieżki trafiają do jednej etykiety, aby nie mnożyć serii metryk
+    path = request.url.path if request.url.path in {route.path for route in app.routes} else "other"
+    with RequestTrace(path):
+        return await call_next(request)
 
 
 # Pydantic models
@@ -39,7 +98,8 @@ class YearsRequest(BaseModel):
 
 class QuestionRequest(BaseModel):
     question: str
-
+    # Zakres lat dla pojedynczego pytania; bez niego obowiązuje zakres ustawiony przez /set_years
+    years: Optional[List[StrictInt]] = None
 
 
 class AnswerResponse(BaseModel):
@@ -48,40 +108,62 @@ class AnswerResponse(BaseModel):
 
 # API Endpoints
 @app.post("/set_years")
-async def set_years(request: YearsRequest):
+async def set_years(request: YearsRequest, http_request: Request, response: Response):
     """
-    Endpoint to set the range of years.
+    Endpoint to set the range of years for the session identified by the session_id cookie.
     """
-    global selected_years
-
     # Validate request
     if not request.years:
         raise HTTPException(status_code=400, detail="Nieprawidłowy format 'years'.")
+    validate_years(request.years)
 
-    for year in request.years:
+    # Update selected years of the session, starting a new session when the client has none
+    session_id = http_request.cookies.get(SESSION_COOKIE) or new_session_id()
+    await asyncio.to_thread(sessions.set_years, session_id, request.years)
+    response.set_cookie(SESSION_COOKIE, session_id, max_age=SESSION_TTL, httponly=True,
+                        samesite=SESSION_COOKIE_SAMESITE, secure=SESSION_COOKIE_SECURE)
+    return {"message": "Zakres lat został ustawiony.", "years": request.years}
+
+
+def validate_years(years: List[int]):
+    for year in years:
         if year in restricted_years:
             raise HTTPException(status_code=400, detail="Lata 1940, 1941, 1942, 1943 są niedostępne.")
 
-    # Update selected years
-    selected_years = request.years
-    return {"message": "Zakres lat został ustawiony.", "years": selected_years}
+
+def validate_question(request: QuestionRequest):
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Nieprawidłowy format 'question'.")
+
+    if len(request.question) > QUESTION_CHARACTER_LIMIT:
+        raise HTTPException(status_code=400, detail="Zbyt długie pytanie.")
+
+    if request.years is not None:
+        validate_years(request.years)
+
+
+async def request_years(request: QuestionRequest, http_request: Request):
+    """Years of the question, else the years set for the session, else the default range (None: all years)."""
+    if request.years:
+        return request.years
+    years = await asyncio.to_thread(sessions.get_years, http_request.cookies.get(SESSION_COOKIE))
+    return years or default_years
 
 
 @app.post("/ask", response_model=AnswerResponse)
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
     """
     Endpoint to ask a question and get a response.
     """
     # Validate the question
-    if not request.question or not request.question.strip():
-        raise HTTPException(status_code=400, detail="Nieprawidłowy format 'question'.")
-
-    if len(request.question) > QUESTION_CHARACTER_LIMIT:
-        raise HTTPException(status_code=400, detail="Zbyt długie pytanie.")
+    validate_question(request)
 
     # Process the question
     try:
-        answer = model.get_model_response(request.question)
+        async with admission.admit():
+            model = await services.get_model_async()
+            years = await request_years(request, http_request)
+            answer = await model.get_model_response_async(request.question, years=years)
         if not answer:
             raise HTTPException(status_code=204, detail="Brak odpowiedzi od modelu.")
         return AnswerResponse(answer=answer)
@@ -89,12 +171,93 @@ async def ask_question(request: QuestionRequest):
     except HTTPException as e:
         raise e  # Re-raise specific HTTP exceptions
 
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=OVERLOADED_DETAIL, headers={"Retry-After": "1"})
+
+    except StageTimeout as e:
+        print(f"Timeout: {e}")
+        raise HTTPException(status_code=504, detail="Przekroczono czas oczekiwania na odpowiedź.")
+
     except Exception as e:
         # Log error and return server error
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Wewnętrzny błąd serwera")
 
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest, http_request: Request):
+    """
+    Endpoint streaming the answer as Server-Sent Events: 'meta' (domain and sources), 'token' pieces, then 'done'.
+    """
+    validate_question(request)
+    years = await request_years(request, http_request)
+    try:
+        await admission.acquire()
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=OVERLOADED_DETAIL, headers={"Retry-After": "1"})
+
+    # Miejsce jest zwalniane dopiero po wysłaniu całej odpowiedzi albo po rozłączeniu klienta
+    try:
+        model = await services.get_model_async()
+    except BaseException:
+        admission.release()
+        raise
+
+    async def event_stream():
+        try:
+            async for event, data in model.get_model_response_stream(request.question, years=years):
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            admission.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/stats")
+async def get_stats():
+    """
+    Endpoint returning runtime metrics (domain classifier hit rate and latency, text cache).
+    """
+    model = await services.get_model_async()
+    return {**model.get_stats(), 'admission': admission.stats()}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: request and per-stage latency histograms, document, byte, prompt, cache and LLM error counters.
+    """
+    body, content_type = metrics_response_body()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """
+    Liveness check: the process is up and serving requests, regardless of its dependencies.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness check: the services are warmed up and MongoDB answers through the shared client (with pool stats).
+    """
+    if not services.ready:
+        raise HTTPException(status_code=503, detail={"status": "starting", "services": services.status()})
+    try:
+        mongo = await asyncio.to_thread(check_mongo_ready)
+    except Exception as e:
+        print(f"MongoDB is not ready: {e}")
+        raise HTTPException(status_code=503, detail="Baza danych jest niedostępna.")
+    return {"status": "ready", "services": services.status(), "mongo": mongo}
+
+
 @app.get("/")
 async def health_check():
     """
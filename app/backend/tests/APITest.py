@@ -1,8 +1,9 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import patch, ANY
 
 from app.backend.main import app
+from app.backend.AdmissionControl import Overloaded, StageTimeout
 
 client = TestClient(app)
 
@@ -12,7 +13,7 @@ def setup_and_teardown():
     yield
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_valid_question(mock_get_model_response):
     mock_get_model_response.return_value = "Próbna odpowiedź na potrzeby testów"
 
@@ -22,10 +23,10 @@ def test_valid_question(mock_get_model_response):
 
     assert response.status_code == 200
     assert response.json()["answer"] == "Próbna odpowiedź na potrzeby testów"
-    mock_get_model_response.assert_called_once_with(question)
+    mock_get_model_response.assert_called_once_with(question, years=ANY)
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_valid_question_without_sense(mock_get_model_response):
     mock_get_model_response.return_value = "Próbna odpowiedź na potrzeby testów"
 
@@ -35,10 +36,10 @@ def test_valid_question_without_sense(mock_get_model_response):
 
     assert response.status_code == 200
     assert response.json()["answer"] is not None
-    mock_get_model_response.assert_called_once_with(question)
+    mock_get_model_response.assert_called_once_with(question, years=ANY)
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_empty_string_question_provided(mock_get_model_response):
     response = client.post("/ask", json={"question": ""})
 
@@ -48,7 +49,7 @@ def test_empty_string_question_provided(mock_get_model_response):
     mock_get_model_response.assert_not_called()
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_unprocessable_entity(mock_get_model_response):
     response = client.post("/ask", json={"differentElement": ""})
 
@@ -57,7 +58,7 @@ def test_unprocessable_entity(mock_get_model_response):
     assert response.json() is not None
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_question_is_not_of_type_str(mock_get_model_response):
     response = client.post("/ask", json={"question": 2000})
 
@@ -66,7 +67,7 @@ def test_question_is_not_of_type_str(mock_get_model_response):
     assert response.json() is not None
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_question_is_too_long(mock_get_model_response):
     long_question = "A" * 2001
     response = client.post("/ask", json={"question": long_question})
@@ -76,7 +77,7 @@ def test_question_is_too_long(mock_get_model_response):
     mock_get_model_response.assert_not_called()
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_ask_question_no_answer(mock_get_model_response):
     mock_get_model_response.return_value = None
 
@@ -85,10 +86,10 @@ def test_ask_question_no_answer(mock_get_model_response):
 
     assert response.status_code == 204
 
-    mock_get_model_response.assert_called_once_with(question)
+    mock_get_model_response.assert_called_once_with(question, years=ANY)
 
 
-@patch('app.backend.main.LanguageModelService.get_model_response')
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
 def test_ask_question_internal_server_error(mock_get_model_response):
     mock_get_model_response.side_effect = Exception("Simulated internal error")
 
@@ -99,7 +100,7 @@ def test_ask_question_internal_server_error(mock_get_model_response):
     assert response.status_code == 500
     assert response.json()["detail"] == "Wewnętrzny błąd serwera"
 
-    mock_get_model_response.assert_called_once_with(question)
+    mock_get_model_response.assert_called_once_with(question, years=ANY)
 
 
 def test_set_years_valid_request():
@@ -145,3 +146,152 @@ def test_set_years_missing_years_key():
     response = client.post("/set_years", json={})
 
     assert response.status_code == 422
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_stream')
+def test_ask_stream(mock_get_model_response_stream):
+    async def events(question, years=None):
+        yield 'meta', {'domain': 'prawo cywilne', 'sources': ['D2000000000101.pdf']}
+        yield 'token', {'text': 'Próbna'}
+        yield 'token', {'text': ' odpowiedź'}
+        yield 'done', {}
+
+    mock_get_model_response_stream.side_effect = events
+
+    response = client.post("/ask/stream", json={"question": "Jak napisać testament?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.split("\n\n")[:2] == [
+        'event: meta\ndata: {"domain": "prawo cywilne", "sources": ["D2000000000101.pdf"]}',
+        'event: token\ndata: {"text": "Próbna"}',
+    ]
+    assert response.text.endswith('event: done\ndata: {}\n\n')
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_stream')
+def test_ask_stream_empty_question(mock_get_model_response_stream):
+    response = client.post("/ask/stream", json={"question": " "})
+
+    assert response.status_code == 400
+    mock_get_model_response_stream.assert_not_called()
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
+def test_ask_question_with_years(mock_get_model_response):
+    mock_get_model_response.return_value = "Próbna odpowiedź na potrzeby testów"
+
+    response = client.post("/ask", json={"question": "Jak napisać testament?", "years": [1990, 2000]})
+
+    assert response.status_code == 200
+    mock_get_model_response.assert_called_once_with("Jak napisać testament?", years=[1990, 2000])
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
+def test_ask_question_with_restricted_years(mock_get_model_response):
+    response = client.post("/ask", json={"question": "Jak napisać testament?", "years": [1939, 1941]})
+
+    assert response.status_code == 400
+    mock_get_model_response.assert_not_called()
+
+
+@patch('app.backend.main.services.ready', True)
+@patch('app.backend.main.check_mongo_ready')
+def test_readiness_reports_pool_stats(mock_check_mongo_ready):
+    mock_check_mongo_ready.return_value = {'ping_ms': 1.0, 'pool': {'open_connections': 1, 'checked_out': 0}}
+
+    response = client.get("/health/ready")
+
+    assert response.status_code == 200
+    assert response.json()["mongo"]["pool"]["open_connections"] == 1
+
+
+@patch('app.backend.main.services.ready', True)
+@patch('app.backend.main.check_mongo_ready')
+def test_readiness_when_mongo_is_down(mock_check_mongo_ready):
+    mock_check_mongo_ready.side_effect = Exception("server selection timeout")
+
+    response = client.get("/health/ready")
+
+    assert response.status_code == 503
+
+
+@patch('app.backend.main.services.ready', False)
+@patch('app.backend.main.check_mongo_ready')
+def test_not_ready_before_warmup(mock_check_mongo_ready):
+    response = client.get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json()["detail"]["status"] == "starting"
+    mock_check_mongo_ready.assert_not_called()
+
+
+def test_liveness():
+    response = client.get("/health/live")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+def test_stats():
+    response = client.get("/stats")
+
+    assert response.status_code == 200
+    assert "hit_rate" in response.json()["domain_classifier"]
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
+def test_metrics(mock_get_model_response):
+    mock_get_model_response.return_value = "Próbna odpowiedź na potrzeby testów"
+    client.post("/ask", json={"question": "Jak napisać testament?"})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'chatbot_request_seconds_count{path="/ask"}' in response.text
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_async')
+def test_set_years_is_kept_per_session(mock_get_model_response):
+    mock_get_model_response.return_value = "Próbna odpowiedź na potrzeby testów"
+    first, second = TestClient(app), TestClient(app)
+
+    response = first.post("/set_years", json={"years": [2000, 2010]})
+    assert response.cookies.get("session_id")
+
+    first.post("/ask", json={"question": "Jak napisać testament?"})
+    mock_get_model_response.assert_called_with("Jak napisać testament?", years=[2000, 2010])
+
+    second.post("/ask", json={"question": "Jak napisać testament?"})
+    mock_get_model_response.assert_called_with("Jak napisać testament?", years=None)
+
+
+def test_cors_allows_credentials_for_the_frontend_origin():
+    response = client.post("/set_years", json={"years": [2000, 2010]}, headers={"Origin": "http://localhost:3000"})
+
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+    assert response.headers["access-control-allow-credentials"] == "true"
+    assert "samesite=lax" in response.headers["set-cookie"].lower()
+
+    response = client.post("/set_years", json={"years": [2000, 2010]}, headers={"Origin": "http://evil.example"})
+    assert "access-control-allow-origin" not in response.headers
+
+
+@patch('app.backend.main.admission.acquire', side_effect=Overloaded('queue_full', 429))
+def test_ask_rejected_when_overloaded(mock_acquire):
+    response = client.post("/ask", json={"question": "Jak napisać testament?"})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+    response = client.post("/ask/stream", json={"question": "Jak napisać testament?"})
+    assert response.status_code == 429
+
+
+@patch('app.backend.main.LanguageModelService.get_model_response_async',
+       side_effect=StageTimeout('generation', 60))
+def test_ask_stage_timeout(mock_get_model_response):
+    response = client.post("/ask", json={"question": "Jak napisać testament?"})
+
+    assert response.status_code == 504
@@ -1,18 +1,24 @@
+import asyncio
 import sys
-from unittest.mock import Mock, patch
+import time
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 
 sys.modules['ExtendedContextMatcherService'] = Mock()
 
 from ..GenerateResponseService import LanguageModelService
+from ..LLMClient import StubLLMClient
+from ..ContextBuilder import ContextBuilder
+from ..PromptCache import PromptPrefixCache
+from ..AdmissionControl import StageTimeout
 
 
 class TestLanguageModelService:
 
     @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
            return_value=['prawo cywilne', 'prawo dupy', 'prawo ulicy'])
-    @patch('app.backend.GenerateResponseService.GenerativeModel.generate_content')
+    @patch('vertexai.generative_models.GenerativeModel.generate_content')
     def test_match_law_domain_valid(self, mock_generate_content, mock_read_law_domains):
         mock_response = Mock()
         mock_response.text = 'prawo cywilne'
@@ -28,7 +34,7 @@ class TestLanguageModelService:
 
     @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
            return_value=['prawo cywilne', 'prawo karne', 'prawo rodzinne'])
-    @patch('app.backend.GenerateResponseService.GenerativeModel.generate_content')
+    @patch('vertexai.generative_models.GenerativeModel.generate_content')
     def test_match_law_domain_invalid(self, mock_generate_content, mock_read_law_domains):
         mock_response = Mock()
         mock_response.text = 'invalid law'
@@ -41,3 +47,314 @@ class TestLanguageModelService:
             service._match_law_domain('co grozi za nie płacenie podatku VAT')
 
         assert 'Model returned an invalid law domain: invalid law' in str(excinfo.value)
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_build_context_prefers_chunks(self, mock_read_law_domains):
+        service = LanguageModelService()
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [
+            {'file_name': 'D2000000000101.pdf', 'text': 'Testament może być sporządzony odręcznie.'}]
+        service.context_matcher = Mock()
+
+        context = asyncio.run(service._build_context('prawo cywilne', 'jak napisać testament'))
+
+        assert context == ('[D2000000000101.pdf]\nTestament może być sporządzony odręcznie.',
+                           ['D2000000000101.pdf'])
+        service.context_matcher.create_matching_context.assert_not_called()
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_build_context_falls_back_to_whole_files(self, mock_read_law_domains):
+        service = LanguageModelService()
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = []
+        service.context_matcher = Mock()
+        service.context_matcher.create_matching_context.return_value = ['a.pdf', 'b.pdf']
+        service.snapshots = Mock()
+        service.snapshots.get_documents.return_value = None
+
+        service.context_matcher.get_document_pages_async = AsyncMock(
+            side_effect=[('Tekst A.', None), ('Testament sporządza się odręcznie.', [0])])
+
+        context = asyncio.run(service._build_context('prawo cywilne', 'jak napisać testament'))
+
+        assert context == ('[b.pdf, s. 1]\nTestament sporządza się odręcznie.\n\n[a.pdf]\nTekst A.', ['b.pdf', 'a.pdf'])
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_build_context_reads_domain_snapshot(self, mock_read_law_domains):
+        service = LanguageModelService()
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = []
+        service.context_matcher = Mock()
+        service.snapshots = Mock()
+        service.snapshots.get_documents.return_value = [('a.pdf', 'Testament sporządza się odręcznie.', [0])]
+
+        context = asyncio.run(service._build_context('prawo cywilne', 'jak napisać testament', [2000, 2010]))
+
+        assert context == ('[a.pdf, s. 1]\nTestament sporządza się odręcznie.', ['a.pdf'])
+        service.snapshots.get_documents.assert_called_once_with('prawo cywilne', [2000, 2010])
+        service.context_matcher.create_matching_context.assert_not_called()
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne', 'prawo karne'])
+    @patch('vertexai.generative_models.GenerativeModel.generate_content')
+    def test_match_law_domain_strips_punctuation(self, mock_generate_content, mock_read_law_domains):
+        mock_response = Mock()
+        mock_response.text = '"Prawo karne."'
+        mock_generate_content.return_value = mock_response
+
+        service = LanguageModelService()
+
+        assert service._match_law_domain('co grozi za kradzież') == 'prawo karne'
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne', 'prawo karne'])
+    @patch('vertexai.generative_models.GenerativeModel.generate_content')
+    def test_classify_law_domain_skips_model_when_confident(self, mock_generate_content, mock_read_law_domains):
+        service = LanguageModelService()
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+
+        assert asyncio.run(service._classify_law_domain('jak napisać testament')) == 'prawo cywilne'
+        mock_generate_content.assert_not_called()
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne', 'prawo karne'])
+    @patch('vertexai.generative_models.GenerativeModel.generate_content_async')
+    def test_classify_law_domain_falls_back_to_model(self, mock_generate_content_async, mock_read_law_domains):
+        mock_response = Mock()
+        mock_response.text = 'prawo karne'
+        mock_generate_content_async.return_value = mock_response
+
+        service = LanguageModelService()
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = None
+
+        assert asyncio.run(service._classify_law_domain('pytanie bez słów kluczowych')) == 'prawo karne'
+        mock_generate_content_async.assert_called_once()
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_get_model_response_with_stub_llm(self, mock_read_law_domains):
+        llm_client = StubLLMClient(response='Odpowiedź.')
+        service = LanguageModelService(llm_client=llm_client)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [
+            {'file_name': 'D2000000000101.pdf', 'text': 'Testament może być sporządzony odręcznie.'}]
+
+        assert service.get_model_response('jak napisać testament') == 'Odpowiedź.'
+        assert 'Testament może być sporządzony odręcznie.' in llm_client.prompts[-1]
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_concurrent_questions_overlap(self, mock_read_law_domains):
+        latency = 0.05
+        concurrency = 20
+        service = LanguageModelService(llm_client=StubLLMClient(latency=latency))
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = None
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [{'file_name': 'a.pdf', 'text': 'Tekst.'}]
+
+        async def ask_all():
+            return await asyncio.gather(
+                *(service.get_model_response_async(f'pytanie {i}') for i in range(concurrency)))
+
+        start = time.perf_counter()
+        answers = asyncio.run(ask_all())
+        elapsed = time.perf_counter() - start
+
+        # Każde pytanie to dwa wywołania modelu; sekwencyjnie trwałoby to concurrency * 2 * latency
+        assert len(answers) == concurrency
+        assert elapsed < concurrency * 2 * latency / 4
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_get_model_response_stream(self, mock_read_law_domains):
+        service = LanguageModelService(llm_client=StubLLMClient(response='Testament sporządza się odręcznie.'))
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [
+            {'file_name': 'D2000000000101.pdf', 'text': 'Testament może być sporządzony odręcznie.'}]
+
+        async def collect():
+            return [event async for event in service.get_model_response_stream('jak napisać testament')]
+
+        events = asyncio.run(collect())
+
+        assert events[0] == ('meta', {'domain': 'prawo cywilne', 'sources': ['D2000000000101.pdf']})
+        assert ''.join(data['text'] for name, data in events if name == 'token') == 'Testament sporządza się odręcznie.'
+        assert events[-1] == ('done', {})
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_repeated_question_is_answered_from_cache(self, mock_read_law_domains):
+        llm_client = StubLLMClient(response='Odpowiedź.')
+        service = LanguageModelService(llm_client=llm_client)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [{'file_name': 'a.pdf', 'text': 'Tekst.'}]
+
+        assert service.get_model_response('Jak napisać testament?') == 'Odpowiedź.'
+        assert service.get_model_response('jak napisac testament') == 'Odpowiedź.'
+        assert len(llm_client.prompts) == 1
+        assert service.get_stats()['answer_cache']['exact_hits'] == 1
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_years_restrict_retrieval_and_cache(self, mock_read_law_domains):
+        llm_client = StubLLMClient(response='Odpowiedź.')
+        service = LanguageModelService(llm_client=llm_client)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [{'file_name': 'a.pdf', 'text': 'Tekst.'}]
+
+        service.get_model_response('Jak napisać testament?', years=[1990, 2000])
+        service.chunk_matcher.create_matching_context.assert_called_with(
+            'prawo cywilne', 'Jak napisać testament?', [1990, 2000])
+
+        service.get_model_response('Jak napisać testament?', years=[2010, 2020])
+        assert len(llm_client.prompts) == 2
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_llm_errors_and_prompt_size_are_counted(self, mock_read_law_domains):
+        from prometheus_client import REGISTRY
+
+        def sample(name, labels):
+            return REGISTRY.get_sample_value(name, labels) or 0.0
+
+        service = LanguageModelService(llm_client=StubLLMClient(response=Mock(side_effect=RuntimeError("quota"))))
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [{'file_name': 'a.pdf', 'text': 'Tekst.'}]
+        errors = sample('chatbot_llm_errors_total', {'call': 'answer'})
+        characters = sample('chatbot_prompt_characters_total', {'call': 'answer'})
+
+        assert service.get_model_response('Jak napisać testament?').startswith("An error occurred")
+        assert sample('chatbot_llm_errors_total', {'call': 'answer'}) == errors + 1
+        assert sample('chatbot_prompt_characters_total', {'call': 'answer'}) > characters
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne', 'prawo karne'])
+    def test_concurrent_domain_fallbacks_share_one_model_call(self, mock_read_law_domains):
+        def respond(prompt):
+            if "numbered questions" in prompt:
+                return "1: prawo cywilne\n2: prawo karne"
+            return "Odpowiedź."
+
+        llm_client = StubLLMClient(response=respond, latency=0.01)
+        service = LanguageModelService(llm_client=llm_client)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = None
+
+        async def classify_both():
+            return await asyncio.gather(service._classify_law_domain('Jak napisać testament?'),
+                                        service._classify_law_domain('Co grozi za kradzież?'))
+
+        assert asyncio.run(classify_both()) == ['prawo cywilne', 'prawo karne']
+        assert len(llm_client.prompts) == 1
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_identical_concurrent_questions_are_coalesced(self, mock_read_law_domains):
+        llm_client = StubLLMClient(response='Odpowiedź.', latency=0.05)
+        service = LanguageModelService(llm_client=llm_client)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [{'file_name': 'a.pdf', 'text': 'Tekst.'}]
+
+        async def ask_twice():
+            return await asyncio.gather(service.get_model_response_async('Jak napisać testament?'),
+                                        service.get_model_response_async('jak napisac testament'))
+
+        assert asyncio.run(ask_twice()) == ['Odpowiedź.', 'Odpowiedź.']
+        assert len(llm_client.prompts) == 1
+        assert service.get_stats()['coalescer']['coalesced'] == 1
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_cached_prefix_sends_only_the_question(self, mock_read_law_domains):
+        llm_client = StubLLMClient(response=lambda prompt: 'Testament.' if 'odręcznie' in prompt else 'Brak.')
+        service = LanguageModelService(llm_client=llm_client)
+        service.prompt_cache = PromptPrefixCache(llm_client, min_tokens=0)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.snapshots = Mock()
+        service.snapshots.get_documents.return_value = [('a.pdf', 'Testament sporządza się odręcznie.', [0])]
+
+        first = service.get_model_response('Jak napisać testament?')
+        second = service.get_model_response('Kto dziedziczy po spadkodawcy?')
+
+        assert (first, second) == ('Testament.', 'Testament.')
+        assert llm_client.prompts == ['Question: Jak napisać testament?\nAnswer:',
+                                      'Question: Kto dziedziczy po spadkodawcy?\nAnswer:']
+        assert list(llm_client.prefixes.values())[0].startswith('You are a legal assistant specializing in prawo')
+        assert service.snapshots.get_documents.call_count == 1
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_expired_prefix_is_rebuilt_and_retried(self, mock_read_law_domains):
+        llm_client = StubLLMClient(response=lambda prompt: 'Testament.' if 'odręcznie' in prompt else 'Brak.')
+        service = LanguageModelService(llm_client=llm_client)
+        service.prompt_cache = PromptPrefixCache(llm_client, min_tokens=0)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.snapshots = Mock()
+        service.snapshots.get_documents.return_value = [('a.pdf', 'Testament sporządza się odręcznie.', [0])]
+
+        service.get_model_response('Jak napisać testament?')
+        # Prefiks usunięty po stronie modelu, np. po wygaśnięciu
+        llm_client.prefixes.clear()
+
+        assert service.get_model_response('Kto dziedziczy po spadkodawcy?') == 'Testament.'
+        assert llm_client.prefixes_created == 2
+
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_domain_larger_than_prefix_budget_uses_ranked_context(self, mock_read_law_domains):
+        llm_client = StubLLMClient()
+        service = LanguageModelService(llm_client=llm_client)
+        service.prompt_cache = PromptPrefixCache(llm_client, min_tokens=0)
+        service.prefix_builder = ContextBuilder(token_budget=5, max_document_tokens=5)
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [
+            {'file_name': 'a.pdf', 'text': 'Testament sporządza się odręcznie w całości.'}]
+        service.snapshots = Mock()
+        service.snapshots.get_documents.return_value = [('a.pdf', 'Testament sporządza się odręcznie w całości.', [0])]
+
+        service.get_model_response('Jak napisać testament?')
+        service.get_model_response('Kto dziedziczy po spadkodawcy?')
+
+        service.prefix_builder = Mock(wraps=service.prefix_builder, token_budget=5)
+        service.get_model_response('Co wchodzi do spadku?', years=[2000, 2010])
+
+        assert llm_client.prefixes_created == 0
+        assert all('Documents:\n[a.pdf]' in prompt for prompt in llm_client.prompts)
+        assert service.snapshots.get_documents.call_count == 2
+        # Dziedzina za duża już w samych tekstach nie jest dzielona na fragmenty
+        service.prefix_builder.rank_documents.assert_not_called()
+
+    @patch('app.backend.GenerateResponseService.GENERATION_TIMEOUT_SECONDS', 0.01)
+    @patch('app.backend.GenerateResponseService.LanguageModelService._read_law_domains',
+           return_value=['prawo cywilne'])
+    def test_slow_generation_times_out(self, mock_read_law_domains):
+        service = LanguageModelService(llm_client=StubLLMClient(latency=1))
+        service.domain_classifier = Mock()
+        service.domain_classifier.classify.return_value = 'prawo cywilne'
+        service.chunk_matcher = Mock()
+        service.chunk_matcher.create_matching_context.return_value = [{'file_name': 'a.pdf', 'text': 'Tekst.'}]
+
+        with pytest.raises(StageTimeout):
+            service.get_model_response('Jak napisać testament?')
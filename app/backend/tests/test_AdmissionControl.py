@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+from app.backend.AdmissionControl import (AdmissionController, Overloaded, StageTimeout, iterate_with_deadline,
+                                          with_deadline)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_rejects_when_queue_is_full(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=1)
+
+        async def hold(release):
+            async with controller.admit():
+                await release.wait()
+
+        async def scenario():
+            release = asyncio.Event()
+            holder = asyncio.create_task(hold(release))
+            waiter = asyncio.create_task(hold(release))
+            await asyncio.sleep(0.01)
+            self.assertEqual((controller.in_flight, controller.queued), (1, 1))
+            with self.assertRaises(Overloaded) as rejected:
+                await controller.acquire()
+            release.set()
+            await asyncio.gather(holder, waiter)
+            return rejected.exception
+
+        rejected = asyncio.run(scenario())
+        self.assertEqual((rejected.reason, rejected.status_code), ('queue_full', 429))
+        self.assertEqual(controller.stats()['admitted'], 2)
+        self.assertEqual(controller.stats()['in_flight'], 0)
+
+    def test_controller_works_on_any_event_loop(self):
+        # Kontroler powstaje przy imporcie aplikacji, zanim proces roboczy uruchomi swoją pętlę zdarzeń
+        controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=1)
+
+        async def contended():
+            async def hold():
+                async with controller.admit():
+                    await asyncio.sleep(0.01)
+            await asyncio.gather(hold(), hold())
+
+        asyncio.run(contended())
+        asyncio.run(contended())
+        self.assertEqual(controller.stats()['admitted'], 4)
+
+    def test_queue_timeout(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=0.01)
+
+        async def scenario():
+            await controller.acquire()
+            try:
+                await controller.acquire()
+            finally:
+                controller.release()
+
+        with self.assertRaises(Overloaded) as rejected:
+            asyncio.run(scenario())
+        self.assertEqual(rejected.exception.status_code, 503)
+        self.assertEqual(controller.stats()['rejected'], {'queue_full': 0, 'queue_timeout': 1})
+        self.assertEqual(controller.queued, 0)
+
+
+class TestDeadlines(unittest.TestCase):
+    def test_with_deadline_cancels_the_stage(self):
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with self.assertRaises(StageTimeout) as timeout:
+            asyncio.run(with_deadline('generation', slow(), 0.01))
+        self.assertEqual(timeout.exception.stage, 'generation')
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(asyncio.run(with_deadline('domain', asyncio.sleep(0, 'ok'), 0)), 'ok')
+
+    def test_iterate_with_deadline(self):
+        async def pieces(delay):
+            for piece in ['a', 'b', 'c']:
+                await asyncio.sleep(delay)
+                yield piece
+
+        async def collect(delay, seconds):
+            return [piece async for piece in iterate_with_deadline('generation', pieces(delay), seconds)]
+
+        self.assertEqual(asyncio.run(collect(0, 1)), ['a', 'b', 'c'])
+        with self.assertRaises(StageTimeout):
+            asyncio.run(collect(0.02, 0.03))
+
+
+if __name__ == '__main__':
+    unittest.main()
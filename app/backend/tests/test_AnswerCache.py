@@ -0,0 +1,84 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from app.backend.AnswerCache import AnswerCache, normalize_question
+
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(maxsize=10, ttl=60, similarity=0.6)
+        self.cache.put("Jak napisać testament?", 'prawo cywilne', "Odręcznie.", ['D1964016009301.pdf'])
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  Jak  NAPISAĆ testament, własnoręcznie? "),
+                         "jak napisac testament wlasnorecznie")
+
+    def test_exact_hit_after_normalization(self):
+        entry = self.cache.get("jak napisac testament", 'prawo cywilne')
+        self.assertEqual(entry['answer'], "Odręcznie.")
+        self.assertEqual(entry['sources'], ['D1964016009301.pdf'])
+        self.assertEqual(self.cache.stats()['exact_hits'], 1)
+
+    def test_near_duplicate_hit(self):
+        entry = self.cache.get("Jak mam napisać testament?", 'prawo cywilne')
+        self.assertEqual(entry['answer'], "Odręcznie.")
+        self.assertEqual(self.cache.stats()['near_duplicate_hits'], 1)
+
+    def test_different_domain_or_years_miss(self):
+        self.assertIsNone(self.cache.get("Jak napisać testament?", 'prawo karne'))
+        self.assertIsNone(self.cache.get("Jak napisać testament?", 'prawo cywilne', years=[2000, 2010]))
+
+    def test_different_numbers_are_not_duplicates(self):
+        self.cache.put("Co mówi art. 148 kodeksu karnego?", 'prawo karne', "Zabójstwo.")
+        self.assertIsNone(self.cache.get("Co mówi art. 149 kodeksu karnego?", 'prawo karne'))
+
+    def test_ttl_expiry(self):
+        cache = AnswerCache(ttl=0.01)
+        cache.put("Jak napisać testament?", 'prawo cywilne', "Odręcznie.")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("Jak napisać testament?", 'prawo cywilne'))
+
+    def test_lru_eviction(self):
+        cache = AnswerCache(maxsize=1)
+        cache.put("Jak napisać testament?", 'prawo cywilne', "Odręcznie.")
+        cache.put("Co grozi za kradzież?", 'prawo karne', "Kara.")
+        self.assertIsNone(cache.get("Jak napisać testament?", 'prawo cywilne'))
+
+    def test_corpus_version_change_invalidates_domain(self):
+        self.cache.put("Co grozi za kradzież?", 'prawo karne', "Kara.")
+        self.assertEqual(self.cache.sync_corpus_versions({'prawo cywilne': 1, 'prawo karne': 1}), [])
+        self.assertEqual(self.cache.sync_corpus_versions({'prawo cywilne': 2, 'prawo karne': 1}), ['prawo cywilne'])
+
+        self.assertIsNone(self.cache.get("Jak napisać testament?", 'prawo cywilne'))
+        self.assertIsNone(self.cache.get("Jak mam napisać testament?", 'prawo cywilne'))
+        self.assertIsNotNone(self.cache.get("Co grozi za kradzież?", 'prawo karne'))
+
+    def test_persisted_entries_are_shared(self):
+        collection = MagicMock()
+        cache = AnswerCache(collection=collection)
+        cache.put("Jak napisać testament?", 'prawo cywilne', "Odręcznie.", ['a.pdf'])
+
+        key, document = collection.replace_one.call_args[0]
+        self.assertEqual(key, {'_id': 'prawo cywilne|all|jak napisac testament'})
+        self.assertEqual(document['answer'], "Odręcznie.")
+
+        other_worker = AnswerCache(collection=collection)
+        collection.find_one.return_value = dict(document, _id=key['_id'])
+        entry = other_worker.get("Jak napisać testament?", 'prawo cywilne')
+        self.assertEqual(entry['sources'], ['a.pdf'])
+
+    def test_stale_persisted_entry_is_ignored(self):
+        collection = MagicMock()
+        collection.find_one.return_value = {
+            '_id': 'prawo cywilne|all|jak napisac testament', 'domain': 'prawo cywilne', 'answer': "Stara.",
+            'sources': [], 'numbers': [], 'corpus_version': 1, 'created_at': time.time()}
+        collection.find.return_value = []
+        cache = AnswerCache(collection=collection)
+        cache.sync_corpus_versions({'prawo cywilne': 2})
+
+        self.assertIsNone(cache.get("Jak napisać testament?", 'prawo cywilne'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+from app.backend.BM25Index import BM25Index, chunk_text, page_of, tokenize
+from app.backend.ChunkedContextMatcherService import ChunkedContextMatcherService
+
+
+class TestBM25Index(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add_document('D2000000000101.pdf', "Testament może być sporządzony w formie pisemnej. "
+                                                      "Spadek dziedziczą zstępni spadkodawcy.", 'prawo cywilne')
+        self.index.add_document('D2000000000201.pdf', "Kto dokonuje kradzieży podlega karze pozbawienia wolności.",
+                                'prawo karne')
+        self.index.add_document('D2000000000301.pdf', "Podatek od towarów i usług rozlicza się w terminie.",
+                                'prawo finansowe')
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Testamentu, a SPADKU!"), ['testam', 'spadku'])
+
+    def test_chunk_text_overlap(self):
+        text = " ".join(f"słowo{i}" for i in range(10))
+        chunks = chunk_text(text, chunk_size=4, overlap=2)
+        self.assertEqual(chunks[0], "słowo0 słowo1 słowo2 słowo3")
+        self.assertEqual(chunks[1], "słowo2 słowo3 słowo4 słowo5")
+        self.assertEqual(chunks[-1], "słowo6 słowo7 słowo8 słowo9")
+
+    def test_search_ranks_matching_chunk_first(self):
+        results = self.index.search("jak napisać testament", top_k=2)
+        self.assertEqual(results[0]['file_name'], 'D2000000000101.pdf')
+        self.assertGreater(results[0]['score'], 0)
+
+    def test_search_filters_by_legal_field(self):
+        results = self.index.search("testament kradzież", legal_field='prawo karne')
+        self.assertEqual([result['file_name'] for result in results], ['D2000000000201.pdf'])
+
+    def test_search_filters_by_years(self):
+        self.index.add_document('D1995000000101.pdf', "Testament notarialny sporządza notariusz.", 'prawo cywilne',
+                                year=1995)
+        self.index.add_document('D2010000000101.pdf', "Testament ustny składa się przy świadkach.", 'prawo cywilne',
+                                year=2010)
+
+        results = self.index.search("testament", legal_field='prawo cywilne', years=[1990, 2000])
+        self.assertEqual([result['file_name'] for result in results], ['D1995000000101.pdf'])
+        self.assertEqual(results[0]['year'], 1995)
+
+    def test_add_document_replaces_previous_version(self):
+        self.index.add_document('D2000000000101.pdf', "Umowa najmu lokalu.", 'prawo cywilne')
+        self.assertEqual(self.index.search("testament"), [])
+        self.assertEqual(self.index.search("najmu")[0]['file_name'], 'D2000000000101.pdf')
+
+    def test_chunks_record_their_pages(self):
+        pages = ["Art. 1. " + "najem " * 250, "Art. 2. " + "dzierżawa " * 250, "Art. 3. " + "użyczenie " * 250]
+        page_offsets = [0, len(pages[0]), len(pages[0]) + len(pages[1])]
+        self.index.add_document('D2000000000401.pdf', "".join(pages), 'prawo cywilne', page_offsets=page_offsets)
+
+        self.assertEqual(page_of(page_offsets, 0), 1)
+        self.assertEqual(page_of(page_offsets, page_offsets[2]), 3)
+        self.assertEqual(self.index.search("najem", top_k=1)[0]['pages'], [1, 2])
+        self.assertEqual(self.index.search("użyczenie", top_k=1)[0]['pages'], [2, 3])
+        self.assertNotIn('pages', self.index.search("kradzieży")[0])
+
+    def test_remove_document(self):
+        self.index.remove_document('D2000000000201.pdf')
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search("kradzieży"), [])
+        self.assertNotIn('kradzi', self.index.postings)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'index.json.gz')
+            self.index.save(path)
+            loaded = BM25Index.load(path)
+
+        self.assertEqual(len(loaded), len(self.index))
+        self.assertEqual(loaded.search("spadek"), self.index.search("spadek"))
+
+
+class TestChunkedContextMatcherService(unittest.TestCase):
+    def test_create_matching_context(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'index.json.gz')
+            index = BM25Index()
+            index.add_document('D2000000000101.pdf', "Testament może być sporządzony odręcznie.", 'prawo cywilne')
+            index.save(path)
+
+            matcher = ChunkedContextMatcherService(index_path=path, top_k=3)
+
+        chunks = matcher.create_matching_context('prawo cywilne', "testament")
+        self.assertEqual(chunks[0]['file_name'], 'D2000000000101.pdf')
+        self.assertEqual(matcher.create_matching_context('prawo karne', "testament"), [])
+        self.assertEqual(matcher.create_matching_context('prawo cywilne'), [])
+
+    def test_missing_index_returns_no_chunks(self):
+        matcher = ChunkedContextMatcherService(index_path='/nonexistent/index.json.gz')
+        self.assertEqual(matcher.create_matching_context('prawo cywilne', "testament"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from app.backend.ContextBuilder import ContextBuilder, estimate_tokens, truncate_to_tokens
+
+
+class TestContextBuilder(unittest.TestCase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcd"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+
+    def test_truncate_to_tokens_cuts_at_whitespace(self):
+        self.assertEqual(truncate_to_tokens("ala ma kota", 2), "ala ma")
+        self.assertEqual(truncate_to_tokens("ala ma kota", 10), "ala ma kota")
+
+    def test_rank_documents_puts_relevant_chunks_first(self):
+        builder = ContextBuilder()
+        chunks = builder.rank_documents("jak napisać testament", [
+            ('a.pdf', "Podatek od towarów i usług."),
+            ('b.pdf', "Testament można napisać odręcznie."),
+        ])
+
+        self.assertEqual([chunk['file_name'] for chunk in chunks], ['b.pdf', 'a.pdf'])
+        self.assertGreater(chunks[0]['score'], 0)
+        self.assertEqual(chunks[1]['score'], 0.0)
+
+    def test_build_within_budget(self):
+        builder = ContextBuilder(token_budget=1000)
+        result = builder.build([{'file_name': 'a.pdf', 'text': 'Tekst A.'}, {'file_name': 'b.pdf', 'text': 'Tekst B.'}])
+
+        self.assertEqual(result['context'], "[a.pdf]\nTekst A.\n\n[b.pdf]\nTekst B.")
+        self.assertEqual(result['sources'], ['a.pdf', 'b.pdf'])
+        self.assertEqual(result['dropped'], [])
+        self.assertGreater(result['tokens'], 0)
+
+    def test_build_cites_pages(self):
+        builder = ContextBuilder(token_budget=1000)
+        result = builder.build([{'file_name': 'a.pdf', 'text': 'Art. 5.', 'pages': [3, 4]},
+                                {'file_name': 'a.pdf', 'text': 'Art. 1.', 'pages': [1, 1]},
+                                {'file_name': 'b.pdf', 'text': 'Tekst B.'}])
+
+        self.assertEqual(result['context'], "[a.pdf, s. 3-4]\nArt. 5.\n\n[a.pdf, s. 1]\nArt. 1.\n\n[b.pdf]\nTekst B.")
+        self.assertEqual(result['citations'], {'a.pdf': [1, 3, 4]})
+
+    def test_build_truncates_and_drops_over_budget(self):
+        builder = ContextBuilder(token_budget=120)
+        long_text = " ".join(["słowo"] * 200)
+        result = builder.build([{'file_name': 'a.pdf', 'text': long_text}, {'file_name': 'b.pdf', 'text': 'Tekst B.'}])
+
+        self.assertEqual(result['sources'], ['a.pdf'])
+        self.assertEqual(result['dropped'], ['b.pdf'])
+        self.assertLessEqual(result['tokens'], 120)
+        self.assertTrue(long_text.startswith(result['context'].split("\n", 1)[1]))
+        self.assertEqual(builder.stats()['dropped_sources'], 1)
+
+    def test_build_limits_tokens_per_document(self):
+        builder = ContextBuilder(token_budget=1000, max_document_tokens=100)
+        chunk = " ".join(["słowo"] * 60)
+        result = builder.build([{'file_name': 'a.pdf', 'text': chunk}, {'file_name': 'a.pdf', 'text': chunk},
+                                {'file_name': 'b.pdf', 'text': 'Tekst B.'}])
+
+        self.assertEqual(result['sources'], ['a.pdf', 'b.pdf'])
+        self.assertEqual(result['context'].count("[a.pdf]"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import mongomock
+
+from app.backend.ContextSnapshot import ContextSnapshot, SnapshotStore, snapshot_name, write_domain_snapshots
+from app.backend.helpers.build_snapshots import build_snapshots
+
+DOCUMENTS = [
+    {'file_name': 'D1995000000101.pdf', 'text': "Testament sporządza się odręcznie.", 'year': 1995,
+     'page_offsets': [0]},
+    {'file_name': 'D2004000000101.pdf', 'text': "Art. 1. Spadek.\nArt. 2. Zachowek.\n", 'year': 2004,
+     'page_offsets': [0, 16]},
+    {'file_name': 'D2008000000101.pdf', 'text': "Umowa darowizny.", 'year': 2008, 'page_offsets': [0]},
+]
+
+
+class TestContextSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_read_domain_and_buckets(self):
+        self.assertEqual(write_domain_snapshots(self.directory, 'prawo cywilne', DOCUMENTS), 3)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['prawo_cywilne.1990.snap', 'prawo_cywilne.2000.snap', 'prawo_cywilne.snap'])
+
+        snapshot = ContextSnapshot(os.path.join(self.directory, snapshot_name('prawo cywilne', 2000)))
+        self.assertEqual(snapshot.documents(), [
+            ('D2004000000101.pdf', "Art. 1. Spadek.\nArt. 2. Zachowek.\n", [0, 16]),
+            ('D2008000000101.pdf', "Umowa darowizny.", [0]),
+        ])
+        snapshot.close()
+
+    def test_store_selects_buckets_and_filters_years(self):
+        write_domain_snapshots(self.directory, 'prawo cywilne', DOCUMENTS)
+        store = SnapshotStore(self.directory)
+
+        self.assertEqual([name for name, _, _ in store.get_documents('prawo cywilne', [1990, 2005])],
+                         ['D1995000000101.pdf', 'D2004000000101.pdf'])
+        self.assertEqual(len(store.get_documents('prawo cywilne')), 3)
+        self.assertEqual(store.get_documents('prawo cywilne', [1950, 1960]), [])
+        self.assertIsNone(store.get_documents('prawo karne'))
+        self.assertEqual(store.stats()['misses'], 1)
+
+    def test_rebuild_replaces_snapshot_and_removes_empty_buckets(self):
+        write_domain_snapshots(self.directory, 'prawo cywilne', DOCUMENTS)
+        store = SnapshotStore(self.directory)
+        self.assertEqual(len(store.get_documents('prawo cywilne')), 3)
+
+        path = os.path.join(self.directory, snapshot_name('prawo cywilne'))
+        old_mtime = os.stat(path).st_mtime_ns
+        write_domain_snapshots(self.directory, 'prawo cywilne', DOCUMENTS[1:])
+        os.utime(path, ns=(old_mtime + 1, old_mtime + 1))
+
+        self.assertEqual(len(store.get_documents('prawo cywilne')), 2)
+        self.assertNotIn('prawo_cywilne.1990.snap', os.listdir(self.directory))
+        self.assertFalse(any(name.endswith('.tmp') for name in os.listdir(self.directory)))
+
+    def test_build_snapshots_from_collection(self):
+        collection = mongomock.MongoClient().db.ustawy
+        collection.insert_many([dict(document, legal_field='prawo cywilne') for document in DOCUMENTS])
+        collection.insert_one({'file_name': 'D2010000000101.pdf', 'text': "Kradzież.", 'year': 2010,
+                               'legal_field': 'prawo karne'})
+
+        with patch('builtins.print'):
+            counts = build_snapshots(collection, self.directory, legal_fields=['prawo karne'])
+
+        self.assertEqual(counts, {'prawo karne': 1})
+        self.assertEqual(SnapshotStore(self.directory).get_documents('prawo karne'),
+                         [('D2010000000101.pdf', "Kradzież.", None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
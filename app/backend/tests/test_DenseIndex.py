@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app.backend.BM25Index import BM25Index
+from app.backend.ChunkedContextMatcherService import ChunkedContextMatcherService
+from app.backend.DenseIndex import DenseIndex, HashingEncoder, build_dense_index, dense_paths
+
+
+class TestHashingEncoder(unittest.TestCase):
+    def test_vectors_are_normalised_and_deterministic(self):
+        encoder = HashingEncoder(dimensions=64)
+        vector = encoder.encode("Testament może być sporządzony odręcznie.")
+        self.assertEqual(vector.dtype, np.float32)
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+        np.testing.assert_array_equal(vector, encoder.encode("Testament może być sporządzony odręcznie."))
+        self.assertFalse(encoder.encode("").any())
+
+    def test_inflected_forms_are_similar(self):
+        encoder = HashingEncoder()
+        testament = encoder.encode("testamentowe")
+        self.assertGreater(float(testament @ encoder.encode("testamentem")),
+                           float(testament @ encoder.encode("kradzież")))
+
+
+class TestDenseIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'dense_index')
+        self.index = BM25Index()
+        self.index.add_document('D2000000000101.pdf', "Testament może być sporządzony w formie pisemnej.",
+                                'prawo cywilne', year=2000)
+        self.index.add_document('D2010000000101.pdf', "Spadkobierca testamentowy dziedziczy spadek.",
+                                'prawo cywilne', year=2010)
+        self.index.add_document('D2000000000201.pdf', "Kto dokonuje kradzieży podlega karze.", 'prawo karne',
+                                year=2000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_build_and_search(self):
+        self.assertEqual(build_dense_index(self.index, self.path, batch_size=2), 3)
+        dense = DenseIndex.load(self.path)
+
+        self.assertIsInstance(dense.vectors, np.memmap)
+        self.assertEqual(dense.vectors.shape, (3, 256))
+        self.assertFalse(any(os.path.exists(f"{path}.tmp") for path in dense_paths(self.path).values()))
+
+        results = dense.search("testamentem", top_k=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual({self.index.chunks[chunk_id]['legal_field'] for chunk_id, _ in results}, {'prawo cywilne'})
+        self.assertGreaterEqual(results[0][1], results[1][1])
+
+    def test_search_filters(self):
+        build_dense_index(self.index, self.path)
+        dense = DenseIndex.load(self.path)
+
+        results = dense.search("testament", top_k=5, legal_field='prawo cywilne', years=[2005, 2015])
+        self.assertEqual([self.index.chunks[chunk_id]['file_name'] for chunk_id, _ in results],
+                         ['D2010000000101.pdf'])
+        self.assertEqual(dense.search("testament", legal_field='prawo pracy'), [])
+        self.assertEqual(len(dense.search("testament", top_k=10)), 3)
+
+    def test_similarity_skips_unknown_chunks(self):
+        build_dense_index(self.index, self.path)
+        dense = DenseIndex.load(self.path)
+        scores = dense.similarity("kradzież", [2, 99])
+        self.assertEqual(list(scores), [2])
+        self.assertGreater(scores[2], 0)
+
+    def test_rebuild_reuses_known_rows(self):
+        build_dense_index(self.index, self.path)
+        self.index.remove_document('D2000000000201.pdf')
+        self.index.add_document('D2020000000101.pdf', "Umowa najmu lokalu mieszkalnego.", 'prawo cywilne', year=2020)
+
+        with patch.object(HashingEncoder, 'encode_batch', wraps=HashingEncoder().encode_batch) as encode_batch:
+            self.assertEqual(build_dense_index(self.index, self.path), 3)
+        self.assertEqual([len(call.args[0]) for call in encode_batch.call_args_list], [1])
+
+        dense = DenseIndex.load(self.path)
+        np.testing.assert_array_equal(dense.chunk_ids, sorted(self.index.chunks))
+        np.testing.assert_allclose(dense.vectors[2], HashingEncoder().encode("Umowa najmu lokalu mieszkalnego."))
+        np.testing.assert_allclose(dense.vectors[0], HashingEncoder().encode(self.index.chunks[0]['text']))
+
+    def test_bm25_postings_match_the_bm25_index(self):
+        build_dense_index(self.index, self.path)
+        dense = DenseIndex.load(self.path)
+        self.assertIsInstance(dense.posting_weights, np.memmap)
+
+        query = "testament spadek kradzież"
+        scores = dense.scores_of(dense.bm25_scores(query), sorted(self.index.chunks))
+        expected = self.index.score(query)
+        self.assertEqual({chunk_id for chunk_id, value in scores.items() if value > 0}, set(expected))
+        for chunk_id, value in expected.items():
+            self.assertAlmostEqual(scores[chunk_id], value, places=5)
+
+        self.assertEqual([chunk_id for chunk_id, _ in dense.bm25_search(query, top_k=5, legal_field='prawo cywilne')],
+                         [chunk['chunk_id'] for chunk in self.index.search(query, top_k=5, legal_field='prawo cywilne')])
+        self.assertEqual(dense.bm25_search("umowa najmu"), [])
+
+    def test_outdated_index_is_ignored(self):
+        build_dense_index(self.index, self.path)
+        header_path = dense_paths(self.path)['header']
+        with open(header_path, encoding='utf-8') as file:
+            header = json.load(file)
+        del header['bm25']
+        with open(header_path, 'w', encoding='utf-8') as file:
+            json.dump(header, file)
+
+        with patch('builtins.print'):
+            self.assertIsNone(DenseIndex.load_if_exists(self.path))
+
+    def test_missing_index(self):
+        self.assertIsNone(DenseIndex.load_if_exists(self.path))
+
+
+class TestHybridRetrieval(unittest.TestCase):
+    def test_dense_score_finds_inflected_forms(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = os.path.join(tmp_dir, 'index.json.gz')
+            dense_path = os.path.join(tmp_dir, 'dense_index')
+            index = BM25Index()
+            index.add_document('D2000000000101.pdf', "Umowa dzierżawy wymaga formy pisemnej.", 'prawo cywilne')
+            index.add_document('D2000000000102.pdf', "Wynajmujący oddaje lokal na podstawie umowy.",
+                               'prawo cywilne')
+            index.add_document('D2000000000201.pdf', "Umowa o dzieło nie chroni przed karą.", 'prawo karne')
+            index.save(index_path)
+            build_dense_index(index, dense_path)
+
+            bm25_only = ChunkedContextMatcherService(index_path=index_path, dense_index_path=dense_path,
+                                                     dense_weight=0)
+            hybrid = ChunkedContextMatcherService(index_path=index_path, dense_index_path=dense_path,
+                                                  dense_weight=0.5)
+
+            self.assertEqual([chunk['file_name'] for chunk in bm25_only.create_matching_context(
+                'prawo cywilne', "umowa")], ['D2000000000101.pdf'])
+            chunks = hybrid.create_matching_context('prawo cywilne', "umowa")
+
+        # Przy macierzy na dysku serwer nie trzyma list wystąpień terminów w pamięci
+        self.assertEqual(hybrid.index.postings, {})
+        self.assertEqual([chunk['file_name'] for chunk in chunks], ['D2000000000101.pdf', 'D2000000000102.pdf'])
+        self.assertEqual(chunks[1]['bm25_score'], 0.0)
+        self.assertGreater(chunks[1]['dense_score'], 0)
+        self.assertGreater(chunks[0]['score'], chunks[1]['score'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from app.backend.DomainClassifier import DomainClassifier
+
+DOMAINS = ['prawo cywilne', 'prawo karne', 'prawo finansowe']
+
+
+class TestDomainClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = DomainClassifier.from_sources(DOMAINS)
+
+    def test_from_sources_uses_only_known_domains(self):
+        self.assertEqual(sorted(self.classifier.centroids), sorted(DOMAINS))
+
+    def test_classify_keyword_questions(self):
+        self.assertEqual(self.classifier.classify("Jak napisać testament?"), 'prawo cywilne')
+        self.assertEqual(self.classifier.classify("Co grozi za kradzież?"), 'prawo karne')
+
+    def test_classify_returns_none_when_not_confident(self):
+        self.assertIsNone(self.classifier.classify("Co najlepiej zjeść na obiad?"))
+
+    def test_fit_on_corpus_texts(self):
+        classifier = DomainClassifier(['prawo cywilne', 'prawo karne']).fit([
+            ('prawo cywilne', "Najemca płaci czynsz wynajmującemu."),
+            ('prawo karne', "Sprawca rozboju podlega karze."),
+        ])
+        domain, confidence = classifier.predict("Kiedy najemca płaci czynsz?")
+        self.assertEqual(domain, 'prawo cywilne')
+        self.assertGreater(confidence, 0.5)
+
+    def test_stats(self):
+        # Sztuczny zegar: pierwsza klasyfikacja trwa 2 ms, druga 4 ms
+        with patch('app.backend.DomainClassifier.time.perf_counter', side_effect=[0.0, 0.002, 1.0, 1.004]):
+            self.classifier.classify("Jak napisać testament?")
+            self.classifier.classify("Co najlepiej zjeść na obiad?")
+
+        stats = self.classifier.stats()
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertEqual(stats['llm_fallbacks'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertAlmostEqual(stats['avg_latency_ms'], 3.0)
+        self.assertAlmostEqual(stats['max_latency_ms'], 4.0)
+
+    def test_import_does_not_load_the_ingest_tools(self):
+        # Klasyfikator jest ładowany przez każdy worker serwera, a narzędzia importu ciągną scraper i jego zależności
+        code = ("import sys, app.backend.DomainClassifier; "
+                "print(sorted({'app.backend.helpers.load_pdfs', 'app.backend.helpers.scraper', 'bs4'} & sys.modules.keys()))")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
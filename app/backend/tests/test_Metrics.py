@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from app.backend import Metrics
+from app.backend.Metrics import RequestTrace, stage
+
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics(unittest.TestCase):
+    def test_stage_records_histogram_and_request_breakdown(self):
+        before = sample('chatbot_stage_seconds_count', {'stage': 'test_stage'})
+
+        with RequestTrace('/test') as trace:
+            with stage('test_stage'):
+                pass
+            with stage('test_stage'):
+                pass
+
+        self.assertEqual(sample('chatbot_stage_seconds_count', {'stage': 'test_stage'}), before + 2)
+        self.assertIn('test_stage', trace.stages)
+        self.assertGreaterEqual(sample('chatbot_request_seconds_count', {'path': '/test'}), 1)
+
+    def test_stage_outside_request(self):
+        with stage('test_stage_no_request'):
+            pass
+        self.assertEqual(sample('chatbot_stage_seconds_count', {'stage': 'test_stage_no_request'}), 1)
+
+    def test_slow_sampled_request_saves_profile(self):
+        with tempfile.TemporaryDirectory() as profile_dir, \
+                patch.object(Metrics, 'PROFILE_SAMPLE_RATE', 1.0), \
+                patch.object(Metrics, 'SLOW_REQUEST_SECONDS', 1e-9), \
+                patch.object(Metrics, 'PROFILE_DIR', profile_dir), \
+                patch('builtins.print'):
+            with RequestTrace('/ask'):
+                sum(range(1000))
+            self.assertEqual(len([name for name in os.listdir(profile_dir) if name.endswith('.prof')]), 1)
+
+    def test_fast_sampled_request_is_not_saved(self):
+        with tempfile.TemporaryDirectory() as profile_dir, \
+                patch.object(Metrics, 'PROFILE_SAMPLE_RATE', 1.0), \
+                patch.object(Metrics, 'SLOW_REQUEST_SECONDS', 60), \
+                patch.object(Metrics, 'PROFILE_DIR', profile_dir):
+            with RequestTrace('/ask'):
+                pass
+            self.assertEqual(os.listdir(profile_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestMetricsResponse(unittest.TestCase):
+    def test_single_process_uses_default_registry(self):
+        with stage('test_response'):
+            pass
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+            body, _ = Metrics.metrics_response_body()
+        self.assertIn(b'stage="test_response"', body)
+
+    def test_multiprocess_mode_reads_worker_files(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}), \
+                patch('app.backend.Metrics.multiprocess.MultiProcessCollector') as mock_collector:
+            Metrics.metrics_response_body()
+        self.assertEqual(mock_collector.call_args[0][0].__class__.__name__, 'CollectorRegistry')
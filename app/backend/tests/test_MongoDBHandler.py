@@ -1,15 +1,20 @@
+import asyncio
+import io
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
+from app.backend import MongoDBHandler as mongo_handler_module
 from app.backend.MongoDBHandler import MongoDBHandler
 import bson
 
 
 class TestMongoDBHandler(unittest.TestCase):
-    @patch('app.backend.MongoDBHandler.MongoClient')
-    def setUp(self, mock_mongo_client):
+    @patch('app.backend.MongoDBHandler.get_mongo_client')
+    def setUp(self, mock_get_mongo_client):
         # Setup mock
         self.mock_client = MagicMock()
-        mock_mongo_client.return_value = self.mock_client
+        mock_get_mongo_client.return_value = self.mock_client
         self.db_name = 'test_db'
         self.collection_name = 'test_collection'
         self.handler = MongoDBHandler(db_name=self.db_name, collection_name=self.collection_name)
@@ -21,22 +26,69 @@ class TestMongoDBHandler(unittest.TestCase):
         self.mock_collection.find.return_value = mock_docs
 
         result = self.handler.get_all_documents()
-        self.mock_collection.find.assert_called_once()
+        self.mock_collection.find.assert_called_once_with({}, {'file_data': 0, 'text': 0})
         self.assertEqual(result, mock_docs)
 
+    def test_save_pdf_from_database_streams_gridfs_file(self):
+        self.mock_collection.find_one.return_value = {'file_name': 'doc1.pdf', 'file_id': 'abc'}
+        self.handler._fs = MagicMock()
+        self.handler.fs.get.return_value = io.BytesIO(b'%PDF-1.4 gridfs')
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.handler.save_pdf_from_database('doc1.pdf', output_dir)
+            with open(os.path.join(output_dir, 'doc1.pdf'), 'rb') as f:
+                self.assertEqual(f.read(), b'%PDF-1.4 gridfs')
+        self.handler.fs.get.assert_called_once_with('abc')
+
+    def test_get_text_from_binary_pdf_reads_gridfs_file(self):
+        self.mock_collection.find_one.side_effect = [
+            {'file_name': 'doc1.pdf', 'content_hash': 'abc'},
+            {'file_name': 'doc1.pdf', 'file_id': 'abc', 'content_hash': 'abc'},
+        ]
+        self.handler._fs = MagicMock()
+        self.handler.fs.get.return_value = io.BytesIO(b'%PDF-1.4 gridfs')
+
+        with patch('fitz.open') as mock_fitz_open:
+            mock_page = MagicMock()
+            mock_page.get_text.return_value = "GridFS text"
+            mock_fitz_open.return_value.__enter__.return_value.__iter__.return_value = [mock_page]
+
+            result = self.handler.get_text_from_binary_pdf('doc1.pdf')
+            tmp_path = mock_fitz_open.call_args[0][0]
+
+        self.assertEqual(result, "GridFS text")
+        self.assertFalse(os.path.exists(tmp_path))
+        args, kwargs = self.mock_collection.update_one.call_args
+        self.assertEqual(args[1]['$set'], {'text': "GridFS text", 'content_hash': 'abc', 'page_offsets': [0]})
+
+    def test_get_document_pages_records_page_offsets(self):
+        self.mock_collection.find_one.return_value = {'file_name': 'doc1.pdf', 'file_data': bson.Binary(b'%PDF')}
+
+        with patch('fitz.open') as mock_fitz_open:
+            pages = [MagicMock(), MagicMock(), MagicMock()]
+            for page, page_text in zip(pages, ["Art. 1.\n", "Art. 2.\n", "Art. 3.\n"]):
+                page.get_text.return_value = page_text
+            mock_fitz_open.return_value.__enter__.return_value.__iter__.return_value = pages
+
+            text, page_offsets = self.handler.get_document_pages('doc1.pdf')
+
+        self.assertEqual(text, "Art. 1.\nArt. 2.\nArt. 3.\n")
+        self.assertEqual(page_offsets, [0, 8, 16])
+        self.assertEqual(text[page_offsets[1]:page_offsets[2]], "Art. 2.\n")
+
     def test_get_document_by_file_name_found(self):
         mock_doc = {'file_name': 'doc1.pdf'}
         self.mock_collection.find_one.return_value = mock_doc
 
         result = self.handler.get_document_by_file_name('doc1.pdf')
-        self.mock_collection.find_one.assert_called_with({'file_name': 'doc1.pdf'})
+        self.mock_collection.find_one.assert_called_with({'file_name': 'doc1.pdf'}, {'file_data': 0, 'text': 0})
         self.assertEqual(result, mock_doc)
 
     def test_get_document_by_file_name_not_found(self):
         self.mock_collection.find_one.return_value = None
 
         result = self.handler.get_document_by_file_name('nonexistent.pdf')
-        self.mock_collection.find_one.assert_called_with({'file_name': 'nonexistent.pdf'})
+        self.mock_collection.find_one.assert_called_with({'file_name': 'nonexistent.pdf'}, {'file_data': 0, 'text': 0})
         self.assertIsNone(result)
 
     def test_save_pdf_from_database_success(self):
@@ -46,7 +98,7 @@ class TestMongoDBHandler(unittest.TestCase):
 
         with patch('builtins.open', unittest.mock.mock_open()) as mocked_file:
             self.handler.save_pdf_from_database('doc1.pdf', '/fake/output/dir')
-            self.mock_collection.find_one.assert_called_with({'file_name': 'doc1.pdf'})
+            self.mock_collection.find_one.assert_called_with({'file_name': 'doc1.pdf'}, {'file_id': 1, 'file_data': 1})
             mocked_file.assert_called_with('/fake/output/dir/doc1.pdf', 'wb')
             mocked_file().write.assert_called_with(bson.Binary(binary_content))
 
@@ -55,7 +107,7 @@ class TestMongoDBHandler(unittest.TestCase):
 
         with patch('builtins.print') as mocked_print:
             self.handler.save_pdf_from_database('nonexistent.pdf', '/fake/output/dir')
-            self.mock_collection.find_one.assert_called_with({'file_name': 'nonexistent.pdf'})
+            self.mock_collection.find_one.assert_called_with({'file_name': 'nonexistent.pdf'}, {'file_id': 1, 'file_data': 1})
             mocked_print.assert_called_with("Document not found or does not contain file data.")
 
     def test_delete_document_success(self):
@@ -92,28 +144,150 @@ class TestMongoDBHandler(unittest.TestCase):
             mock_fitz_open.return_value.__enter__.return_value = mock_doc_obj
 
             result = self.handler.get_text_from_binary_pdf('doc1.pdf')
-            self.mock_collection.find_one.assert_called_with({'file_name': 'doc1.pdf'}, {'file_data': 1})
+            self.mock_collection.find_one.assert_called_with(
+                {'file_name': 'doc1.pdf'}, {'file_id': 1, 'file_data': 1, 'content_hash': 1})
             mock_fitz_open.assert_called_with(stream=bson.Binary(binary_content), filetype="pdf")  # Corrected
 
             self.assertEqual(result, "Sample text")
+            self.mock_collection.update_one.assert_called_once()
+            args, kwargs = self.mock_collection.update_one.call_args
+            self.assertEqual(args[1]['$set']['text'], "Sample text")
+            self.assertIn('content_hash', args[1]['$set'])
+
+    def test_get_text_from_binary_pdf_uses_stored_text(self):
+        self.mock_collection.find_one.return_value = {'file_name': 'doc1.pdf', 'text': "Stored text"}
+
+        with patch('fitz.open') as mock_fitz_open:
+            result = self.handler.get_text_from_binary_pdf('doc1.pdf')
+            mock_fitz_open.assert_not_called()
+
+        self.assertEqual(result, "Stored text")
+        self.mock_collection.find_one.assert_called_once_with(
+            {'file_name': 'doc1.pdf'}, {'text': 1, 'page_offsets': 1, 'content_hash': 1})
+
+    def test_get_text_from_binary_pdf_cache_hit(self):
+        self.mock_collection.find_one.return_value = {'file_name': 'doc1.pdf', 'text': "Stored text"}
+
+        self.handler.get_text_from_binary_pdf('doc1.pdf')
+        result = self.handler.get_text_from_binary_pdf('doc1.pdf')
+
+        self.assertEqual(result, "Stored text")
+        self.mock_collection.find_one.assert_called_once()
+
+        self.handler.invalidate_text_cache('doc1.pdf')
+        self.handler.get_text_from_binary_pdf('doc1.pdf')
+        self.assertEqual(self.mock_collection.find_one.call_count, 2)
 
     def test_get_text_from_binary_pdf_document_not_found(self):
         self.mock_collection.find_one.return_value = None
 
         with patch('builtins.print') as mocked_print:
             result = self.handler.get_text_from_binary_pdf('nonexistent.pdf')
-            self.mock_collection.find_one.assert_called_with({'file_name': 'nonexistent.pdf'}, {'file_data': 1})
+            self.mock_collection.find_one.assert_called_with(
+                {'file_name': 'nonexistent.pdf'}, {'text': 1, 'page_offsets': 1, 'content_hash': 1})
             mocked_print.assert_called_with("Dokument nie został znaleziony lub nie zawiera danych pliku.")
             self.assertIsNone(result)
 
+    def test_get_document_pages_async_parses_once(self):
+        binary_content = b'%PDF-1.4...'
+        self.mock_collection.find_one.side_effect = [
+            {'file_name': 'doc1.pdf'},
+            {'file_name': 'doc1.pdf', 'file_data': bson.Binary(binary_content)},
+        ]
+
+        with patch('app.backend.MongoDBHandler.get_parse_pool', return_value=None), \
+                patch('app.backend.MongoDBHandler.extract_pages_from_bytes',
+                      return_value=("Sample text", [0])) as mock_extract:
+            first = asyncio.run(self.handler.get_document_pages_async('doc1.pdf'))
+            second = asyncio.run(self.handler.get_document_pages_async('doc1.pdf'))
+
+        self.assertEqual(first, ("Sample text", [0]))
+        self.assertEqual(second, ("Sample text", [0]))
+        mock_extract.assert_called_once_with(binary_content)
+        self.assertEqual(self.mock_collection.find_one.call_count, 2)
+        self.mock_collection.update_one.assert_called_once()
+
+    def test_get_document_pages_async_reads_gridfs_file(self):
+        self.mock_collection.find_one.side_effect = [
+            {'file_name': 'doc1.pdf', 'content_hash': 'abc'},
+            {'file_name': 'doc1.pdf', 'file_id': 'abc', 'content_hash': 'abc'},
+            None,
+        ]
+        self.handler._fs = MagicMock()
+        self.handler.fs.get.return_value = io.BytesIO(b'%PDF-1.4 gridfs')
+
+        with patch('app.backend.MongoDBHandler.get_parse_pool', return_value=None), \
+                patch('app.backend.MongoDBHandler.extract_pages_from_source',
+                      return_value=("GridFS text", [0])) as mock_extract, \
+                patch('builtins.print'):
+            pages = asyncio.run(self.handler.get_document_pages_async('doc1.pdf'))
+            missing = asyncio.run(self.handler.get_document_pages_async('missing.pdf'))
+
+        self.assertEqual(pages, ("GridFS text", [0]))
+        self.assertFalse(os.path.exists(mock_extract.call_args[0][0]))
+        args, kwargs = self.mock_collection.update_one.call_args
+        self.assertEqual(args[1]['$set'], {'text': "GridFS text", 'content_hash': 'abc', 'page_offsets': [0]})
+        self.assertEqual(missing, (None, None))
+        self.assertIsNone(self.handler.text_cache.get('missing.pdf'))
+
     def test_get_files_by_legal_field(self):
         mock_docs = [{'file_name': 'doc1.pdf'}, {'file_name': 'doc2.pdf'}]
         self.mock_collection.find.return_value = mock_docs
 
         result = self.handler.get_files_by_legal_field('Some Legal Field')
-        self.mock_collection.find.assert_called_with({'legal_field': 'Some Legal Field'}, {'file_name': 1})
+        self.mock_collection.find.assert_called_with(
+            {'legal_field': 'Some Legal Field', 'superseded_by': None}, {'file_name': 1})
         self.assertEqual(result, ['doc1.pdf', 'doc2.pdf'])
 
+        self.handler.get_files_by_legal_field('Some Legal Field', include_superseded=True)
+        self.mock_collection.find.assert_called_with({'legal_field': 'Some Legal Field'}, {'file_name': 1})
+
+    def test_get_files_by_legal_field_with_years(self):
+        self.mock_collection.find.return_value = [{'file_name': 'doc1.pdf'}]
+
+        result = self.handler.get_files_by_legal_field('Some Legal Field', [2001, 1990, 1995])
+        self.mock_collection.find.assert_called_with(
+            {'legal_field': 'Some Legal Field', 'year': {'$gte': 1990, '$lte': 2001}, 'superseded_by': None},
+            {'file_name': 1})
+        self.assertEqual(result, ['doc1.pdf'])
+
+    def test_ensure_indexes(self):
+        self.handler.ensure_indexes()
+        self.mock_collection.create_index.assert_any_call('file_name')
+        self.mock_collection.create_index.assert_any_call([('legal_field', 1), ('year', 1)])
+
+
+class TestMongoClientFactory(unittest.TestCase):
+    def setUp(self):
+        self.previous_client = mongo_handler_module._mongo_client
+        mongo_handler_module._mongo_client = None
+
+    def tearDown(self):
+        mongo_handler_module._mongo_client = self.previous_client
+
+    @patch('app.backend.MongoDBHandler.MongoClient')
+    def test_client_is_shared(self, mock_mongo_client):
+        first = MongoDBHandler(db_name='a')
+        second = MongoDBHandler(db_name='b')
+
+        mock_mongo_client.assert_called_once()
+        self.assertIs(first.client, second.client)
+        kwargs = mock_mongo_client.call_args.kwargs
+        self.assertEqual(kwargs['maxPoolSize'], mongo_handler_module.MONGO_MAX_POOL_SIZE)
+        self.assertIn(mongo_handler_module.pool_stats, kwargs['event_listeners'])
+
+    def test_pool_stats_listener(self):
+        listener = mongo_handler_module.PoolStatsListener()
+        listener.connection_created(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_in(None)
+
+        stats = listener.stats()
+        self.assertEqual(stats['open_connections'], 1)
+        self.assertEqual(stats['checked_out'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+
 
 if __name__ == '__main__':
     unittest.main()
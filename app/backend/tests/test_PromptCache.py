@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+from app.backend.LLMClient import StubLLMClient
+from app.backend.PromptCache import PromptPrefixCache
+
+
+class TestPromptPrefixCache(unittest.TestCase):
+    def setUp(self):
+        self.llm_client = StubLLMClient()
+        self.cache = PromptPrefixCache(self.llm_client, ttl=3600, idle_seconds=60, min_tokens=0)
+        self.builds = []
+
+    async def build_prefix(self):
+        self.builds.append(1)
+        await asyncio.sleep(0.01)
+        return "Documents: ustawa.\n\n", ['a.pdf']
+
+    def test_prefix_is_created_once_and_reused(self):
+        async def scenario():
+            first, second = await asyncio.gather(
+                self.cache.get('prawo cywilne', [2000, 2010], 1, self.build_prefix),
+                self.cache.get('prawo cywilne', [2010, 2000], 1, self.build_prefix))
+            third = await self.cache.get('prawo cywilne', [2000, 2010], 1, self.build_prefix)
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+        self.assertIs(first, second)
+        self.assertIs(first, third)
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(self.llm_client.prefixes, {first['handle']: "Documents: ustawa.\n\n"})
+        self.assertEqual(first['sources'], ['a.pdf'])
+
+    def test_corpus_version_change_replaces_prefix(self):
+        first = asyncio.run(self.cache.get('prawo cywilne', None, 1, self.build_prefix))
+        second = asyncio.run(self.cache.get('prawo cywilne', None, 2, self.build_prefix))
+
+        self.assertNotEqual(first['handle'], second['handle'])
+        self.assertEqual(list(self.llm_client.prefixes), [second['handle']])
+
+    def test_idle_prefixes_are_evicted(self):
+        entry = asyncio.run(self.cache.get('prawo cywilne', None, 1, self.build_prefix))
+        asyncio.run(self.cache.evict_idle())
+        self.assertEqual(len(self.llm_client.prefixes), 1)
+
+        entry['last_used'] -= 61
+        asyncio.run(self.cache.evict_idle())
+
+        self.assertEqual(self.llm_client.prefixes, {})
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_short_prefix_is_kept_locally(self):
+        cache = PromptPrefixCache(self.llm_client, min_tokens=1000)
+        entry = asyncio.run(cache.get('prawo cywilne', None, 1, self.build_prefix))
+
+        self.assertIsNone(entry['handle'])
+        self.assertEqual(entry['prefix'], "Documents: ustawa.\n\n")
+        self.assertEqual(self.llm_client.prefixes_created, 0)
+
+
+    def test_domain_without_prefix_is_remembered(self):
+        async def too_large():
+            self.builds.append(1)
+            return None, None
+
+        first = asyncio.run(self.cache.get('prawo cywilne', None, 1, too_large))
+        second = asyncio.run(self.cache.get('prawo cywilne', None, 1, too_large))
+
+        self.assertIs(first, second)
+        self.assertEqual((first['handle'], first['prefix']), (None, None))
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(self.llm_client.prefixes_created, 0)
+
+    def test_domain_without_prefix_outlives_ttl_and_idle_time(self):
+        cache = PromptPrefixCache(self.llm_client, ttl=0, idle_seconds=0, min_tokens=0)
+
+        async def too_large():
+            self.builds.append(1)
+            return None, None
+
+        async def scenario():
+            first = await cache.get('prawo cywilne', None, 1, too_large)
+            await asyncio.sleep(0.01)
+            second = await cache.get('prawo cywilne', None, 1, too_large)
+            third = await cache.get('prawo cywilne', None, 2, too_large)
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+        # Tylko zmiana wersji korpusu powoduje ponowne wczytanie dokumentów dziedziny
+        self.assertEqual(len(self.builds), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+
+from app.backend.RequestBatching import MicroBatcher, RequestCoalescer
+
+
+class TestRequestCoalescer(unittest.TestCase):
+    def test_concurrent_calls_share_one_run(self):
+        coalescer = RequestCoalescer()
+        runs = []
+
+        async def answer(question):
+            runs.append(question)
+            await asyncio.sleep(0.01)
+            return f"odpowiedź: {question}"
+
+        async def scenario():
+            return await asyncio.gather(coalescer.run('a', answer, 'a'), coalescer.run('a', answer, 'a'),
+                                        coalescer.run('b', answer, 'b'))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(results, ["odpowiedź: a", "odpowiedź: a", "odpowiedź: b"])
+        self.assertEqual(runs, ['a', 'b'])
+        self.assertEqual(coalescer.stats(), {'calls': 3, 'coalesced': 1, 'in_flight': 0})
+
+    def test_errors_reach_every_caller(self):
+        coalescer = RequestCoalescer()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("quota")
+
+        async def scenario():
+            return await asyncio.gather(coalescer.run('a', fail), coalescer.run('a', fail), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    def test_cancelled_caller_does_not_cancel_shared_run(self):
+        coalescer = RequestCoalescer()
+
+        async def answer():
+            await asyncio.sleep(0.02)
+            return "odpowiedź"
+
+        async def scenario():
+            first = asyncio.create_task(coalescer.run('a', answer))
+            second = asyncio.create_task(coalescer.run('a', answer))
+            await asyncio.sleep(0.005)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), "odpowiedź")
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_items_within_window_are_batched(self):
+        calls = []
+
+        async def classify(items):
+            calls.append(list(items))
+            return [item.upper() for item in items]
+
+        async def scenario():
+            batcher = MicroBatcher(classify, window=0.01, max_batch_size=10)
+            results = await asyncio.gather(*(batcher.submit(item) for item in ['a', 'b', 'c']))
+            return results, batcher.stats()
+
+        results, stats = asyncio.run(scenario())
+        self.assertEqual(results, ['A', 'B', 'C'])
+        self.assertEqual(calls, [['a', 'b', 'c']])
+        self.assertEqual(stats['avg_batch_size'], 3)
+
+    def test_max_batch_size_splits_batches(self):
+        calls = []
+
+        async def classify(items):
+            calls.append(list(items))
+            return items
+
+        async def scenario():
+            batcher = MicroBatcher(classify, window=0.01, max_batch_size=2)
+            return await asyncio.gather(*(batcher.submit(item) for item in range(5)))
+
+        self.assertEqual(asyncio.run(scenario()), [0, 1, 2, 3, 4])
+        self.assertEqual([len(call) for call in calls], [2, 2, 1])
+
+    def test_exception_results_fail_only_their_item(self):
+        async def classify(items):
+            return [ValueError(item) if item == 'zły' else item for item in items]
+
+        async def scenario():
+            batcher = MicroBatcher(classify, window=0.001)
+            return await asyncio.gather(batcher.submit('dobry'), batcher.submit('zły'), return_exceptions=True)
+
+        good, bad = asyncio.run(scenario())
+        self.assertEqual(good, 'dobry')
+        self.assertIsInstance(bad, ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
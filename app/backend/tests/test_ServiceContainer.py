@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app.backend.LLMClient import StubLLMClient, create_llm_client
+from app.backend.ServiceContainer import ServiceContainer
+
+
+class TestServiceContainer(unittest.TestCase):
+    def test_model_is_built_once_on_first_use(self):
+        factory = MagicMock()
+        container = ServiceContainer(factory=factory)
+        factory.assert_not_called()
+
+        first = container.get_model()
+        second = asyncio.run(container.get_model_async())
+
+        factory.assert_called_once()
+        self.assertIs(first, second)
+
+    def test_warmup_marks_ready(self):
+        model = MagicMock()
+        container = ServiceContainer(factory=lambda: model)
+
+        asyncio.run(container.warmup())
+
+        model.warmup.assert_called_once()
+        self.assertTrue(container.status()['warmed_up'])
+
+    def test_warmup_retries_until_dependencies_are_up(self):
+        model = MagicMock()
+        model.warmup.side_effect = [Exception("Mongo unreachable"), None]
+        container = ServiceContainer(factory=lambda: model, retry_seconds=0)
+
+        with patch('builtins.print'):
+            asyncio.run(container.warmup())
+
+        self.assertEqual(model.warmup.call_count, 2)
+        self.assertTrue(container.ready)
+        self.assertIsNone(container.error)
+
+
+class TestCreateLLMClient(unittest.TestCase):
+    def test_stub_backend(self):
+        self.assertIsInstance(create_llm_client('stub'), StubLLMClient)
+
+    def test_custom_backend_by_path(self):
+        self.assertIsInstance(create_llm_client('app.backend.LLMClient:StubLLMClient'), StubLLMClient)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_llm_client('nieznany')
+
+
+if __name__ == '__main__':
+    unittest.main()
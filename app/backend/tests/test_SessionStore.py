@@ -0,0 +1,36 @@
+import unittest
+
+import mongomock
+
+from app.backend.SessionStore import SessionStore, create_session_store, new_session_id
+
+
+class TestSessionStore(unittest.TestCase):
+    def test_memory_store(self):
+        store = create_session_store('memory')
+        session_id = new_session_id()
+
+        self.assertIsNone(store.get_years(session_id))
+        store.set_years(session_id, [2000, 2010])
+        self.assertEqual(store.get_years(session_id), [2000, 2010])
+        self.assertIsNone(store.get_years(None))
+
+    def test_mongo_store_is_shared_between_instances(self):
+        collection = mongomock.MongoClient().db.sessions
+        first, second = SessionStore(collection=collection), SessionStore(collection=collection)
+        first.ensure_indexes()
+
+        first.set_years('abc', [1990, 1995])
+        first.set_years('abc', [2000, 2005])
+
+        self.assertEqual(second.get_years('abc'), [2000, 2005])
+        self.assertEqual(collection.count_documents({}), 1)
+        self.assertIsNone(second.get_years('unknown'))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_session_store('redis')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from app.backend import MongoDBHandler as mongo_handler_module
+from app.backend.benchmarks.bench_ask import load_app, run_load
+from app.backend.benchmarks.common import percentiles
+from app.backend.benchmarks.in_memory import ingest_corpus, use_in_memory_mongo
+from app.backend.benchmarks.synthetic_corpus import generate_corpus
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.previous_client = mongo_handler_module._mongo_client
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        mongo_handler_module._mongo_client = self.previous_client
+        self.tmp_dir.cleanup()
+
+    def test_percentiles(self):
+        summary = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 50)
+        self.assertAlmostEqual(summary['p95_ms'], 95)
+        self.assertAlmostEqual(summary['p99_ms'], 99)
+        self.assertEqual(percentiles([]), {'count': 0})
+
+    def test_synthetic_corpus_is_ingested_and_served(self):
+        generated = generate_corpus(self.tmp_dir.name, documents=3, pages=1, first_year=2000, last_year=2000)
+        self.assertEqual(len(generated), 3)
+        self.assertTrue(all(os.path.basename(path).startswith('D2000') for path, _ in generated))
+
+        use_in_memory_mongo()
+        handler, index, results = ingest_corpus([path for path, _ in generated])
+        self.assertEqual(handler.collection.count_documents({}), 3)
+        self.assertTrue(handler.get_text_from_binary_pdf(results[0]['file_name']).startswith("Ustawa z dnia"))
+
+        app, model = load_app(index, llm_latency=0.0, answer_cache=False)
+        report = asyncio.run(run_load(app, ["Jakie przepisy dotyczą umowy?"], requests=5, concurrency=2))
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['latency']['count'], 5)
+
+
+    def test_batched_domain_prompts_are_answered(self):
+        generated = generate_corpus(self.tmp_dir.name, documents=3, pages=1, first_year=2000, last_year=2000)
+        use_in_memory_mongo()
+        _, index, _ = ingest_corpus([path for path, _ in generated])
+
+        app, model = load_app(index, llm_latency=0.0, answer_cache=False)
+        # Pytania bez słów kluczowych trafiają do modelu, a wysłane razem są łączone w jeden prompt
+        questions = [f"Co mam zrobić w sprawie numer {number}?" for number in range(8)]
+        for question in questions:
+            self.assertIsNone(model.domain_classifier.classify(question))
+        report = asyncio.run(run_load(app, questions, requests=16, concurrency=8))
+
+        self.assertEqual(report['errors'], 0)
+        batches = model.domain_batcher.stats()
+        self.assertGreater(batches['items'], batches['batches'])
+
+if __name__ == '__main__':
+    unittest.main()
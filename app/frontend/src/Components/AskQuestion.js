@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import axios from 'axios';
+import { API_URL } from '../api';
 import './css/AskQuestion.css';
 
 function AskQuestion() {
@@ -18,7 +19,7 @@ function AskQuestion() {
     setError('');
     setAnswer('');
     try {
-      const response = await axios.post('http://127.0.0.1:8000/ask', { question });
+      const response = await axios.post(`${API_URL}/ask`, { question });
       setAnswer(response.data.answer);
     } catch (err) {
       setError(err.response ? err.response.data.detail : 'Wystąpił błąd. Spróbuj ponownie.');
@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import axios from 'axios';
+import { API_URL } from '../api';
 import './css/SetYears.css';
 
 function SetYears() {
@@ -29,7 +30,7 @@ function SetYears() {
         throw new Error('Wprowadź przynajmniej jeden poprawny rok.');
       }
 
-      const response = await axios.post('http://127.0.0.1:8000/set_years', { years: yearsArray });
+      const response = await axios.post(`${API_URL}/set_years`, { years: yearsArray });
       setMessage(response.data.message);
     } catch (err) {
       setError(err.response ? err.response.data.detail : 'Wystąpił błąd. Spróbuj ponownie.');
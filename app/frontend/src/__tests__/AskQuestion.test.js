@@ -1,6 +1,7 @@
 import React from 'react';
 import { render, fireEvent, screen, waitFor } from '@testing-library/react';
 import axios from 'axios';
+import { API_URL } from '../api';
 import AskQuestion from '../Components/AskQuestion';
 
 jest.mock('axios');
@@ -39,7 +40,7 @@ describe('Komponent AskQuestion', () => {
     expect(screen.getByRole('button', { name: 'Wysyłanie...' })).toBeDisabled();
 
     await waitFor(() => {
-      expect(axios.post).toHaveBeenCalledWith('http://127.0.0.1:8000/ask', {
+      expect(axios.post).toHaveBeenCalledWith(`${API_URL}/ask`, {
         question: 'Jakie jest dzisiaj święto?',
       });
     });
@@ -2,6 +2,7 @@
 import React from 'react';
 import { render, fireEvent, screen, waitFor } from '@testing-library/react';
 import axios from 'axios';
+import { API_URL } from '../api';
 import SetYears from '../Components/SetYears';
 
 jest.mock('axios');
@@ -40,7 +41,7 @@ describe('Komponent SetYears', () => {
     expect(screen.getByRole('button', { name: 'Przetwarzanie...' })).toBeDisabled();
 
     await waitFor(() => {
-      expect(axios.post).toHaveBeenCalledWith('http://127.0.0.1:8000/set_years', {
+      expect(axios.post).toHaveBeenCalledWith(`${API_URL}/set_years`, {
         years: [1918, 2024],
       });
     });
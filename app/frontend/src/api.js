@@ -0,0 +1,4 @@
+// API działa na tym samym hoście co frontend (inny port to nadal ta sama witryna), dzięki czemu przeglądarka
+// wysyła ciasteczko sesji z SameSite=Lax; REACT_APP_API_URL pozwala wskazać inny adres
+export const API_URL =
+  process.env.REACT_APP_API_URL || `${window.location.protocol}//${window.location.hostname}:8000`;